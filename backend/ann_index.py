@@ -0,0 +1,281 @@
+import math
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_FLAT = 'flat'
+INDEX_HNSW = 'hnsw'
+INDEX_IVF_FLAT = 'ivf_flat'
+INDEX_IVF_PQ = 'ivf_pq'
+INDEX_TYPES = (INDEX_FLAT, INDEX_HNSW, INDEX_IVF_FLAT, INDEX_IVF_PQ)
+
+# 'auto' picks by vector count using the thresholds below; any of INDEX_TYPES pins a type
+VECTOR_INDEX_TYPE = os.environ.get('VECTOR_INDEX_TYPE', 'auto').lower()
+HNSW_MIN_VECTORS = int(os.environ.get('VECTOR_HNSW_MIN_VECTORS', '20000'))
+IVF_FLAT_MIN_VECTORS = int(os.environ.get('VECTOR_IVF_FLAT_MIN_VECTORS', '200000'))
+IVF_PQ_MIN_VECTORS = int(os.environ.get('VECTOR_IVF_PQ_MIN_VECTORS', '1000000'))
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = int(os.environ.get('VECTOR_HNSW_EF_SEARCH', '128'))
+IVF_NPROBE = int(os.environ.get('VECTOR_IVF_NPROBE', '32'))
+PQ_BITS = 8
+# k-means needs this many training points per centroid (IVF lists, PQ codewords)
+KMEANS_MIN_POINTS_PER_CENTROID = 39
+# Filtered searches score subsets up to this size exactly, from their stored vectors
+FILTER_EXACT_MAX_VECTORS = int(os.environ.get('VECTOR_FILTER_EXACT_MAX_VECTORS', '4096'))
+# Upper bound on training vectors for IVF clustering
+IVF_MAX_TRAINING_VECTORS = 100000
+
+# Element encoding of stored vectors (IVF-PQ always uses its own product codes)
+STORAGE_FLOAT32 = 'float32'
+STORAGE_FLOAT16 = 'float16'
+STORAGE_SQ8 = 'sq8'
+STORAGE_PQ = 'pq'
+VECTOR_STORAGE = os.environ.get('VECTOR_STORAGE', STORAGE_FLOAT32).lower()
+# 8-bit scalar quantization learns per-dimension ranges; until a store has this many
+# vectors it is kept as float16
+SQ8_MIN_TRAINING_VECTORS = 1000
+_SQ_TYPES = {
+    STORAGE_FLOAT16: faiss.ScalarQuantizer.QT_fp16,
+    STORAGE_SQ8: faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Ordered from smallest to largest corpus; growth only ever migrates forward
+_ORDER = {INDEX_FLAT: 0, INDEX_HNSW: 1, INDEX_IVF_FLAT: 2, INDEX_IVF_PQ: 3}
+
+
+def choose_index_type(ntotal: int, configured: str = VECTOR_INDEX_TYPE) -> str:
+    if configured in INDEX_TYPES:
+        return trainable_type(configured, ntotal)
+    if ntotal >= IVF_PQ_MIN_VECTORS:
+        return trainable_type(INDEX_IVF_PQ, ntotal)
+    if ntotal >= IVF_FLAT_MIN_VECTORS:
+        return trainable_type(INDEX_IVF_FLAT, ntotal)
+    if ntotal >= HNSW_MIN_VECTORS:
+        return INDEX_HNSW
+    return INDEX_FLAT
+
+
+def trainable_type(kind: str, ntotal: int) -> str:
+    """
+    kind, or the type used instead while there are too few vectors to train it: IVF-PQ
+    learns 2**PQ_BITS codewords per subquantizer and falls back to IVF-Flat below that
+    many vectors, which falls back to flat below the points one IVF list needs.
+    """
+    if kind == INDEX_IVF_PQ and ntotal < 2 ** PQ_BITS:
+        kind = INDEX_IVF_FLAT
+    if kind == INDEX_IVF_FLAT and ntotal < KMEANS_MIN_POINTS_PER_CENTROID:
+        kind = INDEX_FLAT
+    return kind
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index inside an IndexIDMap2 wrapper (or index itself if it is not wrapped)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _effective_storage(storage: str, ntotal: int) -> str:
+    if storage == STORAGE_SQ8 and ntotal < SQ8_MIN_TRAINING_VECTORS:
+        return STORAGE_FLOAT16
+    return storage if storage in _SQ_TYPES else STORAGE_FLOAT32
+
+
+def storage_type(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVFPQ):
+        return STORAGE_PQ
+    if isinstance(base, faiss.IndexHNSW):
+        base = faiss.downcast_index(base.storage)
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return STORAGE_FLOAT16 if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else STORAGE_SQ8
+    return STORAGE_FLOAT32
+
+
+def index_type(index: faiss.Index) -> str:
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return INDEX_HNSW
+    if isinstance(index, faiss.IndexIVFPQ):
+        return INDEX_IVF_PQ
+    if isinstance(index, faiss.IndexIVF):
+        return INDEX_IVF_FLAT
+    return INDEX_FLAT
+
+
+def needs_migration(index: faiss.Index, ntotal: Optional[int] = None, configured: str = VECTOR_INDEX_TYPE,
+                    storage: str = VECTOR_STORAGE) -> bool:
+    """True if the index should be rebuilt as a different type or encoding for its current size."""
+    ntotal = index.ntotal if ntotal is None else ntotal
+    current = index_type(index)
+    target = choose_index_type(ntotal, configured)
+    if configured in INDEX_TYPES and target != current:
+        return True
+    if configured not in INDEX_TYPES and _ORDER[target] > _ORDER[current]:
+        return True
+    current_storage = storage_type(index)
+    return current_storage != STORAGE_PQ and current_storage != _effective_storage(storage, ntotal)
+
+
+def _nlist(ntotal: int) -> int:
+    """About 4 * sqrt(n) lists, capped so k-means gets its training points per centroid."""
+    return max(1, min(65536, int(4 * math.sqrt(ntotal)), ntotal // KMEANS_MIN_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest of 96/64/48/32/16/8 that divides the dimension (8 bytes minimum per vector)."""
+    for m in (96, 64, 48, 32, 16, 8):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def _flat_index(dimension: int, storage: str) -> faiss.Index:
+    if storage in _SQ_TYPES:
+        return faiss.IndexScalarQuantizer(dimension, _SQ_TYPES[storage], faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexFlatIP(dimension)
+
+
+def empty_index(dimension: int, storage: str = VECTOR_STORAGE) -> faiss.Index:
+    return faiss.IndexIDMap2(_flat_index(dimension, _effective_storage(storage, 0)))
+
+
+def build_index(kind: str, vectors: np.ndarray, dimension: int, ids: Optional[np.ndarray] = None,
+                storage: str = VECTOR_STORAGE) -> faiss.Index:
+    """
+    Create an inner-product index of the given type and vector encoding holding vectors
+    under ids (default 0..n-1), training it first if needed. The result is wrapped in
+    IndexIDMap2 so vector ids stay stable when other vectors are dropped by a rebuild.
+    IVF types with too few vectors to train are built as trainable_type says.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ntotal = vectors.shape[0]
+    storage = _effective_storage(storage, ntotal)
+    kind = trainable_type(kind, ntotal)
+
+    if kind == INDEX_HNSW:
+        if storage in _SQ_TYPES:
+            base = faiss.IndexHNSWSQ(dimension, _SQ_TYPES[storage], HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            base = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        quantizer = faiss.IndexFlatIP(dimension)
+        nlist = _nlist(ntotal)
+        if kind == INDEX_IVF_FLAT and storage in _SQ_TYPES:
+            base = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, _SQ_TYPES[storage],
+                                                 faiss.METRIC_INNER_PRODUCT)
+        elif kind == INDEX_IVF_FLAT:
+            base = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            base = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS,
+                                    faiss.METRIC_INNER_PRODUCT)
+        if ntotal > IVF_MAX_TRAINING_VECTORS:
+            sample = np.random.default_rng(0).choice(ntotal, IVF_MAX_TRAINING_VECTORS, replace=False)
+            base.train(vectors[np.sort(sample)])
+        else:
+            base.train(vectors)
+        base.nprobe = IVF_NPROBE
+    else:
+        base = _flat_index(dimension, storage)
+
+    if not base.is_trained:
+        base.train(vectors)  # scalar quantizer ranges (flat and HNSW)
+
+    index = faiss.IndexIDMap2(base)
+    if ntotal:
+        if ids is None:
+            ids = np.arange(ntotal, dtype=np.int64)
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    return index
+
+
+def vector_ids(index: faiss.Index) -> np.ndarray:
+    """Ids of the stored vectors in storage order."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def reconstruct_all(index: faiss.Index, start: int = 0, end: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(vectors, ids) stored at positions start..end, in storage order (approximate for IVF-PQ)."""
+    base = base_index(index)
+    end = index.ntotal if end is None else end
+    if end <= start:
+        return np.zeros((0, index.d), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return base.reconstruct_n(start, end - start), vector_ids(index)[start:end]
+
+
+def apply_search_parameters(index: faiss.Index, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+    """
+    Set the search breadth for the next search on index (defaults when None); no-op for flat.
+    Set on the index itself because faiss 1.7.4 ignores efSearch passed via SearchParametersHNSW,
+    so callers must hold the index's lock across this call and the search.
+    """
+    base = base_index(index)
+    kind = index_type(base)
+    if kind == INDEX_HNSW:
+        base.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    elif kind in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        base.nprobe = nprobe or IVF_NPROBE
+
+
+def search_subset(index: faiss.Index, query: np.ndarray, k: int, positions: np.ndarray,
+                  ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (scores, ids) of the k best matches of a single query among the vectors stored at
+    positions (ascending; ids holds the id of every stored vector in storage order).
+
+    A small subset is scored exactly from its reconstructed vectors: a walk that may stop
+    at few of an HNSW graph's nodes, or probing a few IVF lists, misses most of it, and a
+    flat index would be scanned in full. Larger subsets are searched in the inner index
+    with an id selector, since faiss 1.7.4 rejects search parameters on IndexIDMap2, with
+    the breadth set by apply_search_parameters.
+    """
+    base = base_index(index)
+    kind = index_type(base)
+    k = min(k, len(positions))
+    if k == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    if len(positions) <= FILTER_EXACT_MAX_VECTORS:
+        if isinstance(base, faiss.IndexIVF):
+            base.make_direct_map()
+        scores = base.reconstruct_batch(positions) @ query[0]
+        best = np.argsort(-scores, kind='stable')[:k]
+        return scores[best], ids[positions[best]]
+
+    selector = faiss.IDSelectorBatch(positions)
+    if kind == INDEX_HNSW:
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=base.hnsw.efSearch)
+    elif kind in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=base.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    scores, found = base.search(query, k, params=params)
+    keep = found[0] >= 0
+    return scores[0][keep], ids[found[0][keep]]
+
+
+def memory_bytes(index: faiss.Index, mapped: bool = False) -> int:
+    """
+    Rough resident size of an index by type and encoding, including the id map. For a
+    memory-mapped IVF index the inverted lists are left out (they live in the page cache).
+    """
+    base = base_index(index)
+    kind = index_type(base)
+    ntotal, dimension = index.ntotal, index.d
+    id_map_bytes = ntotal * 32 if base is not index else 0  # id array plus reverse hash map
+    if kind == INDEX_HNSW:
+        size = ntotal * (faiss.downcast_index(base.storage).code_size + HNSW_M * 2 * 4)
+    elif kind in (INDEX_IVF_FLAT, INDEX_IVF_PQ):
+        size = (0 if mapped else ntotal * (base.code_size + 8)) + base.nlist * dimension * 4
+    else:
+        size = ntotal * base.code_size
+    return size + id_map_bytes + 4096
@@ -6,6 +6,9 @@ from flask import Flask
 from flask_cors import CORS
 
 from backend.controller import register_controllers
+from backend.ingest_queue import get_ingest_queue
+from backend.pin_monitor import get_pin_monitor
+from backend.text_extraction import get_text_extractor
 
 
 def create_app():
@@ -56,4 +59,15 @@ def create_app():
 
     register_controllers(app, logger=logger)
 
+    # Fork the extraction workers while the process is still single-threaded
+    get_text_extractor().start()
+
+    if os.environ.get('PIN_MONITOR_ENABLED', 'true').lower() == 'true':
+        get_pin_monitor().start()
+        logger.info("Started background pin-status monitor")
+
+    if os.environ.get('RAG_INGEST_WORKERS_ENABLED', 'true').lower() == 'true':
+        get_ingest_queue().start()
+        logger.info("Started RAG ingestion workers")
+
     return app
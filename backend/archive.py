@@ -0,0 +1,106 @@
+import os
+import zipfile
+import zlib
+from typing import Tuple
+
+# Client-selectable archive modes for /download-zip
+ARCHIVE_MODE_AUTO = 'auto'        # decide per entry (default)
+ARCHIVE_MODE_STORE = 'store'      # fast mode, no compression at all
+ARCHIVE_MODE_DEFLATE = 'deflate'  # deflate every entry (previous behaviour)
+ARCHIVE_MODES = {ARCHIVE_MODE_AUTO, ARCHIVE_MODE_STORE, ARCHIVE_MODE_DEFLATE}
+
+ZIP_COMPRESSION_LEVEL = int(os.environ.get('ZIP_COMPRESSION_LEVEL', '6'))
+
+# Entries smaller than this are stored; deflate headers eat any gain
+MIN_COMPRESS_SIZE = 512
+# Probe windows sampled from the head, middle and tail of an entry
+PROBE_WINDOW_SIZE = 16 * 1024
+# Deflate only if the probe shrinks by at least this fraction
+MIN_PROBE_SAVINGS = 0.1
+
+# Formats whose payload is already compressed (media, archives, OOXML/ODF containers)
+PRECOMPRESSED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif', 'avif',
+    'mp3', 'aac', 'm4a', 'ogg', 'opus', 'flac',
+    'mp4', 'm4v', 'mov', 'mkv', 'webm', 'avi',
+    'zip', 'gz', 'tgz', 'bz2', 'xz', 'txz', '7z', 'rar', 'zst', 'lz4', 'br',
+    'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'epub', 'jar', 'apk', 'whl',
+}
+
+PRECOMPRESSED_MAGIC = (
+    b'PK\x03\x04',          # zip, docx/xlsx/pptx, jar, epub
+    b'\x1f\x8b',            # gzip
+    b'BZh',                 # bzip2
+    b'\xfd7zXZ\x00',        # xz
+    b'7z\xbc\xaf\x27\x1c',  # 7-zip
+    b'Rar!',                # rar
+    b'\x28\xb5\x2f\xfd',    # zstd
+    b'\xff\xd8\xff',        # jpeg
+    b'\x89PNG',             # png
+    b'GIF8',                # gif
+    b'OggS',                # ogg
+    b'fLaC',                # flac
+    b'ID3',                 # mp3
+)
+
+
+def _has_precompressed_magic(data: bytes) -> bool:
+    if data.startswith(PRECOMPRESSED_MAGIC):
+        return True
+    # RIFF/WEBP and ISO base media (mp4, mov, heic, avif)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return True
+    return data[4:8] == b'ftyp'
+
+
+def _probe_is_compressible(data: bytes) -> bool:
+    """Deflate a few small windows at level 1 and check the savings."""
+    if len(data) <= PROBE_WINDOW_SIZE * 3:
+        sample = data
+    else:
+        middle = len(data) // 2 - PROBE_WINDOW_SIZE // 2
+        sample = (data[:PROBE_WINDOW_SIZE]
+                  + data[middle:middle + PROBE_WINDOW_SIZE]
+                  + data[-PROBE_WINDOW_SIZE:])
+    compressed_size = len(zlib.compress(sample, 1))
+    return compressed_size <= len(sample) * (1 - MIN_PROBE_SAVINGS)
+
+
+def choose_compression(filename: str, data: bytes, mode: str = ARCHIVE_MODE_AUTO) -> Tuple[int, str]:
+    """
+    Decide how a single archive entry should be written.
+
+    Returns:
+        tuple: (zipfile compress type, reason)
+    """
+    if mode == ARCHIVE_MODE_STORE:
+        return zipfile.ZIP_STORED, 'store-mode'
+    if mode == ARCHIVE_MODE_DEFLATE:
+        return zipfile.ZIP_DEFLATED, 'deflate-mode'
+
+    if len(data) < MIN_COMPRESS_SIZE:
+        return zipfile.ZIP_STORED, 'small'
+
+    extension = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+    if extension in PRECOMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_STORED, 'extension'
+
+    if _has_precompressed_magic(data):
+        return zipfile.ZIP_STORED, 'magic'
+
+    if not _probe_is_compressible(data):
+        return zipfile.ZIP_STORED, 'probe'
+
+    return zipfile.ZIP_DEFLATED, 'probe'
+
+
+def write_archive_entry(zip_file: zipfile.ZipFile, arcname: str, data: bytes,
+                        mode: str = ARCHIVE_MODE_AUTO,
+                        level: int = ZIP_COMPRESSION_LEVEL) -> int:
+    """Write one entry using the per-entry compression decision. Returns the compress type used."""
+    compress_type, _ = choose_compression(arcname, data, mode)
+    if compress_type == zipfile.ZIP_DEFLATED:
+        zip_file.writestr(arcname, data, compress_type=compress_type, compresslevel=level)
+    else:
+        zip_file.writestr(arcname, data, compress_type=compress_type)
+    return compress_type
@@ -0,0 +1,196 @@
+import os
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from backend.error import ErrorCode
+from backend.file import File
+from backend.ipfs import add_file_to_cluster
+from backend.node import Node
+
+# Upper bound on concurrent IPFS adds for one batch request
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '8'))
+BATCH_UPLOAD_MAX_FILES = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', '500'))
+
+# Limits for server-side archive expansion, checked against the central directory
+ARCHIVE_SIZE_LIMIT = int(os.environ.get('ARCHIVE_SIZE_LIMIT', str(50 * 1024 * 1024)))
+ARCHIVE_MAX_ENTRIES = int(os.environ.get('ARCHIVE_MAX_ENTRIES', '1000'))
+ARCHIVE_MAX_EXPANDED_SIZE = int(os.environ.get('ARCHIVE_MAX_EXPANDED_SIZE', str(200 * 1024 * 1024)))
+ARCHIVE_SKIPPED_PREFIXES = ('__MACOSX/',)
+ARCHIVE_SKIPPED_NAMES = {'.DS_Store', 'Thumbs.db'}
+
+
+def normalize_relative_path(path: str) -> Optional[str]:
+    """Return 'a/b/file.txt' for a client supplied relative path, or None if it escapes or is empty."""
+    if not path:
+        return None
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    if not parts or any(part in (".", "..") for part in parts):
+        return None
+    return "/".join(parts)
+
+
+class PendingFile:
+    """
+    One file of a multi-file upload, carried from validation through IPFS add to tree
+    insert. content is released once it is no longer needed; size stays.
+    """
+
+    def __init__(self, relative_path: str, content: bytes = b"", status: ErrorCode = ErrorCode.SUCCESS):
+        self.relative_path = relative_path
+        self.filename = relative_path.rsplit("/", 1)[-1]
+        self.folder_path = relative_path.rsplit("/", 1)[0] if "/" in relative_path else ""
+        self.content = content
+        self.size = len(content)
+        self.status = status
+        self.cid: Optional[str] = None
+        self.rag_status: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == ErrorCode.SUCCESS
+
+    def to_result(self) -> Dict:
+        return {
+            'path': self.relative_path,
+            'result': self.status.name,
+            'cid': self.cid,
+            'size': self.size,
+            'rag_status': self.rag_status,
+        }
+
+
+def add_to_cluster_concurrently(pending: Iterable[PendingFile],
+                                max_workers: int = UPLOAD_CONCURRENCY,
+                                keep_content: Optional[Callable[[PendingFile], bool]] = None) -> List[PendingFile]:
+    """
+    Add every still-valid file to the IPFS Cluster with bounded parallelism, filling in cid/status.
+
+    pending may be a generator: items are pulled lazily and at most 2 * max_workers adds
+    are in flight, so producers such as archive readers overlap with the uploads. After
+    its add, a file's content is released unless keep_content(file) says it is still
+    needed (e.g. for RAG ingestion), so a large batch is not held in memory.
+    """
+    max_workers = max(1, max_workers)
+    items = []
+
+    def _add(item: PendingFile):
+        return add_file_to_cluster(BytesIO(item.content), item.filename)
+
+    def _collect(item: PendingFile, future):
+        cid = future.result()
+        if cid is None:
+            item.status = ErrorCode.IPFS_ERROR
+        else:
+            item.cid = cid
+        if not item.ok or keep_content is None or not keep_content(item):
+            item.content = b""
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for item in pending:
+            items.append(item)
+            if not item.ok:
+                continue
+            in_flight.append((item, executor.submit(_add, item)))
+            if len(in_flight) >= max_workers * 2:
+                _collect(*in_flight.popleft())
+        while in_flight:
+            _collect(*in_flight.popleft())
+    return items
+
+
+def check_archive_limits(zip_file: zipfile.ZipFile,
+                         max_entries: int = ARCHIVE_MAX_ENTRIES,
+                         max_expanded_size: int = ARCHIVE_MAX_EXPANDED_SIZE) -> ErrorCode:
+    """
+    Validate entry count and declared expanded size before anything is extracted.
+    zipfile refuses to inflate an entry past its declared size, so this also bounds zip bombs.
+    """
+    entries = [info for info in zip_file.infolist() if not info.is_dir()]
+    if len(entries) > max_entries:
+        return ErrorCode.TOO_MANY_FILES
+    if sum(info.file_size for info in entries) > max_expanded_size:
+        return ErrorCode.EXCEED_MAX_ARCHIVE_SIZE
+    return ErrorCode.SUCCESS
+
+
+def iter_archive_entries(zip_file: zipfile.ZipFile, max_entry_size: int) -> Iterator[PendingFile]:
+    """Read archive members one at a time, yielding a PendingFile per regular file."""
+    for info in zip_file.infolist():
+        if info.is_dir() or info.filename.startswith(ARCHIVE_SKIPPED_PREFIXES):
+            continue
+        if info.filename.rsplit("/", 1)[-1] in ARCHIVE_SKIPPED_NAMES:
+            continue
+
+        relative_path = normalize_relative_path(info.filename)
+        if relative_path is None:
+            yield PendingFile(info.filename, status=ErrorCode.INVALID_PATH)
+            continue
+        if info.flag_bits & 0x1:  # encrypted member
+            yield PendingFile(relative_path, status=ErrorCode.INVALID_ARCHIVE)
+            continue
+        if info.file_size > max_entry_size:
+            yield PendingFile(relative_path, status=ErrorCode.EXCEED_MAX_FILE_SIZE)
+            continue
+
+        try:
+            content = zip_file.read(info)
+        except (zipfile.BadZipFile, zlib.error, NotImplementedError, EOFError):
+            yield PendingFile(relative_path, status=ErrorCode.INVALID_ARCHIVE)
+            continue
+        yield PendingFile(relative_path, content)
+
+
+def iter_uploaded_files(files: Sequence, relative_paths: Sequence[str], max_file_size: int) -> Iterator[PendingFile]:
+    """
+    Read the files of a multipart upload one at a time, yielding a PendingFile per file.
+    relative_paths, if not empty, gives each file's path; otherwise its filename is used.
+    """
+    for index, file in enumerate(files):
+        raw_path = relative_paths[index] if relative_paths else file.filename
+        relative_path = normalize_relative_path(raw_path)
+        if relative_path is None:
+            yield PendingFile(raw_path or '', status=ErrorCode.INVALID_PATH)
+            continue
+
+        if _stream_size(file.stream) > max_file_size:
+            yield PendingFile(relative_path, status=ErrorCode.EXCEED_MAX_FILE_SIZE)
+            continue
+        yield PendingFile(relative_path, file.read())
+
+
+def _stream_size(stream: IO[bytes]) -> int:
+    position = stream.tell()
+    stream.seek(0, 2)
+    size = stream.tell()
+    stream.seek(position)
+    return size - position
+
+
+def insert_into_tree(base_node: Node, pending: List[PendingFile],
+                     pin_status: Optional[str] = None) -> List[PendingFile]:
+    """
+    Add every uploaded file below base_node, creating intermediate folders, with the
+    given initial pin_status. Returns the files that were inserted.
+    """
+    inserted = []
+    for item in pending:
+        if not item.ok or item.cid is None:
+            continue
+
+        folder = base_node.ensure_folder_path(item.folder_path)
+        if folder is None:
+            item.status = ErrorCode.INVALID_PATH
+            continue
+
+        file_obj = File(item.cid, item.size, item.filename, pin_status=pin_status)
+        result = folder.add_child(Node(item.filename, False, file_obj=file_obj))
+        if result != ErrorCode.SUCCESS:
+            item.status = result
+            continue
+        inserted.append(item)
+    return inserted
@@ -0,0 +1,81 @@
+"""
+Compare recall@k and query latency of the ANN index types against the flat baseline.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_ann_index [--vectors 50000] [--dimension 768]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.ann_index import (
+    INDEX_FLAT,
+    INDEX_HNSW,
+    INDEX_IVF_FLAT,
+    INDEX_IVF_PQ,
+    apply_search_parameters,
+    build_index,
+    memory_bytes,
+)
+
+
+def clustered_vectors(rng, count, dimension, clusters=200):
+    """Unit vectors drawn around random centroids, closer to real embeddings than uniform noise."""
+    centroids = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignment = rng.integers(0, clusters, count)
+    vectors = centroids[assignment] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(found, expected):
+    hits = sum(len(set(row) & set(truth)) for row, truth in zip(found, expected))
+    return hits / expected.size
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    for query in queries:  # one query at a time, as /chat does
+        index.search(query[None, :], k)
+    elapsed = time.perf_counter() - start
+    _, found = index.search(queries, k)
+    return elapsed * 1000 / len(queries), found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vectors', type=int, default=50000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vectors = clustered_vectors(rng, args.vectors, args.dimension)
+    queries = clustered_vectors(rng, args.queries, args.dimension)
+    print(f"{args.vectors} vectors, dimension {args.dimension}, {args.queries} queries, k={args.k}")
+
+    flat = build_index(INDEX_FLAT, vectors, args.dimension)
+    baseline_ms, truth = timed_search(flat, queries, args.k)
+
+    print(f"{'index':<10}{'param':>14}{'build s':>10}{'MB':>10}{'ms/query':>10}{'recall':>9}")
+    print(f"{INDEX_FLAT:<10}{'-':>14}{0:>10.2f}{memory_bytes(flat) / 1e6:>10.1f}{baseline_ms:>10.3f}{1.0:>9.3f}")
+
+    sweeps = {
+        INDEX_HNSW: [('efSearch', value, {'ef_search': value}) for value in (16, 128, 256)],
+        INDEX_IVF_FLAT: [('nprobe', value, {'nprobe': value}) for value in (8, 32, 64)],
+        INDEX_IVF_PQ: [('nprobe', value, {'nprobe': value}) for value in (8, 32, 64)],
+    }
+    for kind, settings in sweeps.items():
+        start = time.perf_counter()
+        index = build_index(kind, vectors, args.dimension)
+        build_seconds = time.perf_counter() - start
+        for name, value, kwargs in settings:
+            apply_search_parameters(index, **kwargs)
+            ms, found = timed_search(index, queries, args.k)
+            print(f"{kind:<10}{f'{name}={value}':>14}{build_seconds:>10.2f}{memory_bytes(index) / 1e6:>10.1f}"
+                  f"{ms:>10.3f}{recall_at_k(found, truth):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Compare CPU time and archive size of the /download-zip compression modes on a mixed corpus.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_archive_compression
+"""
+import json
+import os
+import random
+import time
+import zipfile
+import zlib
+from io import BytesIO
+
+from backend.archive import ARCHIVE_MODE_AUTO, ARCHIVE_MODE_DEFLATE, ARCHIVE_MODE_STORE, write_archive_entry
+
+WORDS = ("resilient distributed ledger file share node cluster replica consensus "
+         "upload download folder chunk vector embedding query answer").split()
+
+
+def _text(rng, size):
+    out = []
+    total = 0
+    while total < size:
+        word = rng.choice(WORDS)
+        out.append(word)
+        total += len(word) + 1
+    return " ".join(out).encode()
+
+
+def _docx_like(rng, size):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as inner:
+        inner.writestr('word/document.xml', _text(rng, size * 4))
+    return buffer.getvalue()
+
+
+def _pdf_like(rng, size):
+    stream = zlib.compress(_text(rng, size * 4), 6)
+    return b'%PDF-1.7\n1 0 obj\n<< /Filter /FlateDecode >>\nstream\n' + stream + b'\nendstream\nendobj\n%%EOF\n'
+
+
+def build_corpus(seed=7, files_per_kind=20, size=256 * 1024):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(files_per_kind):
+        corpus.append((f"notes/note_{i}.txt", _text(rng, size)))
+        corpus.append((f"data/record_{i}.json", json.dumps(
+            [{"id": n, "name": rng.choice(WORDS), "value": rng.random()} for n in range(size // 64)]).encode()))
+        corpus.append((f"photos/img_{i}.jpg", b'\xff\xd8\xff\xe0' + os.urandom(size)))
+        corpus.append((f"docs/report_{i}.docx", _docx_like(rng, size)))
+        corpus.append((f"docs/paper_{i}.pdf", _pdf_like(rng, size)))
+        corpus.append((f"bin/blob_{i}", os.urandom(size)))
+    return corpus
+
+
+def run(corpus, mode):
+    buffer = BytesIO()
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for arcname, data in corpus:
+            write_archive_entry(zip_file, arcname, data, mode)
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+    return cpu, wall, len(buffer.getvalue())
+
+
+def main():
+    corpus = build_corpus()
+    raw_size = sum(len(data) for _, data in corpus)
+    print(f"Corpus: {len(corpus)} files, {raw_size / 1e6:.1f} MB")
+    print(f"{'mode':<10}{'cpu s':>10}{'wall s':>10}{'archive MB':>14}{'ratio':>8}")
+    for mode in (ARCHIVE_MODE_DEFLATE, ARCHIVE_MODE_AUTO, ARCHIVE_MODE_STORE):
+        cpu, wall, size = run(corpus, mode)
+        print(f"{mode:<10}{cpu:>10.3f}{wall:>10.3f}{size / 1e6:>14.2f}{size / raw_size:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
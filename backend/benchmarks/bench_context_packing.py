@@ -0,0 +1,85 @@
+"""
+Prompt context for chat answers: estimated tokens of the previous top-3 concatenation and
+of budgeted packing (duplicates dropped, overlap of consecutive chunks merged) over the
+same retrieved chunks, and the answer cache on a repeated query mix with a simulated
+LLM latency.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_context_packing [--queries 300] [--top-k 8]
+"""
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+
+from backend.benchmarks.bench_rag_pipeline import TOPICS, make_document
+from backend.context_packing import pack_context
+from backend.embeddings import HashingEmbeddingProvider, estimate_tokens
+from backend.rag_utils import LLMIntegration, RAGManager
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=40)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--distinct', type=int, default=60, help="distinct questions in the query mix")
+    parser.add_argument('--top-k', type=int, default=8)
+    parser.add_argument('--llm-ms', type=float, default=50.0, help="simulated LLM call latency")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = random.Random(7)
+    manager = RAGManager(vector_db_path=tempfile.mkdtemp(), embedder=HashingEmbeddingProvider(768))
+    texts = []
+    for number in range(args.documents):
+        topic = rng.choice(sorted(TOPICS))
+        text = make_document(rng, topic)
+        texts.append(text)
+        # Every document is also shared as a copy, as identical files of two users would be
+        for owner in ("alice", "bob"):
+            manager.process_file_for_rag(text.encode(), f"{topic}_{number}.txt", owner, f"cid-{number}",
+                                         f"docs/{topic}_{number}.txt")
+
+    questions = [rng.choice(rng.choice(texts).split(". ")) for _ in range(args.distinct)]
+    retrieved = {}
+    for question in questions:
+        alice = manager.search_user_vector_db("alice", question, top_k=args.top_k)
+        bob = manager.search_user_vector_db("bob", question, top_k=args.top_k)
+        merged = sorted([{**r, 'owner': 'alice'} for r in alice] + [{**r, 'owner': 'bob'} for r in bob],
+                        key=lambda r: r['score'], reverse=True)[:args.top_k]
+        retrieved[question] = merged
+
+    print(f"{len(questions)} questions, top_k={args.top_k}; estimated context tokens per prompt:")
+    top3 = [sum(estimate_tokens(r['chunk']['text']) for r in results[:3]) for results in retrieved.values()]
+    everything = [sum(estimate_tokens(r['chunk']['text']) for r in results) for results in retrieved.values()]
+    print(f"  top-3 concatenation:        {statistics.mean(top3):7.1f}  (chunks used: 3)")
+    print(f"  all {args.top_k} chunks concatenated:  {statistics.mean(everything):7.1f}")
+    for budget in (500, 1000, 1500, 3000):
+        packed = [pack_context(results, budget) for results in retrieved.values()]
+        tokens = [sum(estimate_tokens(p['text']) for p in passages) for passages in packed]
+        chunks = [sum(len(p['chunks']) for p in passages) for passages in packed]
+        print(f"  packed, budget {budget:<5}       {statistics.mean(tokens):7.1f}  "
+              f"(chunks covered: {statistics.mean(chunks):.1f})")
+
+    llm = LLMIntegration("simple")
+    simulated = llm._generate_simple_response
+
+    def slow_response(query, context_chunks):
+        time.sleep(args.llm_ms / 1000)
+        return simulated(query, context_chunks)
+
+    llm._generate_simple_response = slow_response
+    mix = [rng.choice(questions) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for question in mix:
+        llm.generate_answer(question, retrieved[question])
+    elapsed = time.perf_counter() - start
+    print(f"\n{args.queries} answers over {len(questions)} distinct questions with a {args.llm_ms:.0f} ms LLM: "
+          f"{elapsed:.2f}s (uncached {args.queries * args.llm_ms / 1000:.2f}s), "
+          f"answer cache {llm.answer_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Federated chat retrieval: search a user's own index and the shared folders of several
+senders, one store at a time and concurrently, and check both return the same results.
+Stores hold random vectors, half of each sender's files in a shared folder.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_federated_search [--senders 8] [--vectors 10000] [--queries 200]
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend import ann_index
+from backend.embeddings import HashingEmbeddingProvider
+from backend.rag_utils import FEDERATED_SEARCH_WORKERS, RAGManager
+from backend.share_manager import ShareManager
+
+
+def fill_store(manager, rng, username, vectors, dimension, files=100):
+    store = manager.get_user_store(username, create=True)
+    embeddings = rng.standard_normal((vectors, dimension)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    chunks = []
+    for i in range(vectors):
+        folder = "shared" if i % files < files // 2 else "private"
+        filename = f"file{i % files}.txt"
+        chunks.append({'text': f"chunk {i}", 'metadata': {'filename': filename, 'path': f"{folder}/{filename}"}})
+    for start in range(0, vectors, 10000):
+        store.append(embeddings[start:start + 10000], chunks[start:start + 10000])
+    kind = ann_index.choose_index_type(vectors)
+    if kind != ann_index.INDEX_FLAT:
+        store.rebuild(kind)
+
+
+def run(manager, share_manager, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(manager.search_accessible_vector_dbs("reader", query, top_k=5, share_manager=share_manager))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--vectors', type=int, default=10000, help="vectors per store")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dimension', type=int, default=768)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = np.random.default_rng(7)
+    manager = RAGManager(vector_db_path=tempfile.mkdtemp(), embedder=HashingEmbeddingProvider(args.dimension))
+    share_manager = ShareManager()
+    fill_store(manager, rng, "reader", args.vectors, args.dimension)
+    for sender in range(args.senders):
+        fill_store(manager, rng, f"sender{sender}", args.vectors, args.dimension)
+        share_manager.receive(f"sender{sender}", "shared", True)
+    kind = ann_index.index_type(manager.get_user_store("reader").index)
+    print(f"1 + {args.senders} stores of {args.vectors} vectors ({kind}), dimension {args.dimension}")
+
+    queries = [f"query {i} about topic {i % 17}" for i in range(args.queries)]
+    for query in queries:
+        manager.embed_query(query)  # time searches, not the embedding
+    timings = {}
+    for label, workers in (("serial", 1), ("concurrent", FEDERATED_SEARCH_WORKERS)):
+        manager._search_executor = ThreadPoolExecutor(max_workers=workers)
+        manager.retrieval_cache.clear()
+        latencies, results = run(manager, share_manager, queries)
+        timings[label] = (latencies, results)
+        print(f"{label:<11} p50 {statistics.median(latencies):7.2f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:7.2f} ms")
+
+    serial, concurrent = timings["serial"][1], timings["concurrent"][1]
+    same = all([(r['owner'], r['chunk']['text']) for r in a] == [(r['owner'], r['chunk']['text']) for r in b]
+               for a, b in zip(serial, concurrent))
+    leaked = sum(1 for results in concurrent for r in results
+                 if r['owner'] != "reader" and not r['chunk']['metadata']['path'].startswith("shared/"))
+    print(f"identical results: {same}, unshared chunks returned: {leaked}")
+    print(f"share filter cache: {manager.share_filter_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
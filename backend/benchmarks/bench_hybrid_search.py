@@ -0,0 +1,96 @@
+"""
+Hybrid chat retrieval: identifier queries (ticket numbers, file names) answered from the
+keyword index against vector-only search, sentence queries with and without keyword
+fusion, and keyword-only fallback when the embedding provider is slow. Documents of a
+topic share one small vocabulary, so keywords tell their topic but hardly the file.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_hybrid_search [--documents 100] [--queries 300]
+"""
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+
+from backend import rag_utils
+from backend.benchmarks.bench_rag_pipeline import TOPICS, make_document
+from backend.embeddings import HashingEmbeddingProvider
+from backend.rag_utils import RAGManager
+
+
+def run(manager, queries):
+    """Latencies (ms, sorted) and top-1 file and topic hit rates of (query, expected filename) pairs"""
+    latencies = []
+    hits = topic_hits = 0
+    for query, filename in queries:
+        manager.retrieval_cache.clear()
+        start = time.perf_counter()
+        results = manager.search_accessible_vector_dbs("alice", query, top_k=5)
+        latencies.append((time.perf_counter() - start) * 1000)
+        top = results[0]['chunk']['metadata']['filename'] if results else ""
+        hits += top == filename
+        topic_hits += top.split("_")[0] == filename.split("_")[0]
+    latencies.sort()
+    return latencies, hits / len(queries), topic_hits / len(queries)
+
+
+def report(label, latencies, hit_rate, topic_hit_rate):
+    print(f"  {label:<24} p50 {statistics.median(latencies):8.2f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:8.2f} ms  "
+          f"top-1 file {hit_rate:.3f}  topic {topic_hit_rate:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--embed-ms', type=float, default=1000.0, help="simulated slow embedding latency")
+    parser.add_argument('--timeout-ms', type=float, default=200.0, help="query embedding timeout")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(7)
+    manager = RAGManager(vector_db_path=tempfile.mkdtemp(), embedder=HashingEmbeddingProvider(768))
+    documents = {}
+    for number in range(args.documents):
+        topic = rng.choice(sorted(TOPICS))
+        filename = f"{topic}_{number}.txt"
+        ticket = f"RS-{rng.randint(1000, 9999)}-{number}"
+        text = make_document(rng, topic, paragraphs=10) + f"\n\nTracked as {ticket}."
+        documents[filename] = (ticket, text)
+        manager.process_file_for_rag(text.encode(), filename, "alice", f"cid-{number}", f"docs/{filename}")
+    print(f"{args.documents} documents, {manager.get_user_stats('alice')['total_chunks']} chunks")
+
+    filenames = sorted(documents)
+    identifier_queries = [(documents[f][0], f) for f in (rng.choice(filenames) for _ in range(args.queries))]
+    sentence_queries = []
+    for filename in (rng.choice(filenames) for _ in range(args.queries)):
+        sentence_queries.append((rng.choice(documents[filename][1].split(". ")), filename))
+    for query, _ in identifier_queries + sentence_queries:
+        manager.embed_query(query)  # time retrieval, not the first embedding of each query
+
+    for label, queries in (("identifier queries", identifier_queries), ("sentence queries", sentence_queries)):
+        print(label)
+        rag_utils.HYBRID_SEARCH = False
+        report("vector only", *run(manager, queries))
+        rag_utils.HYBRID_SEARCH = True
+        report("hybrid", *run(manager, queries))
+
+    embed_query = manager.embed_query
+
+    def slow_embed_query(query):
+        time.sleep(args.embed_ms / 1000)
+        return embed_query(query)
+
+    manager.embed_query = slow_embed_query
+    rag_utils.QUERY_EMBED_TIMEOUT = args.timeout_ms / 1000
+    sample = sentence_queries[:20]
+    print(f"embedding takes {args.embed_ms:.0f} ms, timeout {args.timeout_ms:.0f} ms ({len(sample)} sentence queries)")
+    report("keyword fallback", *run(manager, sample))
+    report("identifier fast path", *run(manager, identifier_queries[:20]))
+
+
+if __name__ == '__main__':
+    main()
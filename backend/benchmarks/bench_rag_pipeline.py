@@ -0,0 +1,82 @@
+"""
+Index generated documents and search them through RAGManager with the offline hashing
+embedding provider: ingestion throughput, search latency and top-1 hit rate, no network.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_rag_pipeline [--users 4] [--documents 50] [--queries 500]
+"""
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+
+from backend.embeddings import HashingEmbeddingProvider
+from backend.rag_utils import RAGManager
+
+TOPICS = {
+    "storage": "replica pin cluster node disk capacity garbage collection block",
+    "security": "password hash session cookie token encryption signature audit",
+    "search": "vector embedding index query cosine neighbour recall ranking",
+    "network": "peer gateway latency bandwidth route packet timeout retry",
+    "finance": "invoice ledger budget payment quarter revenue expense audit",
+    "biology": "cell protein enzyme membrane gene mutation tissue organism",
+}
+FILLER = "the a of and to in for with on by from that this is are was were".split()
+
+
+def make_document(rng, topic, paragraphs=30):
+    vocabulary = TOPICS[topic].split()
+    sentences = []
+    for _ in range(paragraphs * 6):
+        words = [rng.choice(vocabulary) if rng.random() < 0.5 else rng.choice(FILLER) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return "\n\n".join(" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--documents', type=int, default=50, help="documents per user")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--dimension', type=int, default=768)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    rng = random.Random(7)
+    manager = RAGManager(vector_db_path=tempfile.mkdtemp(), embedder=HashingEmbeddingProvider(args.dimension))
+    documents = {}
+    for user in range(args.users):
+        for number in range(args.documents):
+            topic = rng.choice(sorted(TOPICS))
+            documents[(f"user{user}", f"{topic}_{number}.txt")] = (topic, make_document(rng, topic))
+
+    start = time.perf_counter()
+    for (username, filename), (_, text) in documents.items():
+        manager.process_file_for_rag(text.encode(), filename, username, f"cid-{username}-{filename}", f"docs/{filename}")
+    ingest_seconds = time.perf_counter() - start
+    chunks = sum(manager.get_user_stats(f"user{user}")['total_chunks'] for user in range(args.users))
+    print(f"{len(documents)} documents, {chunks} chunks for {args.users} users, dimension {args.dimension}")
+    print(f"ingest: {ingest_seconds:.2f}s, {chunks / ingest_seconds:.0f} chunks/s")
+
+    latencies = []
+    hits = 0
+    keys = sorted(documents)
+    for _ in range(args.queries):
+        username, filename = rng.choice(keys)
+        topic, text = documents[(username, filename)]
+        query = rng.choice(text.split(". "))  # distinct queries, so the retrieval cache does not answer
+        start = time.perf_counter()
+        results = manager.search_user_vector_db(username, query, top_k=5)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if results and results[0]['chunk']['metadata']['filename'].startswith(topic):
+            hits += 1
+    latencies.sort()
+    print(f"search: p50 {statistics.median(latencies):.2f} ms, p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms, "
+          f"top-1 same topic {hits / args.queries:.3f}")
+    print(f"embedding: {manager.get_embedding_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Compare the old in-thread PDF/DOCX extraction with the TextExtractor worker pool.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_text_extraction [--corpus DIR] [--workers 4]
+
+With --corpus, every .pdf and .docx under DIR is used; otherwise a corpus of generated
+documents (short and long PDFs, DOCX reports) is built in memory.
+"""
+import argparse
+import os
+import random
+import time
+from io import BytesIO
+
+import PyPDF2
+from docx import Document
+
+from backend.text_extraction import TextExtractor
+
+WORDS = ("resilient distributed ledger file share node cluster replica consensus "
+         "upload download folder chunk vector embedding query answer").split()
+
+
+def _line(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_pdf(rng, pages, lines_per_page=40) -> bytes:
+    """A minimal multi-page PDF with one Helvetica text stream per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for _ in range(pages):
+        text = b"".join(b"(" + _line(rng).encode() + b") Tj T* " for _ in range(lines_per_page))
+        stream = b"BT /F1 10 Tf 12 TL 40 800 Td " + text + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        page_refs.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(page_refs) + b"] /Count %d >>" % pages
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_docx(rng, paragraphs) -> bytes:
+    document = Document()
+    for _ in range(paragraphs):
+        document.add_paragraph(_line(rng, 40))
+    out = BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def build_corpus(seed=7):
+    rng = random.Random(seed)
+    corpus = [(f"short_{i}.pdf", make_pdf(rng, 3)) for i in range(20)]
+    corpus += [(f"long_{i}.pdf", make_pdf(rng, 300)) for i in range(3)]
+    corpus += [(f"report_{i}.docx", make_docx(rng, 400)) for i in range(10)]
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(('.pdf', '.docx')):
+                with open(os.path.join(root, name), 'rb') as f:
+                    corpus.append((name, f.read()))
+    return corpus
+
+
+def legacy_extract(content, filename):
+    """The previous in-thread extraction, with its += string building."""
+    text = ""
+    if filename.lower().endswith('.pdf'):
+        for page in PyPDF2.PdfReader(BytesIO(content)).pages:
+            text += page.extract_text() + "\n"
+    else:
+        for paragraph in Document(BytesIO(content)).paragraphs:
+            text += paragraph.text + "\n"
+    return text.strip()
+
+
+def run(name, extract, corpus):
+    start = time.perf_counter()
+    characters = sum(len(extract(content, filename)) for filename, content in corpus)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28}{elapsed:>10.2f}{len(corpus) / elapsed:>10.1f}{characters:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help="directory of real PDF/DOCX files")
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus()
+    size_mb = sum(len(content) for _, content in corpus) / 1e6
+    print(f"{len(corpus)} documents, {size_mb:.1f} MB, {os.cpu_count()} CPUs")
+    print(f"{'mode':<28}{'seconds':>10}{'docs/s':>10}{'characters':>14}")
+
+    run("legacy in-thread", legacy_extract, corpus)
+    run("extractor, in-thread", TextExtractor(workers=0).extract, corpus)
+    pooled = TextExtractor(workers=args.workers)
+    pooled.start()
+    run(f"extractor, {args.workers} processes", pooled.extract, corpus)
+    pooled.shutdown()
+
+    limited = TextExtractor(workers=1, cpu_seconds=2)
+    start = time.perf_counter()
+    text = limited.extract(make_pdf(random.Random(0), 2000), "huge.pdf")
+    print(f"\n2000-page PDF, 2 s CPU limit per task: {time.perf_counter() - start:.2f}s, "
+          f"{len(text)} characters, {limited.stats()}")
+    limited.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare chunking throughput of the built-in RecursiveTextSplitter with langchain's
+RecursiveCharacterTextSplitter (if installed) on the same text, checking that both
+produce identical chunks, and time the app and RAG stack imports in fresh interpreters.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_text_splitter [--megabytes 20]
+"""
+import argparse
+import random
+import subprocess
+import sys
+import time
+
+from backend.text_splitter import RecursiveTextSplitter
+
+WORDS = ("resilient distributed ledger file share node cluster replica consensus "
+         "upload download folder chunk vector embedding query answer").split()
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+def build_text(rng, megabytes):
+    """Prose-like text: sentences, lines and paragraphs of varying length, some very long lines."""
+    parts = []
+    size = 0
+    while size < megabytes * 1_000_000:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))) for _ in range(rng.randint(1, 12))]
+        paragraph = ". ".join(sentences) + "."
+        if rng.random() < 0.3:
+            paragraph = paragraph.replace(". ", ".\n", rng.randint(0, 4))
+        parts.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(parts)
+
+
+def time_split(split, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, chunks
+
+
+def import_seconds(statement, repeat=3):
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c",
+                                          f"import time; t = time.perf_counter(); {statement}; "
+                                          f"print(time.perf_counter() - t)"], stderr=subprocess.DEVNULL)
+        elapsed = float(output.decode().split()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megabytes', type=float, default=20)
+    args = parser.parse_args()
+
+    text = build_text(random.Random(7), args.megabytes)
+    megabytes = len(text) / 1e6
+    print(f"{megabytes:.1f} MB of text, chunk_size=800, chunk_overlap=100")
+    print(f"{'splitter':<12}{'seconds':>10}{'MB/s':>10}{'chunks':>10}")
+
+    seconds, native = time_split(RecursiveTextSplitter(800, 100, SEPARATORS).split_text, text)
+    print(f"{'built-in':<12}{seconds:>10.3f}{megabytes / seconds:>10.1f}{len(native):>10}")
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("langchain-text-splitters not installed; skipping comparison")
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100, length_function=len,
+                                                  separators=SEPARATORS)
+        seconds, reference = time_split(splitter.split_text, text)
+        print(f"{'langchain':<12}{seconds:>10.3f}{megabytes / seconds:>10.1f}{len(reference):>10}")
+        print(f"identical chunks: {native == reference}")
+
+    print(f"\nimport backend.app_factory: {import_seconds('import backend.app_factory'):.3f}s")
+    print(f"import backend.rag_utils:   {import_seconds('import backend.rag_utils'):.3f}s")
+
+
+if __name__ == '__main__':
+    main()
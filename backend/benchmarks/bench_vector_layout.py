@@ -0,0 +1,213 @@
+"""
+Per-user vector stores against the shared multi-tenant store at several user counts:
+time to index every user's documents, files and bytes on disk, file descriptors and
+memory of keeping stores loaded, and latency of a user's vector and keyword searches
+with the store loaded (warm) and opened for the query (cold, a cache miss). Each user
+has a few chunks around a vector of their own; a query is one of their chunks plus
+noise, so its top hit tells whether the search stayed within the right user.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_vector_layout [--users 1000 10000 100000] [--chunks 8]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from backend.benchmarks.bench_vector_storage import rss_bytes
+from backend.shared_vector_store import ShardVectorStore, SharedVectorStore, TenantVectorStore
+from backend.vector_store import UserVectorStore
+
+WORDS = ("storage network search upload folder share index vector chunk cache replica "
+         "quota backup archive policy token stream shard tenant latency").split()
+
+
+def user_documents(user: int, chunks: int, dimension: int, rng: np.random.Generator):
+    """Normalized vectors and chunks of one user's document: a random direction plus noise"""
+    center = rng.standard_normal(dimension).astype(np.float32)
+    vectors = center + 0.5 * rng.standard_normal((chunks, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1)[:, None]
+    texts = [" ".join(random.Random(user * 1000 + i).choices(WORDS, k=40)) + f" ticket{user}x{i}"
+             for i in range(chunks)]
+    metadata = [{'username': f"user{user}", 'filename': f"doc{user}.txt", 'cid': f"cid-{user}",
+                 'path': f"docs/doc{user}.txt", 'chunk_index': i} for i in range(chunks)]
+    return vectors, [{'text': text, 'metadata': meta} for text, meta in zip(texts, metadata)]
+
+
+def disk_usage(path: str):
+    files = size = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+def open_fds() -> int:
+    return len(os.listdir('/proc/self/fd'))
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+class PerUserLayout:
+    name = "per-user"
+
+    def __init__(self, root, dimension):
+        self.root = root
+        self.dimension = dimension
+        self.loaded = {}
+
+    def add(self, user, vectors, chunks):
+        UserVectorStore(os.path.join(self.root, f"user{user}"), self.dimension).append(vectors, chunks)
+
+    def finish(self) -> int:
+        return 0
+
+    def open(self, user):
+        return UserVectorStore.open(os.path.join(self.root, f"user{user}"), self.dimension)
+
+    def load(self, user):
+        if user not in self.loaded:
+            self.loaded[user] = self.open(user)
+        return self.loaded[user]
+
+    def close(self, store):
+        store.chunks.close()
+
+
+class SharedLayout:
+    name = "shared"
+
+    def __init__(self, root, dimension, shards):
+        self.layout = SharedVectorStore(root, shards)
+        self.dimension = dimension
+        self.shards = {}
+
+    def _shard(self, user):
+        path = self.layout.shard_path(f"user{user}")
+        if path not in self.shards:
+            self.shards[path] = ShardVectorStore.open(path, self.dimension)
+        return self.shards[path]
+
+    def add(self, user, vectors, chunks):
+        self._shard(user).append(vectors, chunks, f"user{user}")
+
+    def finish(self) -> int:
+        """Rebuild shards that need another encoding, as the app does in the background; returns how many"""
+        rebuilt = 0
+        for shard in self.shards.values():
+            if shard.needs_migration():
+                shard.rebuild()
+                rebuilt += 1
+            shard.chunks.close()
+        self.shards = {}
+        return rebuilt
+
+    def open(self, user):
+        path = self.layout.shard_path(f"user{user}")
+        return TenantVectorStore(ShardVectorStore.open(path, self.dimension), f"user{user}")
+
+    def load(self, user):
+        return TenantVectorStore(self._shard(user), f"user{user}")
+
+    def close(self, store):
+        store.shard.chunks.close()
+
+
+def measure(layout, users, args, rng):
+    vector_rng = np.random.default_rng(7)
+    start = time.perf_counter()
+    queries = []
+    for user in range(users):
+        vectors, chunks = user_documents(user, args.chunks, args.dimension, vector_rng)
+        layout.add(user, vectors, chunks)
+        if len(queries) < args.queries and rng.random() < 2 * args.queries / users:
+            i = rng.randrange(args.chunks)
+            noisy = vectors[i] + 0.05 * vector_rng.standard_normal(args.dimension).astype(np.float32)
+            queries.append((user, i, (noisy / np.linalg.norm(noisy))[None, :]))
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    rebuilt = layout.finish()
+    rebuild = time.perf_counter() - start
+    files, size = disk_usage(args.root)
+    print(f"  {layout.name:<9} index {build:7.1f}s ({users / build:6.0f} users/s)  "
+          f"{files:7d} files {size / 1e6:8.1f} MB on disk"
+          + (f"  (+{rebuild:.1f}s rebuilding {rebuilt} indices)" if rebuilt else ""))
+
+    rss, fds = rss_bytes(), open_fds()
+    warm_users = [user for user, _, _ in queries][:args.loaded]
+    for user in warm_users:
+        layout.load(user)
+    extra_fds = open_fds() - fds
+    extra_mb = (rss_bytes() - rss) / 1e6
+    if layout.name == "per-user":
+        scale = users / max(len(warm_users), 1)
+        print(f"            {len(warm_users)} stores loaded: +{extra_fds} fds, +{extra_mb:.1f} MB RSS "
+              f"(all {users}: ~{extra_fds * scale:.0f} fds, ~{extra_mb * scale:.0f} MB)")
+    else:
+        print(f"            {len(layout.shards)} shards loaded (all {users} users): "
+              f"+{extra_fds} fds, +{extra_mb:.1f} MB RSS")
+
+    for label, cold in (("warm", False), ("cold", True)):
+        vector_ms, keyword_ms, hits = [], [], 0
+        for user, i, query in queries:
+            begin = time.perf_counter()
+            store = layout.open(user) if cold else layout.load(user)
+            results = store.search(query, 5)
+            vector_ms.append((time.perf_counter() - begin) * 1000)
+            hits += bool(results) and results[0][1]['metadata']['username'] == f"user{user}" \
+                and results[0][1]['metadata']['chunk_index'] == i
+            begin = time.perf_counter()
+            store.lexical_search(f"ticket{user}x{i} storage", 5)
+            keyword_ms.append((time.perf_counter() - begin) * 1000)
+            if cold:
+                layout.close(store)
+        vector_p50, vector_p95 = percentiles(vector_ms)
+        keyword_p50, keyword_p95 = percentiles(keyword_ms)
+        print(f"            {label} search p50 {vector_p50:7.2f} ms p95 {vector_p95:7.2f} ms  "
+              f"keyword p50 {keyword_p50:6.2f} ms p95 {keyword_p95:6.2f} ms  top-1 {hits / len(queries):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--chunks', type=int, default=8, help="chunks per user")
+    parser.add_argument('--dimension', type=int, default=128)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--loaded', type=int, default=1000, help="per-user stores kept loaded for warm searches")
+    parser.add_argument('--layouts', nargs='+', default=["per-user", "shared"])
+    parser.add_argument('--dir', default=None, help="where to build the stores (default: a temp dir)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    for users in args.users:
+        print(f"{users} users, {args.chunks} chunks each, dimension {args.dimension}")
+        for name in args.layouts:
+            args.root = tempfile.mkdtemp(dir=args.dir)
+            rng = random.Random(users)
+            if name == "per-user":
+                layout = PerUserLayout(args.root, args.dimension)
+            else:
+                layout = SharedLayout(args.root, args.dimension, args.shards)
+            try:
+                measure(layout, users, args, rng)
+            finally:
+                for store in getattr(layout, 'loaded', {}).values():
+                    store.chunks.close()
+                for shard in getattr(layout, 'shards', {}).values():
+                    shard.chunks.close()
+                shutil.rmtree(args.root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
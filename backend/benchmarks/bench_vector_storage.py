@@ -0,0 +1,96 @@
+"""
+Compare index size and recall@k of float32, float16 and 8-bit scalar-quantized vector
+storage, and the resident memory of loading an IVF snapshot with and without mmap.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_vector_storage [--vectors 100000] [--dimension 768]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from backend.ann_index import (
+    INDEX_FLAT,
+    INDEX_HNSW,
+    INDEX_IVF_FLAT,
+    STORAGE_FLOAT16,
+    STORAGE_FLOAT32,
+    STORAGE_SQ8,
+    build_index,
+    memory_bytes,
+)
+from backend.benchmarks.bench_ann_index import clustered_vectors, recall_at_k, timed_search
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _load_and_search(path, flags, queries, k, result):
+    before = rss_bytes()
+    index = faiss.read_index(path, flags)
+    loaded = rss_bytes()
+    index.search(queries[:1], k)
+    result.put(((loaded - before) / 1e6, (rss_bytes() - before) / 1e6))
+
+
+def measure_load(path, flags, queries, k):
+    """
+    RSS growth of reading the index, and after one search, in a fresh process. Mapped
+    pages are shared page cache: they are counted once touched but are reclaimable.
+    """
+    result = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_load_and_search, args=(path, flags, queries, k, result))
+    process.start()
+    measured = result.get()
+    process.join()
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vectors', type=int, default=100000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    vectors = clustered_vectors(rng, args.vectors, args.dimension)
+    queries = clustered_vectors(rng, args.queries, args.dimension)
+    print(f"{args.vectors} vectors, dimension {args.dimension}, {args.queries} queries, k={args.k}")
+
+    _, truth = timed_search(build_index(INDEX_FLAT, vectors, args.dimension, storage=STORAGE_FLOAT32),
+                            queries, args.k)
+
+    print(f"{'index':<10}{'storage':>10}{'build s':>10}{'MB':>10}{'ms/query':>10}{'recall':>9}")
+    snapshots = {}
+    for kind in (INDEX_FLAT, INDEX_HNSW, INDEX_IVF_FLAT):
+        for storage in (STORAGE_FLOAT32, STORAGE_FLOAT16, STORAGE_SQ8):
+            start = time.perf_counter()
+            index = build_index(kind, vectors, args.dimension, storage=storage)
+            build_seconds = time.perf_counter() - start
+            ms, found = timed_search(index, queries, args.k)
+            print(f"{kind:<10}{storage:>10}{build_seconds:>10.2f}{memory_bytes(index) / 1e6:>10.1f}"
+                  f"{ms:>10.3f}{recall_at_k(found, truth):>9.3f}")
+            if kind == INDEX_IVF_FLAT:
+                snapshots[storage] = index
+
+    print(f"\n{'IVF snapshot':<14}{'mmap':>6}{'RSS load MB':>13}{'RSS +1 query MB':>17}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage, index in snapshots.items():
+            path = os.path.join(tmp, f"{storage}.faiss")
+            faiss.write_index(index, path)
+            for mmap in (False, True):
+                loaded, searched = measure_load(path, faiss.IO_FLAG_MMAP if mmap else 0, queries, args.k)
+                print(f"{storage:<14}{'yes' if mmap else 'no':>6}{loaded:>13.1f}{searched:>17.1f}")
+
+
+if __name__ == '__main__':
+    main()
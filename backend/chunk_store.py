@@ -0,0 +1,368 @@
+import json
+import re
+import sqlite3
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS chunks (
+        vector_id INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        cid TEXT,
+        chunk_index INTEGER,
+        text TEXT NOT NULL,
+        metadata TEXT NOT NULL,
+        path TEXT,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        tenant TEXT
+    )""",
+    "CREATE TABLE IF NOT EXISTS file_stats (filename TEXT PRIMARY KEY, chunk_count INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS store_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    # BM25 index over the chunk text, file name and path (and tenant, to narrow a shard's
+    # matches to one tenant's rows), kept in sync by the triggers below
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+        text, filename, path, tenant, content='chunks', content_rowid='vector_id'
+    )""",
+]
+
+# PRAGMA user_version of a database with the schema above
+SCHEMA_VERSION = 1
+
+# Created with the schema; file_stats only counts live (not deleted) chunks
+INDEXES_AND_TRIGGERS = [
+    "CREATE INDEX IF NOT EXISTS chunks_cid ON chunks(cid)",
+    "CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path)",
+    "CREATE INDEX IF NOT EXISTS chunks_deleted ON chunks(deleted) WHERE deleted = 1",
+    "CREATE INDEX IF NOT EXISTS chunks_tenant ON chunks(tenant, path) WHERE tenant IS NOT NULL",
+    """CREATE TRIGGER IF NOT EXISTS chunks_count_insert AFTER INSERT ON chunks WHEN NEW.deleted = 0 BEGIN
+        INSERT INTO file_stats (filename, chunk_count) VALUES (NEW.filename, 1)
+            ON CONFLICT(filename) DO UPDATE SET chunk_count = chunk_count + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chunks_count_delete AFTER DELETE ON chunks WHEN OLD.deleted = 0 BEGIN
+        UPDATE file_stats SET chunk_count = chunk_count - 1 WHERE filename = OLD.filename;
+        DELETE FROM file_stats WHERE filename = OLD.filename AND chunk_count <= 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chunks_count_tombstone AFTER UPDATE OF deleted ON chunks
+            WHEN NEW.deleted = 1 AND OLD.deleted = 0 BEGIN
+        UPDATE file_stats SET chunk_count = chunk_count - 1 WHERE filename = OLD.filename;
+        DELETE FROM file_stats WHERE filename = OLD.filename AND chunk_count <= 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts (rowid, text, filename, path, tenant)
+            VALUES (NEW.vector_id, NEW.text, NEW.filename, NEW.path, NEW.tenant);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts (chunks_fts, rowid, text, filename, path, tenant)
+            VALUES ('delete', OLD.vector_id, OLD.text, OLD.filename, OLD.path, OLD.tenant);
+    END""",
+]
+
+# bm25() column weights: a term in the file name or path counts more than one in the text
+# (the tenant column only filters)
+BM25_WEIGHTS = (1.0, 4.0, 2.0, 0.0)
+# Words too common to rank by, dropped from keyword queries
+STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i in is it its of on or "
+    "that the their there these this to was what when where which who why will with you your".split()
+)
+STRIP_CHARS = "\"'.,;:!?()[]{}"
+# A "quoted phrase" or a bare term of a keyword query
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+# SQLite caps bound parameters per statement; look rows up in slices of this size
+_MAX_PARAMS = 500
+
+
+def _tenant_filter(tenant: Optional[str], column: str = "tenant") -> Tuple[str, Tuple]:
+    """SQL condition (with its parameters) restricting a query to one tenant's rows, if given."""
+    if tenant is None:
+        return "", ()
+    return f" AND {column} = ?", (tenant,)
+
+
+class _Connection(sqlite3.Connection):
+    """A sqlite3 connection that can be weakly referenced, so its store can find it to close it."""
+
+
+class ChunkMetadataStore:
+    """
+    Chunk text and metadata for one user's vector store, keyed by FAISS vector id.
+
+    Backed by SQLite in WAL mode so several threads and processes can read while one
+    writes; search fetches only the rows it returns and per-file chunk counts are kept
+    up to date by triggers instead of being recomputed from every chunk. Deleted
+    chunks stay as tombstones (deleted = 1) until the index is rebuilt without them.
+    An FTS5 index over the same rows serves BM25 keyword search.
+
+    A shard of the shared store (backend/shared_vector_store.py) holds many users' rows,
+    each tagged with its tenant; the methods taking a tenant then see only its rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Every thread's connection, so close() reaches them all; a thread's is dropped when it exits
+        self._connections: "weakref.WeakSet[_Connection]" = weakref.WeakSet()
+        self._connections_lock = threading.Lock()
+        self._generation = 0
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create the schema, once per database, under an exclusive write lock."""
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                for statement in SCHEMA + INDEXES_AND_TRIGGERS:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.isolation_level = ""
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            # Only ever used by this thread; close() may close it from another
+            conn = sqlite3.connect(self.path, timeout=30, factory=_Connection, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.add(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        return conn
+
+    def add(self, start_id: int, chunks: List[Dict], tenant: Optional[str] = None):
+        """Store chunks as vector ids start_id, start_id + 1, ...; rows at or past start_id are replaced."""
+        rows = []
+        for offset, chunk in enumerate(chunks):
+            metadata = chunk.get('metadata', {})
+            rows.append((
+                start_id + offset,
+                metadata.get('filename', 'unknown'),
+                metadata.get('cid'),
+                metadata.get('chunk_index'),
+                chunk['text'],
+                json.dumps(metadata),
+                metadata.get('path'),
+                tenant,
+            ))
+        with self._connection() as conn:
+            conn.execute("DELETE FROM chunks WHERE vector_id >= ?", (start_id,))
+            conn.executemany(
+                "INSERT INTO chunks (vector_id, filename, cid, chunk_index, text, metadata, path, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if tenant is not None:
+                self._bump(conn, f"tenant:{tenant}")
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, key: str):
+        conn.execute("INSERT INTO store_state (key, value) VALUES (?, 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1", (key,))
+
+    def truncate(self, vector_count: int):
+        """Drop rows without a vector, e.g. left behind by a writer that crashed mid-append."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM chunks WHERE vector_id >= ?", (vector_count,))
+
+    def get(self, vector_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Fetch live chunks by vector id, returned as {vector_id: {'text', 'metadata'}}."""
+        ids = [int(vector_id) for vector_id in vector_ids]
+        chunks = {}
+        conn = self._connection()
+        for offset in range(0, len(ids), _MAX_PARAMS):
+            batch = ids[offset:offset + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            for vector_id, text, metadata in conn.execute(
+                    f"SELECT vector_id, text, metadata FROM chunks WHERE vector_id IN ({placeholders}) AND deleted = 0",
+                    batch):
+                chunks[vector_id] = {'text': text, 'metadata': json.loads(metadata)}
+        return chunks
+
+    def mark_deleted(self, paths: Iterable[str] = (), cids: Iterable[str] = (), tenant: Optional[str] = None) -> int:
+        """Tombstone chunks of the given file paths, and of the given CIDs among chunks stored without a path."""
+        condition, params = _tenant_filter(tenant)
+        with self._connection() as conn:
+            deleted = 0
+            for path in paths:
+                deleted += conn.execute(f"UPDATE chunks SET deleted = 1 WHERE path = ? AND deleted = 0{condition}",
+                                        (path, *params)).rowcount
+            for cid in cids:
+                deleted += conn.execute(
+                    f"UPDATE chunks SET deleted = 1 WHERE cid = ? AND path IS NULL AND deleted = 0{condition}",
+                    (cid, *params)).rowcount
+            if deleted:
+                self._bump(conn, 'deletions')
+                if tenant is not None:
+                    self._bump(conn, f"tenant:{tenant}")
+        return deleted
+
+    def mark_tenant_deleted(self, tenant: str) -> int:
+        """Tombstone all of a tenant's chunks, e.g. when the account is deleted."""
+        with self._connection() as conn:
+            deleted = conn.execute("UPDATE chunks SET deleted = 1 WHERE tenant = ? AND deleted = 0", (tenant,)).rowcount
+            if deleted:
+                self._bump(conn, 'deletions')
+                self._bump(conn, f"tenant:{tenant}")
+        return deleted
+
+    def deleted_ids(self) -> List[int]:
+        return [vector_id for (vector_id,) in self._connection().execute(
+            "SELECT vector_id FROM chunks WHERE deleted = 1")]
+
+    def deleted_count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks WHERE deleted = 1").fetchone()[0]
+
+    def deletion_version(self) -> int:
+        """Counter bumped by every deletion, for cache keys."""
+        row = self._connection().execute("SELECT value FROM store_state WHERE key = 'deletions'").fetchone()
+        return row[0] if row else 0
+
+    def tenant_version(self, tenant: str) -> int:
+        """Counter bumped by every write to a tenant's rows, for cache keys."""
+        row = self._connection().execute(
+            "SELECT value FROM store_state WHERE key = ?", (f"tenant:{tenant}",)).fetchone()
+        return row[0] if row else 0
+
+    def has_tenant(self, tenant: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM chunks WHERE tenant = ? AND deleted = 0 LIMIT 1", (tenant,)).fetchone() is not None
+
+    def live_ids(self, tenant: str) -> List[int]:
+        """Sorted vector ids of a tenant's live chunks."""
+        return [vector_id for (vector_id,) in self._connection().execute(
+            "SELECT vector_id FROM chunks WHERE tenant = ? AND deleted = 0 ORDER BY vector_id", (tenant,))]
+
+    def purge(self, vector_ids: List[int]):
+        """Drop tombstoned rows whose vectors are no longer in the index."""
+        with self._connection() as conn:
+            for offset in range(0, len(vector_ids), _MAX_PARAMS):
+                batch = vector_ids[offset:offset + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                conn.execute(f"DELETE FROM chunks WHERE deleted = 1 AND vector_id IN ({placeholders})", batch)
+
+    def document_chunk_count(self, path: Optional[str], cid: str, tenant: Optional[str] = None) -> int:
+        """Live chunks of a file (by path and CID; by CID alone for chunks stored without a path)."""
+        condition, tenant_params = _tenant_filter(tenant)
+        if path:
+            query, params = "SELECT COUNT(*) FROM chunks WHERE path = ? AND cid = ? AND deleted = 0", (path, cid)
+        else:
+            query, params = "SELECT COUNT(*) FROM chunks WHERE path IS NULL AND cid = ? AND deleted = 0", (cid,)
+        return self._connection().execute(query + condition, params + tenant_params).fetchone()[0]
+
+    def documents(self, tenant: Optional[str] = None) -> List[Tuple[Optional[str], str, str]]:
+        """(path, cid, filename) of every file with live chunks."""
+        condition, params = _tenant_filter(tenant)
+        return self._connection().execute(
+            f"SELECT path, cid, MIN(filename) FROM chunks WHERE deleted = 0{condition} GROUP BY path, cid",
+            params).fetchall()
+
+    def live_ids_under(self, scopes: Iterable[Tuple[str, bool]], tenant: Optional[str] = None) -> List[int]:
+        """Sorted vector ids of live chunks of the given (path, is_folder) files and folders."""
+        condition, params = _tenant_filter(tenant)
+        ids = set()
+        conn = self._connection()
+        for path, is_folder in scopes:
+            if is_folder:
+                # Range on the path index: '0' is the character after '/'
+                rows = conn.execute(
+                    f"SELECT vector_id FROM chunks WHERE path >= ? AND path < ? AND deleted = 0{condition}",
+                    (f"{path}/", f"{path}0", *params))
+            else:
+                rows = conn.execute(f"SELECT vector_id FROM chunks WHERE path = ? AND deleted = 0{condition}",
+                                    (path, *params))
+            ids.update(vector_id for (vector_id,) in rows)
+        return sorted(ids)
+
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """
+        FTS5 query matching any "quoted phrase" of query, or any other whitespace-separated
+        term, each as a quoted phrase (so 'report_2023.pdf' matches the tokens report, 2023,
+        pdf in a row). Stop words among the bare terms are left out unless the query has
+        nothing else.
+        """
+        phrases, words = [], []
+        for phrase, word in _QUERY_PART.findall(query):
+            if phrase and re.search(r"\w", phrase):
+                phrases.append(" ".join(phrase.split()))
+            elif word and re.search(r"\w", word):
+                words.append(word)
+        content = [term for term in words if term.strip(STRIP_CHARS).lower() not in STOP_WORDS]
+        terms = []
+        for term in phrases + (content or ([] if phrases else words)):
+            quoted = '"' + term.replace('"', '""') + '"'
+            if quoted not in terms:
+                terms.append(quoted)
+        return " OR ".join(terms)
+
+    def lexical_search(self, query: str, limit: int, scopes: Optional[Iterable[Tuple[str, bool]]] = None,
+                       tenant: Optional[str] = None) -> List[Tuple[float, int]]:
+        """
+        BM25 ranking of live chunks for the terms of query, best first, as [(score, vector_id)]
+        with higher scores better; scopes restricts it to (path, is_folder) files and folders.
+        """
+        match = self._fts_query(query)
+        if not match or limit <= 0:
+            return []
+        if tenant is not None:
+            # Intersect with the tenant's postings first, rather than ranking every tenant's matches
+            quoted = tenant.replace('"', '""')
+            match = f'tenant : "{quoted}" AND ({match})'
+        conditions, tenant_params = _tenant_filter(tenant, "c.tenant")
+        params = [match, *tenant_params]
+        if scopes is not None:
+            clauses = []
+            for path, is_folder in scopes:
+                if is_folder:
+                    clauses.append("(c.path >= ? AND c.path < ?)")
+                    params.extend((f"{path}/", f"{path}0"))
+                else:
+                    clauses.append("c.path = ?")
+                    params.append(path)
+            if not clauses:
+                return []
+            conditions += f" AND ({' OR '.join(clauses)})"
+        params.append(limit)
+        weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+        rows = self._connection().execute(
+            f"SELECT chunks_fts.rowid, bm25(chunks_fts, {weights}) AS rank FROM chunks_fts "
+            f"JOIN chunks c ON c.vector_id = chunks_fts.rowid "
+            f"WHERE chunks_fts MATCH ? AND c.deleted = 0{conditions} ORDER BY rank LIMIT ?",
+            params)
+        # bm25() is lower for better matches
+        return [(-rank, vector_id) for vector_id, rank in rows]
+
+    def count(self, tenant: Optional[str] = None) -> int:
+        if tenant is not None:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM chunks WHERE tenant = ? AND deleted = 0", (tenant,)).fetchone()[0]
+        return self._connection().execute("SELECT COALESCE(SUM(chunk_count), 0) FROM file_stats").fetchone()[0]
+
+    def file_counts(self, tenant: Optional[str] = None) -> Dict[str, int]:
+        if tenant is not None:
+            # file_stats counts across a shard's tenants
+            return dict(self._connection().execute(
+                "SELECT filename, COUNT(*) FROM chunks WHERE tenant = ? AND deleted = 0 GROUP BY filename", (tenant,)))
+        return dict(self._connection().execute("SELECT filename, chunk_count FROM file_stats"))
+
+    def close(self):
+        """Close the connections of every thread; a thread using the store again reconnects."""
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+            self._generation += 1
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
@@ -0,0 +1,79 @@
+from typing import Dict, Hashable, List, Tuple
+
+from backend.embeddings import estimate_tokens
+
+# Shorter matches between the end of a chunk and the start of the next are taken as chance
+MIN_OVERLAP_CHARS = 8
+
+
+def chunk_key(result: Dict) -> Tuple[Hashable, ...]:
+    """Identity of a retrieved chunk across stores: its owner, document (by CID) and position."""
+    metadata = result['chunk']['metadata']
+    owner = result.get('owner', metadata.get('username'))
+    return owner, metadata.get('cid') or metadata.get('filename'), metadata.get('chunk_index')
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """Join consecutive chunks of a document, dropping the start of second that repeats the end of first."""
+    for size in range(min(len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def pack_context(results: List[Dict], token_budget: int) -> List[Dict]:
+    """
+    Passages for an LLM prompt from retrieved chunks (as returned by search, best first).
+
+    Chunks with the same text (one document indexed by several users) are kept once;
+    consecutive chunks of a document become one passage without the text their chunks
+    share. Passages are taken best first while their estimated tokens fit token_budget;
+    the best one is cut to the budget if it does not fit on its own.
+
+    Returns:
+        [{'filename', 'text', 'score', 'chunks': [chunk_key, ...]}], best first
+    """
+    documents: Dict[Tuple[Hashable, ...], List[Dict]] = {}
+    seen_texts = set()
+    for result in results:
+        text = " ".join(result['chunk']['text'].split())
+        if text in seen_texts:
+            continue
+        seen_texts.add(text)
+        key = chunk_key(result)
+        documents.setdefault(key[:2], []).append(result)
+
+    passages = []
+    for chunks in documents.values():
+        chunks.sort(key=lambda result: result['chunk']['metadata'].get('chunk_index') or 0)
+        run: List[Dict] = []
+        for result in chunks + [None]:
+            index = result['chunk']['metadata'].get('chunk_index') if result is not None else None
+            previous = run[-1]['chunk']['metadata'].get('chunk_index') if run else None
+            if run and (index is None or previous is None or index != previous + 1):
+                text = run[0]['chunk']['text']
+                for follower in run[1:]:
+                    text = merge_overlapping(text, follower['chunk']['text'])
+                passages.append({
+                    'filename': run[0]['chunk']['metadata'].get('filename', 'unknown'),
+                    'text': text,
+                    'score': max(r['score'] for r in run),
+                    'chunks': [chunk_key(r) for r in run],
+                })
+                run = []
+            if result is not None:
+                run.append(result)
+
+    passages.sort(key=lambda passage: passage['score'], reverse=True)
+    packed = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage['text'])
+        if used + tokens <= token_budget:
+            packed.append(passage)
+            used += tokens
+        elif not packed:
+            # estimate_tokens counts four characters per token
+            packed.append({**passage, 'text': passage['text'][:token_budget * 4]})
+            used = token_budget
+    return packed
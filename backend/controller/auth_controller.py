@@ -5,8 +5,10 @@ from flask import jsonify, request, session
 
 from backend.RSDB_kv_service import get_kv, set_kv
 from backend.error import ErrorCode
-from backend.user_authentication_service import login, sign_up
-from backend.controller.helpers import get_resolved_share_list, login_required
+from backend.ingest_queue import get_ingest_queue
+from backend.rag import get_rag_manager
+from backend.user_authentication_service import login, set_user_registered, sign_up
+from backend.controller.helpers import get_resolved_share_list, login_required, route_logger
 
 
 def register_auth_routes(app, logger):
@@ -66,6 +68,13 @@ def register_auth_routes(app, logger):
         set_kv(username, "\n")
         set_kv(username + " ROOT", "\n")
         set_kv(username + " SHARE_MANAGER", "\n")
+        set_user_registered(username, registered=False)
+
+        try:
+            get_ingest_queue().cancel(username)
+            get_rag_manager().delete_user_store(username)
+        except Exception as e:
+            route_logger.error(f"Failed to delete vector store of {username}: {e}")
 
         session.pop('username')
 
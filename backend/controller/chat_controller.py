@@ -1,15 +1,72 @@
-from flask import jsonify, request, session
+import json
 
-from backend.controller.helpers import login_required
-from backend.rag_utils import get_llm_integration, get_rag_manager
+from flask import Response, jsonify, request, session, stream_with_context
+
+from backend.controller.helpers import get_share_manager, login_required
+from backend.ingest_queue import get_ingest_queue
+from backend.rag import get_llm_integration, get_rag_manager
 from backend.controller.helpers import route_logger
 
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in your uploaded files to answer this question. Please make sure you have uploaded text-based documents (PDF, DOCX, or TXT files)."
+
+
+def _collect_sources(relevant_chunks, username):
+    """One entry per file the chunks came from, in rank order; files of other users name the sharer."""
+    sources = []
+    seen_files = set()
+    for chunk in relevant_chunks:
+        filename = chunk['chunk']['metadata']['filename']
+        owner = chunk.get('owner', username)
+        if (owner, filename) not in seen_files:
+            source = {
+                'filename': filename,
+                'score': chunk['score']
+            }
+            if owner != username:
+                source['shared_by'] = owner
+            sources.append(source)
+            seen_files.add((owner, filename))
+    return sources
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _stream_chat(query, relevant_chunks, sources):
+    """
+    Server-sent events for a streamed answer: 'sources' first, then a 'token' per piece of
+    the answer and 'done', or 'error'. A client that disconnects closes this generator,
+    which closes the model's stream.
+    """
+    def events():
+        yield _sse('sources', {'sources': sources, 'chunks_found': len(relevant_chunks)})
+        if not relevant_chunks:
+            yield _sse('token', {'text': NO_RESULTS_ANSWER})
+            yield _sse('done', {})
+            return
+
+        answer = get_llm_integration().stream_answer(query, relevant_chunks)
+        try:
+            for text in answer:
+                yield _sse('token', {'text': text})
+        except Exception as e:
+            route_logger.error(f"Chat stream error: {e}")
+            yield _sse('error', {'error': 'An error occurred while generating the answer'})
+            return
+        finally:
+            answer.close()
+        yield _sse('done', {})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 
 def register_chat_routes(app, logger):
     @app.route('/chat', methods=['POST'])
     @login_required
     def chat_route():
-
+        """Answer a question from the user's documents; with "stream": true as server-sent events."""
         try:
             data = request.get_json()
 
@@ -23,11 +80,17 @@ def register_chat_routes(app, logger):
             username = session['username']
 
             rag_manager = get_rag_manager()
-            relevant_chunks = rag_manager.search_user_vector_db(username, query, top_k=5)
+            # Files shared with the user are searched too, restricted to the shared paths
+            relevant_chunks = rag_manager.search_accessible_vector_dbs(
+                username, query, top_k=5, share_manager=get_share_manager(username))
+            sources = _collect_sources(relevant_chunks, username)
+
+            if data.get('stream'):
+                return _stream_chat(query, relevant_chunks, sources)
 
             if not relevant_chunks:
                 return jsonify({
-                    'answer': "I couldn't find any relevant information in your uploaded files to answer this question. Please make sure you have uploaded text-based documents (PDF, DOCX, or TXT files).",
+                    'answer': NO_RESULTS_ANSWER,
                     'sources': [],
                     'chunks_found': 0
                 }), 200
@@ -35,17 +98,6 @@ def register_chat_routes(app, logger):
             llm_integration = get_llm_integration()
             answer = llm_integration.generate_answer(query, relevant_chunks)
 
-            sources = []
-            seen_files = set()
-            for chunk in relevant_chunks:
-                filename = chunk['chunk']['metadata']['filename']
-                if filename not in seen_files:
-                    sources.append({
-                        'filename': filename,
-                        'score': chunk['score']
-                    })
-                    seen_files.add(filename)
-
             return jsonify({
                 'answer': answer,
                 'sources': sources,
@@ -69,3 +121,21 @@ def register_chat_routes(app, logger):
         except Exception as e:
             route_logger.error(f"Chat stats error: {e}")
             return jsonify({'error': 'Failed to get chat statistics'}), 500
+
+    @app.route('/chat/ingest-status', methods=['GET'])
+    @login_required
+    def chat_ingest_status_route():
+        """Indexing state of one uploaded file: queued, processing, done or dead."""
+        cid = request.args.get('cid')
+        if not cid:
+            return jsonify({'error': 'cid is required'}), 400
+
+        try:
+            status = get_ingest_queue().get_status(session['username'], cid)
+            if status is None:
+                return jsonify({'error': 'No ingestion job for this file'}), 404
+            return jsonify(status), 200
+
+        except Exception as e:
+            route_logger.error(f"Ingest status error: {e}")
+            return jsonify({'error': 'Failed to get ingestion status'}), 500
@@ -1,14 +1,29 @@
+import os
 import zipfile
 from io import BytesIO
 
 from flask import jsonify, request, send_file, session
 
 from backend.RSDB_kv_service import get_kv, set_kv
+from backend.archive import ARCHIVE_MODE_AUTO, ARCHIVE_MODES, write_archive_entry
+from backend.batch_upload import (
+    ARCHIVE_SIZE_LIMIT,
+    BATCH_UPLOAD_MAX_FILES,
+    add_to_cluster_concurrently,
+    check_archive_limits,
+    insert_into_tree,
+    iter_archive_entries,
+    iter_uploaded_files,
+    normalize_relative_path,
+)
 from backend.delete_service import delete_node
 from backend.error import ErrorCode
 from backend.file import File
+from backend.ingest_queue import JOB_DONE, JOB_DEAD, JOB_QUEUED, get_ingest_queue
 from backend.ipfs import add_file_to_cluster, download_file_from_ipfs
+from backend.locks import get_user_lock
 from backend.node import Node
+from backend.pin_monitor import get_pin_monitor
 from backend.controller.helpers import (
     collect_files_recursively,
     get_root_node,
@@ -17,9 +32,94 @@ from backend.controller.helpers import (
     route_logger,
 )
 from backend.util import validate_file_size
-from backend.rag_utils import get_rag_manager
+from backend.rag import get_rag_manager
 
 FILE_SIZE_LIMIT = 1024 * 1024  # 1 MB limit
+RAG_SUPPORTED_EXTENSIONS = {'pdf', 'docx', 'txt'}
+# Set to 'false' to index documents inline during the upload request
+RAG_INGEST_ASYNC = os.environ.get('RAG_INGEST_ASYNC', 'true').lower() == 'true'
+
+
+def _is_rag_supported(filename):
+    file_extension = filename.lower().split('.')[-1] if '.' in filename else ''
+    return file_extension in RAG_SUPPORTED_EXTENSIONS
+
+
+def _keeps_content_for_rag(skip_ai_processing):
+    """keep_content for add_to_cluster_concurrently: only documents that will be queued for RAG"""
+    if skip_ai_processing:
+        return None
+    return lambda item: _is_rag_supported(item.filename)
+
+
+def _queue_for_rag(file_content, filename, username, cid, file_path):
+    """
+    Hand a supported text document to the RAG ingestion queue so the upload returns
+    without waiting for extraction and embeddings. Returns the job status, or None if
+    the file type is not indexed.
+    """
+    if not _is_rag_supported(filename):
+        return None
+
+    if not RAG_INGEST_ASYNC:
+        try:
+            rag_success = get_rag_manager().process_file_for_rag(file_content, filename, username, cid, file_path)
+        except Exception as e:
+            route_logger.error(f"RAG processing error for {filename}: {e}")
+            rag_success = False
+        return JOB_DONE if rag_success else JOB_DEAD
+
+    try:
+        get_ingest_queue().enqueue(username, cid, filename, file_content, file_path)
+        route_logger.info(f"Queued {filename} for RAG processing for user {username}")
+        return JOB_QUEUED
+    except Exception as e:
+        route_logger.error(f"Failed to queue {filename} for RAG processing: {e}")
+        return None
+
+
+def _commit_pending_uploads(username, path, pending, skip_ai_processing, subfolder=''):
+    """Insert added files below path/subfolder with one tree write, then track pins and queue RAG."""
+    pin_monitor = get_pin_monitor()
+    with get_user_lock(username):
+        root = Node.from_json(get_kv(username + " ROOT"))
+        target_node = root.find_node_by_path(path)
+        if target_node is None or not target_node.is_folder:
+            return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+
+        if subfolder:
+            target_node = target_node.ensure_folder_path(subfolder)
+            if target_node is None:
+                return jsonify({'message': ErrorCode.INVALID_PATH.name}), 400
+
+        inserted = insert_into_tree(target_node, pending, pin_monitor.upload_status())
+        if inserted:
+            set_kv(username + " ROOT", root.to_json())
+
+    if pin_monitor.running:
+        for item in inserted:
+            pin_monitor.track(username, item.cid)
+
+    if not skip_ai_processing:
+        base_path = "/".join(part for part in (root.normalize_path(path), subfolder) if part)
+        for item in inserted:
+            file_path = "/".join(part for part in (base_path, item.relative_path) if part)
+            item.rag_status = _queue_for_rag(item.content, item.filename, username, item.cid, file_path)
+            item.content = b""
+
+    if len(inserted) == len(pending):
+        message = ErrorCode.SUCCESS
+    elif inserted:
+        message = ErrorCode.PARTIAL_SUCCESS
+    else:
+        message = ErrorCode.UNKNOWN_ERROR
+
+    return jsonify({
+        'message': message.name,
+        'root': root.to_json(),
+        'results': [item.to_result() for item in pending],
+        'skip_ai_processing': skip_ai_processing
+    }), 200 if inserted else 400
 
 
 def register_file_routes(app, logger):
@@ -39,19 +139,20 @@ def register_file_routes(app, logger):
         folder_name = parts[-1]
         parent_path = "/".join(parts[:-1])
 
-        root = Node.from_json(get_kv(username + " ROOT"))
+        with get_user_lock(username):
+            root = Node.from_json(get_kv(username + " ROOT"))
 
-        parent_node = root.find_node_by_path(parent_path) if parent_path else root
-        if parent_node is None or not parent_node.is_folder:
-            return jsonify({'result': ErrorCode.INVALID_PATH.name}), 400
+            parent_node = root.find_node_by_path(parent_path) if parent_path else root
+            if parent_node is None or not parent_node.is_folder:
+                return jsonify({'result': ErrorCode.INVALID_PATH.name}), 400
 
-        if folder_name in parent_node.children:
-            return jsonify({'result': ErrorCode.DUPLICATE_NAME.name}), 409
+            if folder_name in parent_node.children:
+                return jsonify({'result': ErrorCode.DUPLICATE_NAME.name}), 409
 
-        new_folder = Node(name=folder_name, is_folder=True)
-        parent_node.add_child(new_folder)
+            new_folder = Node(name=folder_name, is_folder=True)
+            parent_node.add_child(new_folder)
 
-        set_kv(username + " ROOT", root.to_json())
+            set_kv(username + " ROOT", root.to_json())
 
         return jsonify({'result': ErrorCode.SUCCESS.name,
                         'root': root.to_json()}), 201
@@ -66,7 +167,7 @@ def register_file_routes(app, logger):
     @login_required
     def upload_route():
         """
-        Upload file to IPFS and process for RAG if it's a supported text format.
+        Upload file to IPFS and queue it for RAG if it's a supported text format.
         if user want to upload example.txt to path root/doc/example.txt. The path part in request should be root/doc
         """
         if 'file' not in request.files:
@@ -99,42 +200,32 @@ def register_file_routes(app, logger):
         if cid is None:
             return jsonify({'message': ErrorCode.IPFS_ERROR.name}), 500
 
-        root = Node.from_json(get_kv(username + " ROOT"))
-        target_node = root.find_node_by_path(path)
+        pin_monitor = get_pin_monitor()
+        with get_user_lock(username):
+            root = Node.from_json(get_kv(username + " ROOT"))
+            target_node = root.find_node_by_path(path)
 
-        if target_node is None:
-            return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+            if target_node is None:
+                return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+
+            file_obj = File(cid, file_size, filename, pin_status=pin_monitor.upload_status())
+            result = target_node.add_child(Node(filename, False, file_obj=file_obj))
 
-        result = target_node.add_child(Node(filename, False, file_obj=File(cid, file_size, filename)))
+            if result != ErrorCode.SUCCESS:
+                return jsonify({'message': result.name}), 400
 
-        if result != ErrorCode.SUCCESS:
-            return jsonify({'message': result.name}), 400
+            set_kv(username + " ROOT", root.to_json())
 
-        set_kv(username + " ROOT", root.to_json())
+        if pin_monitor.running:
+            pin_monitor.track(username, cid)
 
-        rag_success = False
+        rag_status = None
         rag_skipped = False
 
         if not skip_ai_processing:
-            supported_extensions = {'pdf', 'docx', 'txt'}
-            file_extension = filename.lower().split('.')[-1] if '.' in filename else ''
-
-            if file_extension in supported_extensions:
-                try:
-                    file_stream.seek(0)
-                    file_content = file_stream.read()
-
-                    rag_manager = get_rag_manager()
-                    rag_success = rag_manager.process_file_for_rag(file_content, filename, username, cid)
-
-                    if rag_success:
-                        route_logger.info(f"Successfully processed {filename} for RAG for user {username}")
-                    else:
-                        route_logger.warning(f"Failed to process {filename} for RAG for user {username}")
-
-                except Exception as e:
-                    route_logger.error(f"RAG processing error for {filename}: {e}")
-                    rag_success = False
+            file_stream.seek(0)
+            file_path = "/".join(part for part in (root.normalize_path(path), filename) if part)
+            rag_status = _queue_for_rag(file_stream.read(), filename, username, cid, file_path)
         else:
             rag_skipped = True
             route_logger.info(f"RAG processing skipped for {filename} for user {username} (AI mode disabled)")
@@ -142,13 +233,102 @@ def register_file_routes(app, logger):
         response_data = {
             'message': ErrorCode.SUCCESS.name,
             'root': root.to_json(),
-            'rag_processed': rag_success,
+            'rag_processed': rag_status == JOB_DONE,
+            'rag_status': rag_status,
             'rag_skipped': rag_skipped,
             'skip_ai_processing': skip_ai_processing
         }
 
         return jsonify(response_data), 200
 
+    @app.route('/upload-batch', methods=['POST'])
+    @login_required
+    def upload_batch_route():
+        """
+        Upload many files in one request. Each entry of 'files' may have a matching
+        'relative_paths' entry (e.g. 'src/lib/util.py'); missing intermediate folders
+        below 'path' are created. Files are read one by one and added to IPFS
+        concurrently; the tree is written once. Returns a per-file result list.
+        """
+        files = request.files.getlist('files')
+        if not files or 'path' not in request.form:
+            return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
+
+        if len(files) > BATCH_UPLOAD_MAX_FILES:
+            return jsonify({'message': ErrorCode.TOO_MANY_FILES.name}), 413
+
+        relative_paths = request.form.getlist('relative_paths')
+        if relative_paths and len(relative_paths) != len(files):
+            return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
+
+        path = request.form['path']
+        username = session['username']
+        skip_ai_processing = request.form.get('skip_ai_processing', 'false').lower() == 'true'
+
+        root = get_root_node(username)
+        if root is None or root.find_node_by_path(path) is None:
+            return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+
+        route_logger.info(f"Batch upload request: user={username}, files={len(files)}, path={path}")
+        pending = add_to_cluster_concurrently(iter_uploaded_files(files, relative_paths, FILE_SIZE_LIMIT),
+                                              keep_content=_keeps_content_for_rag(skip_ai_processing))
+
+        return _commit_pending_uploads(username, path, pending, skip_ai_processing)
+
+    @app.route('/upload-archive', methods=['POST'])
+    @login_required
+    def upload_archive_route():
+        """
+        Upload a ZIP archive and expand it into the tree below 'path'. Entries go into a
+        folder named after the archive unless 'extract_here' is true. Entries are read one
+        by one and added to IPFS concurrently; the tree is written once.
+        """
+        if 'file' not in request.files or 'path' not in request.form:
+            return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
+
+        path = request.form['path']
+        username = session['username']
+        file = request.files['file']
+        skip_ai_processing = request.form.get('skip_ai_processing', 'false').lower() == 'true'
+        extract_here = request.form.get('extract_here', 'false').lower() == 'true'
+
+        if file.filename == '':
+            return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
+
+        file.stream.seek(0, 2)
+        is_valid, error_message = validate_file_size(file.stream.tell(), ARCHIVE_SIZE_LIMIT)
+        if not is_valid:
+            return jsonify({'message': error_message}), 413
+        file.stream.seek(0)
+
+        root = get_root_node(username)
+        if root is None or root.find_node_by_path(path) is None:
+            return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+
+        subfolder = ''
+        if not extract_here:
+            subfolder = normalize_relative_path(file.filename.rsplit('.', 1)[0])
+            if subfolder is None or '/' in subfolder:
+                return jsonify({'message': ErrorCode.INVALID_PATH.name}), 400
+
+        try:
+            with zipfile.ZipFile(file.stream) as zip_file:
+                limit_result = check_archive_limits(zip_file)
+                if limit_result != ErrorCode.SUCCESS:
+                    return jsonify({'message': limit_result.name}), 413
+
+                route_logger.info(f"Archive upload request: user={username}, archive={file.filename}, "
+                                  f"entries={len(zip_file.infolist())}, path={path}")
+                pending = add_to_cluster_concurrently(iter_archive_entries(zip_file, FILE_SIZE_LIMIT),
+                                                      keep_content=_keeps_content_for_rag(skip_ai_processing))
+        except zipfile.BadZipFile:
+            return jsonify({'message': ErrorCode.INVALID_ARCHIVE.name}), 400
+
+        if not pending:
+            return jsonify({'message': ErrorCode.INVALID_ARCHIVE.name}), 400
+
+        return _commit_pending_uploads(username, path, pending, skip_ai_processing, subfolder)
+
     @app.route('/download', methods=['POST'])
     @login_required
     def download_route():
@@ -193,7 +373,10 @@ def register_file_routes(app, logger):
     @app.route('/download-zip', methods=['POST'])
     @login_required
     def download_zip_route():
-        """Download a folder as a ZIP file."""
+        """
+        Download a folder as a ZIP file.
+        Optional 'compression' selects 'auto' (per-entry store/deflate, default), 'store' or 'deflate'.
+        """
         data = request.get_json()
         if not data or 'path' not in data:
             return jsonify({'message': ErrorCode.INVALID_PATH.name}), 400
@@ -201,6 +384,10 @@ def register_file_routes(app, logger):
         path = data['path']
         username = session['username']
         is_shared = data.get('is_shared', False)
+        compression = data.get('compression', ARCHIVE_MODE_AUTO)
+
+        if not isinstance(compression, str) or compression not in ARCHIVE_MODES:
+            return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
 
         if is_shared:
             share_manager = get_share_manager(username)
@@ -225,12 +412,12 @@ def register_file_routes(app, logger):
         zip_buffer = BytesIO()
 
         try:
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
                 for relative_path, file_obj in files_to_zip:
                     file_content = download_file_from_ipfs(file_obj.cid)
 
                     if file_content and file_content.get("success"):
-                        zip_file.writestr(relative_path, file_content["file"].getvalue())
+                        write_archive_entry(zip_file, relative_path, file_content["file"].getvalue(), compression)
                     else:
                         route_logger.warning(f"Failed to download file: {relative_path}")
 
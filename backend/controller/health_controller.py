@@ -1,7 +1,33 @@
 from flask import jsonify
 
+from backend.ingest_queue import get_ingest_queue
+from backend.ipfs import get_ipfs_client
+from backend.pin_monitor import get_pin_monitor
+from backend.rag import get_llm_integration, get_rag_manager
+from backend.text_extraction import get_text_extractor
+
 
 def register_health_routes(app, logger):
     @app.route('/', methods=['GET'])
     def health_route():
         return jsonify({'message': 'OK'}), 200
+
+    @app.route('/health/ipfs', methods=['GET'])
+    def ipfs_health_route():
+        """Latency and error counters for IPFS Cluster and gateway calls."""
+        metrics = get_ipfs_client().get_metrics()
+        metrics['tracked_pins'] = get_pin_monitor().tracked_count()
+        return jsonify(metrics), 200
+
+    @app.route('/health/rag', methods=['GET'])
+    def rag_health_route():
+        """Vector index and query caches, embedding throughput, answer latency, text extraction and ingestion queue depth."""
+        rag_manager = get_rag_manager()
+        return jsonify({
+            'index_cache': rag_manager.get_cache_stats(),
+            'embeddings': rag_manager.get_embedding_stats(),
+            'query_caches': rag_manager.get_query_cache_stats(),
+            'llm': get_llm_integration().get_stats(),
+            'extraction': get_text_extractor().stats(),
+            'ingest_jobs': get_ingest_queue().counts(),
+        }), 200
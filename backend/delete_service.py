@@ -1,9 +1,16 @@
+import logging
+
 from flask import jsonify, session
 from backend.RSDB_kv_service import get_kv, set_kv
 from backend.error import ErrorCode
+from backend.ingest_queue import get_ingest_queue
+from backend.locks import get_user_lock
 from backend.node import Node
+from backend.rag import get_rag_manager
 from backend.share_manager import ShareManager
 
+logger = logging.getLogger(__name__)
+
 
 def _load_root(username: str):
     root_json = get_kv(username + " ROOT")
@@ -11,6 +18,18 @@ def _load_root(username: str):
         return None
     return Node.from_json(root_json)
 
+def _remove_from_rag(username, root, deleted_files):
+    """Drop deleted files from the user's chat index and the ingestion queue."""
+    paths = [path for path, _ in deleted_files]
+    remaining_cids = {node.file_obj.cid for _, node in root.iter_files()}
+    orphaned_cids = {node.file_obj.cid for _, node in deleted_files} - remaining_cids
+    try:
+        get_ingest_queue().cancel(username, paths)
+        get_rag_manager().delete_file_vectors(username, paths, list(orphaned_cids))
+    except Exception as e:
+        logger.error(f"Failed to remove deleted files from RAG index for {username}: {e}")
+
+
 def delete_node(data):
     if 'node_path' not in data:
         return jsonify({'message': ErrorCode.INVALID_REQUEST.name}), 400
@@ -25,29 +44,38 @@ def delete_node(data):
         is_root = is_root.lower() == 'true'
 
     if is_root:
-        root = Node.from_json(get_kv(username + " ROOT"))
+        with get_user_lock(username):
+            root = Node.from_json(get_kv(username + " ROOT"))
 
-        if node_path.strip("/") == "":
-            return jsonify({'message': ErrorCode.DELETE_ROOT_DIRECTORY.name}), 400
+            if node_path.strip("/") == "":
+                return jsonify({'message': ErrorCode.DELETE_ROOT_DIRECTORY.name}), 400
 
-        parts = node_path.strip("/").split("/")
-        node_name = parts[-1]
-        parent_path = "/".join(parts[:-1])
+            parts = node_path.strip("/").split("/")
+            node_name = parts[-1]
+            parent_path = "/".join(parts[:-1])
 
-        parent_node = root.find_node_by_path(parent_path) if parent_path else root
+            parent_node = root.find_node_by_path(parent_path) if parent_path else root
 
-        if parent_node is None or not parent_node.is_folder:
-            return jsonify({'message': ErrorCode.INVALID_PATH.name}), 400
+            if parent_node is None or not parent_node.is_folder:
+                return jsonify({'message': ErrorCode.INVALID_PATH.name}), 400
+
+            if node_name not in parent_node.children:
+                return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
 
-        if node_name not in parent_node.children:
-            return jsonify({'message': ErrorCode.NODE_NOT_FOUND.name}), 404
+            deleted_node = parent_node.children.pop(node_name)
+            deleted_path = root.normalize_path(node_path)
+            if deleted_node.is_folder:
+                deleted_files = list(deleted_node.iter_files(deleted_path))
+            else:
+                deleted_files = [(deleted_path, deleted_node)] if deleted_node.file_obj else []
 
-        del parent_node.children[node_name]
+            set_kv(username + " ROOT", root.to_json())
 
-        set_kv(username + " ROOT", root.to_json())
+            if deleted_files:
+                _remove_from_rag(username, root, deleted_files)
 
-        return jsonify({'message': ErrorCode.SUCCESS.name,
-                        'root': root.to_json()}), 200
+            return jsonify({'message': ErrorCode.SUCCESS.name,
+                            'root': root.to_json()}), 200
     else:
         share_json = get_kv(username + " SHARE_MANAGER") or "{}"
         share_manager = ShareManager.from_json(share_json)
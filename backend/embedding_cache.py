@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBED_CACHE_MAX_ENTRIES = int(os.environ.get('EMBED_CACHE_MAX_ENTRIES', '200000'))
+EMBED_CACHE_MAX_DOCUMENTS = int(os.environ.get('EMBED_CACHE_MAX_DOCUMENTS', '20000'))
+# When over the limit, evict least recently used rows down to this fraction of it
+EVICT_TO_FRACTION = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used);
+
+CREATE TABLE IF NOT EXISTS documents (
+    cid TEXT NOT NULL,
+    splitter TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (cid, splitter)
+);
+CREATE INDEX IF NOT EXISTS documents_last_used ON documents(last_used);
+
+CREATE TABLE IF NOT EXISTS document_chunks (
+    cid TEXT NOT NULL,
+    splitter TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (cid, splitter, chunk_index)
+);
+"""
+
+_MAX_PARAMS = 500
+
+
+def embedding_key(model: str, dimension: int, task_type: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f"{model}:{dimension}:{task_type}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache shared by all users, in SQLite.
+
+    Vectors are keyed by (model, dimension, task type, sha256 of the text), so identical
+    chunks are embedded once no matter who uploads them. Chunk texts of processed
+    documents are also kept per CID, letting a re-upload of the same content skip
+    extraction and chunking. Both tables are bounded and evicted least recently used.
+
+    Row counts are kept as a running estimate of the last count plus this process's
+    inserts; the table is only counted again once that estimate passes the limit.
+    """
+
+    def __init__(self, path: str, max_entries: int = EMBED_CACHE_MAX_ENTRIES,
+                 max_documents: int = EMBED_CACHE_MAX_DOCUMENTS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_documents = max_documents
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.document_hits = 0
+        self._row_estimates: Dict[str, int] = {}
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str], dimension: int) -> Dict[str, np.ndarray]:
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        conn = self._connection()
+        unique_keys = list(dict.fromkeys(keys))
+        for offset in range(0, len(unique_keys), _MAX_PARAMS):
+            batch = unique_keys[offset:offset + _MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            for key, vector in conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                found[key] = np.frombuffer(vector, dtype=np.float32, count=dimension)
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                 [(now, key) for key in found])
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        now = time.time()
+        rows = [(key, np.ascontiguousarray(vector, dtype=np.float32).tobytes(), now)
+                for key, vector in zip(keys, vectors)]
+        with self._connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+        self._evict_embeddings(len(rows))
+
+    def get_document_chunks(self, cid: str, splitter: str) -> Optional[List[str]]:
+        """Chunk texts of a previously processed CID under the given splitter settings, in order, or None."""
+        conn = self._connection()
+        row = conn.execute("SELECT chunk_count FROM documents WHERE cid = ? AND splitter = ?", (cid, splitter)).fetchone()
+        if row is None:
+            return None
+        texts = [text for (text,) in conn.execute(
+            "SELECT text FROM document_chunks WHERE cid = ? AND splitter = ? ORDER BY chunk_index", (cid, splitter))]
+        if len(texts) != row[0]:
+            return None
+        with conn:
+            conn.execute("UPDATE documents SET last_used = ? WHERE cid = ? AND splitter = ?", (time.time(), cid, splitter))
+        with self._stats_lock:
+            self.document_hits += 1
+        return texts
+
+    def put_document_chunks(self, cid: str, splitter: str, texts: List[str], start: int = 0, complete: bool = True):
+        """
+        Store chunk texts start, start + 1, ... of a CID. Streamed documents are written
+        in parts; get_document_chunks serves one only after the part marked complete.
+        """
+        with self._connection() as conn:
+            if start == 0:
+                conn.execute("DELETE FROM document_chunks WHERE cid = ? AND splitter = ?", (cid, splitter))
+                conn.execute("DELETE FROM documents WHERE cid = ? AND splitter = ?", (cid, splitter))
+            conn.executemany(
+                "INSERT OR REPLACE INTO document_chunks (cid, splitter, chunk_index, text) VALUES (?, ?, ?, ?)",
+                [(cid, splitter, start + index, text) for index, text in enumerate(texts)],
+            )
+            if complete:
+                conn.execute("INSERT OR REPLACE INTO documents (cid, splitter, chunk_count, last_used) VALUES (?, ?, ?, ?)",
+                             (cid, splitter, start + len(texts), time.time()))
+        if complete:
+            self._evict_documents(1)
+
+    def _excess(self, table: str, limit: int, added: int) -> int:
+        """Rows to evict from table after this process added some; counts it only when it may be full."""
+        with self._stats_lock:
+            estimate = self._row_estimates.get(table)
+            if estimate is not None and estimate + added <= limit:
+                self._row_estimates[table] = estimate + added
+                return 0
+        count = self._connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        excess = count - int(limit * EVICT_TO_FRACTION) if count > limit else 0
+        with self._stats_lock:
+            self._row_estimates[table] = count - excess
+        return excess
+
+    def _evict_embeddings(self, added: int):
+        excess = self._excess("embeddings", self.max_entries, added)
+        if excess:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM embeddings WHERE key IN "
+                             "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,))
+
+    def _evict_documents(self, added: int):
+        excess = self._excess("documents", self.max_documents, added)
+        if excess:
+            with self._connection() as conn:
+                stale = conn.execute("SELECT cid, splitter FROM documents ORDER BY last_used LIMIT ?", (excess,)).fetchall()
+                conn.executemany("DELETE FROM document_chunks WHERE cid = ? AND splitter = ?", stale)
+                conn.executemany("DELETE FROM documents WHERE cid = ? AND splitter = ?", stale)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'document_hits': self.document_hits,
+            }
@@ -0,0 +1,354 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+PROVIDER_GEMINI = 'gemini'
+PROVIDER_HASHING = 'hashing'
+PROVIDER_SENTENCE_TRANSFORMERS = 'sentence-transformers'
+# gemini: Gemini API (needs GOOGLE_API_KEY); hashing: offline deterministic n-gram hashing,
+# for tests and benchmarks; sentence-transformers: a local model (optional dependency)
+EMBEDDING_PROVIDER = os.environ.get('EMBEDDING_PROVIDER', PROVIDER_GEMINI).lower()
+# Model of the sentence-transformers provider (name on the Hugging Face hub or a local path)
+EMBEDDING_LOCAL_MODEL = os.environ.get('EMBEDDING_LOCAL_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+
+# batchEmbedContents accepts at most 100 requests per call
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', '100'))
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', '4'))
+EMBED_REQUESTS_PER_MINUTE = float(os.environ.get('EMBED_REQUESTS_PER_MINUTE', '100'))
+EMBED_MAX_RETRIES = int(os.environ.get('EMBED_MAX_RETRIES', '5'))
+EMBED_RETRY_BACKOFF = 1.0
+EMBED_TIMEOUT = (5, 60)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class TokenBucket:
+    """Blocking token bucket: refills at rate tokens per second up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingMetrics:
+    """Throughput counters for embedding calls. Tokens are estimated at four characters each."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.tokens = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def record_call(self, texts: int, tokens: int, seconds: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.texts += texts
+                self.tokens += tokens
+            else:
+                self.failures += 1
+            self.seconds += seconds
+
+    def record_request(self, retried: bool = False):
+        with self._lock:
+            self.requests += 1
+            if retried:
+                self.retries += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'texts': self.texts,
+                'estimated_tokens': self.tokens,
+                'requests': self.requests,
+                'retries': self.retries,
+                'failures': self.failures,
+                'texts_per_second': round(self.texts / self.seconds, 2) if self.seconds else 0.0,
+                'tokens_per_second': round(self.tokens / self.seconds, 2) if self.seconds else 0.0,
+            }
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into L2-normalized float32 vectors for RAGManager.
+
+    model names the embedding space: it is part of embedding cache keys, so vectors of
+    different providers or models are never mixed. Vectors of different providers are not
+    comparable either; switching provider means re-indexing existing stores.
+    """
+
+    model: str
+    dimension: int
+
+    def __init__(self):
+        self.metrics = EmbeddingMetrics()
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """Embed texts, returning a (len(texts), dimension) float32 array in input order."""
+        raise NotImplementedError
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Offline, deterministic embeddings for tests and benchmarks.
+
+    Words, word bigrams and character n-grams of the case-folded text are feature-hashed
+    with a sign into dimension buckets (a random projection of the n-gram counts) and
+    normalized. Texts sharing vocabulary get high cosine similarity, which is enough to
+    exercise indexing, retrieval and /chat at scale without network or API key, but there
+    is no semantic understanding. Hashing uses crc32, so vectors are stable across
+    processes and runs.
+    """
+
+    WORD_WEIGHT = 2.0
+    BIGRAM_WEIGHT = 1.0
+    CHAR_WEIGHT = 0.5
+
+    def __init__(self, dimension: int, ngram_sizes: Sequence[int] = (3, 4, 5)):
+        super().__init__()
+        self.dimension = dimension
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.model = f"hashing-ngram-v1-{'-'.join(map(str, self.ngram_sizes))}"
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        text = " ".join(text.casefold().split())
+        words = re.findall(r"\w+", text)
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        weights = [self.WORD_WEIGHT] * len(words) + [self.BIGRAM_WEIGHT] * max(len(words) - 1, 0)
+        padded = f" {text} "
+        for n in self.ngram_sizes:
+            grams = [padded[i:i + n] for i in range(len(padded) - n + 1)]
+            features.extend(grams)
+            weights.extend([self.CHAR_WEIGHT] * len(grams))
+        if not features:
+            return np.zeros(self.dimension, dtype=np.float32)
+
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                             dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0) * np.asarray(weights)
+        return np.bincount(hashes % self.dimension, weights=signs, minlength=self.dimension)
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        start_time = time.perf_counter()
+        self.metrics.record_request()
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            embeddings[i] = self._embed_one(text)
+        self.metrics.record_call(len(texts), sum(estimate_tokens(text) for text in texts),
+                                 time.perf_counter() - start_time, True)
+        return _normalize(embeddings)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """
+    Embeddings from a local sentence-transformers model, loaded on first use. The package
+    (and torch) is an optional dependency: pip install sentence-transformers. If the model
+    outputs more than dimension values, vectors are truncated and renormalized.
+    """
+
+    def __init__(self, model_name: str, dimension: int, batch_size: int = 64):
+        super().__init__()
+        self.model_name = model_name
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.model = f"st:{model_name}"
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise EmbeddingError("EMBEDDING_PROVIDER=sentence-transformers needs the "
+                                         "sentence-transformers package") from e
+                model = SentenceTransformer(self.model_name)
+                output_dimension = model.get_sentence_embedding_dimension()
+                if output_dimension < self.dimension:
+                    raise EmbeddingError(f"Model {self.model_name} outputs {output_dimension} dimensions, "
+                                         f"fewer than the configured {self.dimension}")
+                self._model = model
+            return self._model
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        model = self._get_model()
+        start_time = time.perf_counter()
+        self.metrics.record_request()
+        ok = False
+        try:
+            embeddings = model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                      show_progress_bar=False)
+            ok = True
+        except Exception as e:
+            raise EmbeddingError(f"Local embedding model failed: {e}") from e
+        finally:
+            self.metrics.record_call(len(texts), sum(estimate_tokens(text) for text in texts),
+                                     time.perf_counter() - start_time, ok)
+        return _normalize(np.asarray(embeddings, dtype=np.float32)[:, :self.dimension])
+
+
+class GeminiEmbeddingClient(EmbeddingProvider):
+    """
+    Gemini batchEmbedContents client.
+
+    Texts are split into batches of at most batch_size, sent concurrently through a
+    shared request-rate limiter, and each batch is retried on its own on 429/5xx and
+    network errors with exponential backoff (honouring Retry-After). Results are
+    reassembled in input order; if any batch finally fails the whole call raises
+    EmbeddingError so no partial result is indexed.
+    """
+
+    def __init__(self, api_key: Optional[str], model: str, dimension: int,
+                 batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 requests_per_minute: float = EMBED_REQUESTS_PER_MINUTE,
+                 max_retries: int = EMBED_MAX_RETRIES, retry_backoff: float = EMBED_RETRY_BACKOFF):
+        super().__init__()
+        self.api_key = api_key
+        self.model = model
+        self.dimension = dimension
+        self.batch_size = max(1, min(batch_size, 100))
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        rate = requests_per_minute / 60.0
+        self.rate_limiter = TokenBucket(rate, capacity=max(1.0, float(self.concurrency)))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+
+    def _request_body(self, texts: List[str], task_type: str) -> Dict:
+        return {
+            "requests": [
+                {
+                    "model": f"models/{self.model}",
+                    "content": {"parts": [{"text": text}]},
+                    "task_type": task_type,
+                    "output_dimensionality": self.dimension,
+                }
+                for text in texts
+            ]
+        }
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        delay = self.retry_backoff * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    def _embed_batch(self, texts: List[str], task_type: str) -> np.ndarray:
+        url = f"{GEMINI_API_URL}/{self.model}:batchEmbedContents"
+        headers = {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
+        body = self._request_body(texts, task_type)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            self.metrics.record_request(retried=attempt > 0)
+            response = None
+            try:
+                response = self.session.post(url, headers=headers, json=body, timeout=EMBED_TIMEOUT)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    embeddings = response.json().get("embeddings", [])
+                    if len(embeddings) != len(texts):
+                        raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                    return np.array([embedding["values"] for embedding in embeddings], dtype=np.float32)
+                error = f"status {response.status_code}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = str(e)
+            except requests.exceptions.RequestException as e:
+                body_text = e.response.text if getattr(e, 'response', None) is not None else ''
+                raise EmbeddingError(f"Gemini embedding request failed: {e} {body_text}") from e
+
+            if attempt == self.max_retries:
+                raise EmbeddingError(f"Gemini embedding batch failed after {attempt + 1} attempts: {error}")
+            delay = self._retry_delay(attempt, response)
+            logger.warning(f"Embedding batch of {len(texts)} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        """Embed texts, returning a (len(texts), dimension) float32 array in input order."""
+        self.api_key = os.getenv('GOOGLE_API_KEY') or self.api_key
+        if not self.api_key:
+            raise EmbeddingError("GOOGLE_API_KEY not found in environment variables")
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        start_time = time.perf_counter()
+        ok = False
+        try:
+            if len(batches) == 1:
+                results = [self._embed_batch(batches[0], task_type)]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                    results = list(executor.map(lambda batch: self._embed_batch(batch, task_type), batches))
+            ok = True
+        finally:
+            self.metrics.record_call(len(texts), tokens, time.perf_counter() - start_time, ok)
+
+        embeddings = np.vstack(results)
+        if self.dimension < 3072:  # Normalize for truncated dimensions
+            embeddings = _normalize(embeddings)
+        return embeddings
+
+
+def create_embedding_provider(provider: str, model: str, dimension: int,
+                              api_key: Optional[str] = None) -> EmbeddingProvider:
+    """Build the provider named by EMBEDDING_PROVIDER; model is the Gemini model name."""
+    if provider == PROVIDER_HASHING:
+        return HashingEmbeddingProvider(dimension)
+    if provider == PROVIDER_SENTENCE_TRANSFORMERS:
+        return SentenceTransformerProvider(EMBEDDING_LOCAL_MODEL, dimension)
+    if provider != PROVIDER_GEMINI:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}'")
+    return GeminiEmbeddingClient(api_key, model, dimension)
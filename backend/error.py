@@ -21,4 +21,8 @@ class ErrorCode(Enum):
     EXCEED_MAX_FILE_SIZE = 17
     FILE_NOT_FOUND = 18
     NOT_LOGGED_IN = 19
+    PARTIAL_SUCCESS = 20
+    TOO_MANY_FILES = 21
+    INVALID_ARCHIVE = 22
+    EXCEED_MAX_ARCHIVE_SIZE = 23
     UNKNOWN_ERROR = 99
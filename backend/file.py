@@ -1,11 +1,13 @@
 from datetime import datetime
 
 class File:
-    def __init__(self, cid, size, filename, creation_date=None):
+    def __init__(self, cid, size, filename, creation_date=None, pin_status=None, replicas=None):
         self.cid = cid  # IPFS CID
         self.size = size
         self.filename = filename
         self.creation_date = creation_date or datetime.now()
+        self.pin_status = pin_status  # cluster replication state, filled in by the pin monitor
+        self.replicas = replicas  # number of cluster peers holding the pin
 
     def __repr__(self):
         return f"File({self.filename}, CID={self.cid}, Size={self.size} bytes, Created={self.creation_date})"
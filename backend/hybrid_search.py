@@ -0,0 +1,41 @@
+import re
+from typing import Dict, List, Sequence, Tuple
+
+# Reciprocal rank fusion damping: higher values flatten the advantage of the top ranks
+RRF_K = 60
+
+# Terms with digits, '_', '.', '-', '/' or camelCase look like file names or identifiers
+_EXACT_TERM = re.compile(r"[\d_./\\-]|[a-z][A-Z]")
+
+
+def is_exact_term_query(query: str) -> bool:
+    """
+    Keyword-style query, answered from the keyword index alone when it has matches: a
+    quoted phrase, or up to three terms that all look like file names or identifiers.
+    """
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] == '"':
+        return True
+    terms = query.split()
+    return 0 < len(terms) <= 3 and all(_EXACT_TERM.search(term) for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[float, str, Dict]]], limit: int,
+                           k: int = RRF_K) -> List[Tuple[float, str, Dict]]:
+    """
+    Merge rankings of (score, owner, chunk), each best first, by the sum of 1 / (k + rank)
+    over the rankings a chunk appears in. Scores of different rankers (cosine, BM25) are
+    not comparable, ranks are. Fused scores are scaled so first place in every non-empty
+    ranking scores 1.
+    """
+    fused: Dict[tuple, list] = {}
+    for ranking in rankings:
+        for rank, (_, owner, chunk) in enumerate(ranking, start=1):
+            metadata = chunk['metadata']
+            key = (owner, metadata.get('path'), metadata.get('cid'), metadata.get('filename'), metadata.get('chunk_index'))
+            entry = fused.setdefault(key, [0.0, owner, chunk])
+            entry[0] += 1.0 / (k + rank)
+
+    best = sum(1 for ranking in rankings if ranking) / (k + 1)
+    merged = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:limit]
+    return [(score / best, owner, chunk) for score, owner, chunk in merged]
@@ -0,0 +1,84 @@
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+from backend.text_splitter import RecursiveTextSplitter
+
+T = TypeVar('T')
+
+# Chunks embedded and appended to the index per step of a streamed ingestion
+RAG_STREAM_BATCH_CHUNKS = int(os.environ.get('RAG_STREAM_BATCH_CHUNKS', '128'))
+# Batches extracted and chunked ahead of the one being embedded
+RAG_STREAM_PREFETCH_BATCHES = int(os.environ.get('RAG_STREAM_PREFETCH_BATCHES', '2'))
+
+_DONE = object()
+
+
+def iter_chunks(segments: Iterable[str], splitter: RecursiveTextSplitter) -> Iterator[str]:
+    """
+    Split a stream of text segments (pages, paragraphs) joined by newlines into the chunks
+    splitter.split_text gives for the whole text, holding about a chunk of text per
+    separator level rather than the text (see RecursiveTextSplitter.split_stream).
+    """
+    def joined():
+        for number, segment in enumerate(segments):
+            yield f"\n{segment}" if number else segment
+    return splitter.split_stream(joined())
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(items: Iterable[T], depth: int = RAG_STREAM_PREFETCH_BATCHES) -> Iterator[T]:
+    """
+    Produce items in a background thread, at most depth ahead of the consumer, so the
+    stages before and after overlap with bounded memory. Exceptions of the producer are
+    raised to the consumer; a consumer that stops early stops the producer.
+    """
+    if depth <= 0:
+        yield from items
+        return
+
+    buffer: "queue.Queue" = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+            return
+        put((_DONE, None))
+
+    producer = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
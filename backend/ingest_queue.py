@@ -0,0 +1,331 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_PROCESSING = 'processing'
+JOB_DONE = 'done'
+JOB_DEAD = 'dead'  # dead letter: gave up after MAX_ATTEMPTS
+JOB_CANCELLED = 'cancelled'  # its file or user was deleted while it was being processed
+
+INGEST_QUEUE_PATH = os.environ.get('RAG_INGEST_QUEUE_PATH', 'backend/vector_db/ingest_queue.sqlite')
+INGEST_WORKERS = int(os.environ.get('RAG_INGEST_WORKERS', '2'))
+MAX_ATTEMPTS = int(os.environ.get('RAG_INGEST_MAX_ATTEMPTS', '5'))
+RETRY_BASE_SECONDS = 5.0
+# A job claimed by a worker that died is handed out again after its lease runs out;
+# the worker renews the lease each time it indexes another batch of the document
+LEASE_SECONDS = 600.0
+IDLE_POLL_SECONDS = 2.0
+# Done and dead-letter jobs are kept this long for status queries, then purged
+JOB_RETENTION_SECONDS = float(os.environ.get('RAG_INGEST_RETENTION_DAYS', '7')) * 86400
+PURGE_INTERVAL_SECONDS = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    cid TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    path TEXT,
+    content BLOB,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS jobs_user_cid ON jobs(username, cid);
+"""
+
+
+class IngestQueue:
+    """
+    Persistent queue of RAG ingestion jobs served by a pool of worker threads.
+
+    Jobs live in SQLite so they survive restarts and can be shared by several worker
+    processes. Jobs of one user never run concurrently within a process (the vector
+    store's file lock covers other processes); failed jobs are retried with exponential
+    backoff and moved to the dead-letter state after MAX_ATTEMPTS.
+
+    The handler gets a checkpoint callable to call as it makes progress: it renews the
+    job's lease and returns False once the job is no longer this worker's (its lease
+    ran out and another worker took it over, or it was cancelled), in which case the
+    handler should stop. Once a cancelled job's handler returns, on_cancelled(username,
+    cid, path) is called to undo whatever it indexed before noticing.
+    """
+
+    def __init__(self, handler: Callable[[str, str, str, bytes, Optional[str], Callable[[], bool]], bool],
+                 db_path: str = INGEST_QUEUE_PATH, workers: int = INGEST_WORKERS,
+                 on_cancelled: Optional[Callable[[str, str, Optional[str]], None]] = None):
+        self.handler = handler
+        self.on_cancelled = on_cancelled
+        self.db_path = db_path
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._active_users: Set[str] = set()
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._next_purge = 0.0
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, username: str, cid: str, filename: str, content: bytes, path: Optional[str] = None) -> int:
+        now = time.time()
+        conn = self._connection()
+        cursor = conn.execute(
+            "INSERT INTO jobs (username, cid, filename, path, content, status, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (username, cid, filename, path, content, JOB_QUEUED, now, now, now),
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return cursor.lastrowid
+
+    def get_status(self, username: str, cid: str) -> Optional[Dict]:
+        """Latest ingestion job for one of the user's files."""
+        row = self._connection().execute(
+            "SELECT id, filename, status, attempts, last_error, created_at, updated_at FROM jobs "
+            "WHERE username = ? AND cid = ? ORDER BY id DESC LIMIT 1",
+            (username, cid),
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, filename, status, attempts, last_error, created_at, updated_at = row
+        return {
+            'job_id': job_id,
+            'filename': filename,
+            'status': status,
+            'attempts': attempts,
+            'last_error': last_error,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    def cancel(self, username: str, paths: List[str] = None):
+        """
+        Drop queued jobs of a user, of the given file paths only if paths is given, and
+        mark those being processed cancelled so their workers stop before indexing more.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if paths is None:
+                conn.execute("DELETE FROM jobs WHERE username = ? AND status = ?", (username, JOB_QUEUED))
+                conn.execute("UPDATE jobs SET status = ?, content = NULL, updated_at = ? WHERE username = ? AND status = ?",
+                             (JOB_CANCELLED, now, username, JOB_PROCESSING))
+            else:
+                conn.executemany("DELETE FROM jobs WHERE username = ? AND path = ? AND status = ?",
+                                 [(username, path, JOB_QUEUED) for path in paths])
+                conn.executemany(
+                    "UPDATE jobs SET status = ?, content = NULL, updated_at = ? "
+                    "WHERE username = ? AND path = ? AND status = ?",
+                    [(JOB_CANCELLED, now, username, path, JOB_PROCESSING) for path in paths])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def _claim(self):
+        """Atomically take the oldest ready job whose user is not already being processed here."""
+        with self._active_lock:
+            busy_users = list(self._active_users)
+        now = time.time()
+        user_filter = ""
+        if busy_users:
+            user_filter = f"AND username NOT IN ({','.join('?' * len(busy_users))})"
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, username, cid, filename, content, attempts, path FROM jobs "
+                "WHERE ((status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until < ?)) "
+                f"{user_filter} ORDER BY id LIMIT 1",
+                (JOB_QUEUED, now, JOB_PROCESSING, now, *busy_users),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = ?, worker = ?, updated_at = ? WHERE id = ?",
+                (JOB_PROCESSING, now + LEASE_SECONDS, self.worker_id, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._active_lock:
+            if row[1] in self._active_users:
+                # Another thread claimed a job of this user meanwhile; hand this one back
+                conn.execute("UPDATE jobs SET status = ?, lease_until = NULL WHERE id = ?", (JOB_QUEUED, row[0]))
+                return None
+            self._active_users.add(row[1])
+        return row
+
+    def _renew(self, job_id: int) -> bool:
+        """Extend the lease of a job this worker is processing; False if it is no longer ours."""
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+            (now + LEASE_SECONDS, now, job_id, JOB_PROCESSING, self.worker_id))
+        return cursor.rowcount == 1
+
+    def _finish(self, job_id: int, attempts: int, error: Optional[str]) -> bool:
+        """Record the outcome of a job; False if the job was no longer this worker's."""
+        now = time.time()
+        conn = self._connection()
+        owned = "WHERE id = ? AND status = ? AND worker = ?"
+        if error is None:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, content = NULL, lease_until = NULL, last_error = NULL, updated_at = ? "
+                f"{owned}", (JOB_DONE, now, job_id, JOB_PROCESSING, self.worker_id))
+        elif attempts + 1 >= MAX_ATTEMPTS:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, content = NULL, lease_until = NULL, last_error = ?, "
+                f"updated_at = ? {owned}", (JOB_DEAD, attempts + 1, error, now, job_id, JOB_PROCESSING, self.worker_id))
+            if cursor.rowcount:
+                logger.error(f"RAG ingestion job {job_id} moved to dead letter after {attempts + 1} attempts: {error}")
+        else:
+            delay = RETRY_BASE_SECONDS * (2 ** attempts)
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt_at = ?, lease_until = NULL, last_error = ?, "
+                f"updated_at = ? {owned}",
+                (JOB_QUEUED, attempts + 1, now + delay, error, now, job_id, JOB_PROCESSING, self.worker_id))
+            if cursor.rowcount:
+                logger.warning(f"RAG ingestion job {job_id} failed (attempt {attempts + 1}), "
+                               f"retrying in {delay:.0f}s: {error}")
+        return cursor.rowcount == 1
+
+    def _take_cancelled(self, job_id: int) -> bool:
+        """Delete a job if it was cancelled while processing; True if it was."""
+        cursor = self._connection().execute("DELETE FROM jobs WHERE id = ? AND status = ?", (job_id, JOB_CANCELLED))
+        return cursor.rowcount == 1
+
+    def purge(self, older_than: float = JOB_RETENTION_SECONDS) -> int:
+        """
+        Delete done and dead-letter jobs last updated more than older_than seconds ago, and
+        cancelled ones left behind by a worker that died.
+        """
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?",
+            (JOB_DONE, JOB_DEAD, JOB_CANCELLED, time.time() - older_than))
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} finished RAG ingestion jobs")
+        return cursor.rowcount
+
+    def run_once(self) -> bool:
+        """Process one ready job. Returns False if there was nothing to do."""
+        row = self._claim()
+        if row is None:
+            return False
+
+        job_id, username, cid, filename, content, attempts, path = row
+        try:
+            try:
+                ok = self.handler(username, cid, filename, content or b"", path, lambda: self._renew(job_id))
+                error = None if ok else "processing returned failure"
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+            if self._finish(job_id, attempts, error):
+                if error is None:
+                    logger.info(f"RAG ingestion job {job_id} done: {filename} for user {username}")
+            elif self._take_cancelled(job_id):
+                # The deletion that cancelled the job may have run before its last batch was indexed
+                logger.info(f"RAG ingestion job {job_id} cancelled: {filename} for user {username}")
+                if self.on_cancelled is not None:
+                    self.on_cancelled(username, cid, path)
+            else:
+                logger.warning(f"RAG ingestion job {job_id} is no longer held by this worker; dropping its result")
+        finally:
+            # Still held while undoing, so no other job of the user starts in between
+            with self._active_lock:
+                self._active_users.discard(username)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if time.time() >= self._next_purge:
+                    self._next_purge = time.time() + PURGE_INTERVAL_SECONDS
+                    self.purge()
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"RAG ingestion worker error: {e}")
+            with self._wakeup:
+                self._wakeup.wait(IDLE_POLL_SECONDS)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"rag-ingest-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+ingest_queue = None
+
+
+def _ingest(username: str, cid: str, filename: str, content: bytes, path: Optional[str],
+            checkpoint: Callable[[], bool]) -> bool:
+    from backend.rag_utils import get_rag_manager
+    return get_rag_manager().process_file_for_rag(content, filename, username, cid, path, checkpoint=checkpoint)
+
+
+def _undo_cancelled(username: str, cid: str, path: Optional[str]):
+    """Repeat the deletion of a cancelled job's file or user, unless the file is back in the tree."""
+    from backend.RSDB_kv_service import get_kv
+    from backend.node import Node
+    from backend.rag_utils import get_rag_manager
+    root_json = get_kv(username + " ROOT")
+    if not root_json or not root_json.strip():
+        get_rag_manager().delete_user_store(username)
+    elif path and Node.from_json(root_json).find_node_by_path(path) is None:
+        get_rag_manager().delete_file_vectors(username, [path])
+
+
+def get_ingest_queue() -> IngestQueue:
+    """Get global RAG ingestion queue instance"""
+    global ingest_queue
+    if ingest_queue is None:
+        ingest_queue = IngestQueue(_ingest, on_cancelled=_undo_cancelled)
+    return ingest_queue
@@ -1,18 +1,303 @@
+import json
+import logging
 import os
-import requests
+import random
+import threading
+import time
 from io import BytesIO
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config/ipfs.config')
+
+# (connect, read) timeouts in seconds per operation
+ADD_TIMEOUT = (5, 120)
+STATUS_TIMEOUT = (3.05, 10)
+DOWNLOAD_TIMEOUT = (3.05, 10)
+
+RETRY_ATTEMPTS = int(os.environ.get('IPFS_RETRY_ATTEMPTS', '3'))
+RETRY_BACKOFF = float(os.environ.get('IPFS_RETRY_BACKOFF', '0.25'))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+POOL_SIZE = int(os.environ.get('IPFS_POOL_SIZE', '16'))
+# How long a gateway that just failed is moved to the back of the line
+GATEWAY_COOLDOWN = 30.0
+
+
+class LatencyStats:
+    """Thread-safe call/error/latency counters for one operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            avg = self.total_ms / self.calls if self.calls else 0.0
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'avg_ms': round(avg, 2),
+                'max_ms': round(self.max_ms, 2),
+            }
+
+
+class _Gateway:
+    def __init__(self, url: str):
+        self.url = url
+        self.ewma_ms: Optional[float] = None
+        self.failed_at = 0.0
+        self.stats = LatencyStats()
+
+    def observe(self, elapsed_ms: float, ok: bool):
+        self.stats.record(elapsed_ms, ok)
+        if ok:
+            self.ewma_ms = elapsed_ms if self.ewma_ms is None else 0.8 * self.ewma_ms + 0.2 * elapsed_ms
+        else:
+            self.failed_at = time.monotonic()
+
+
+class IPFSClient:
+    """
+    Pooled HTTP client for the IPFS Cluster REST API and one or more IPFS gateways.
+
+    Idempotent reads are retried with exponential backoff; downloads fail over across
+    gateways, trying the fastest recently healthy gateway first.
+    """
+
+    def __init__(self, cluster_api_url: str, gateway_urls: List[str],
+                 retry_attempts: int = RETRY_ATTEMPTS, retry_backoff: float = RETRY_BACKOFF,
+                 pool_size: int = POOL_SIZE):
+        if not gateway_urls:
+            raise ValueError("At least one IPFS gateway URL is required")
+        self.cluster_api_url = self._with_slash(cluster_api_url)
+        self.gateways = [_Gateway(self._with_slash(url)) for url in gateway_urls]
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_backoff = retry_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.gateways) + 1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
-ipfs_cluster_api_url = None
-ipfs_gateway_url = None
+        self._gateway_lock = threading.Lock()
+        self.stats = {
+            'add': LatencyStats(),
+            'status': LatencyStats(),
+            'bulk_status': LatencyStats(),
+            'pin': LatencyStats(),
+            'download': LatencyStats(),
+        }
 
+    @staticmethod
+    def _with_slash(url: str) -> str:
+        return url if url.endswith('/') else url + '/'
 
-def read_config_file():
-    global ipfs_cluster_api_url, ipfs_gateway_url
-    base_dir = os.path.dirname(__file__)
-    config_path = os.path.join(base_dir, 'config/ipfs.config')
-    with open(config_path) as f:
-        ipfs_cluster_api_url = f.readline().strip()
-        ipfs_gateway_url = f.readline().strip()
+    @classmethod
+    def from_config(cls, config_path: str = CONFIG_PATH) -> 'IPFSClient':
+        """
+        Build a client from ipfs.config: the first line is the cluster API URL, every
+        following non-empty line (or comma-separated entry) is a gateway URL.
+        IPFS_CLUSTER_API_URL / IPFS_GATEWAY_URLS environment variables take precedence.
+        """
+        with open(config_path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        cluster_api_url = os.environ.get('IPFS_CLUSTER_API_URL') or lines[0]
+        gateway_setting = os.environ.get('IPFS_GATEWAY_URLS') or ",".join(lines[1:])
+        gateway_urls = [url.strip() for url in gateway_setting.split(',') if url.strip()]
+        return cls(cluster_api_url, gateway_urls)
+
+    def _backoff(self, attempt: int):
+        delay = self.retry_backoff * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def _get_with_retry(self, url: str, timeout, **kwargs) -> requests.Response:
+        """GET with retry on connection errors and retryable status codes."""
+        last_error = None
+        for attempt in range(self.retry_attempts):
+            try:
+                response = self.session.get(url, timeout=timeout, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retry_attempts - 1:
+                    return response
+                response.close()
+                last_error = requests.exceptions.HTTPError(f"Retryable status {response.status_code}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+                if attempt == self.retry_attempts - 1:
+                    raise
+            self._backoff(attempt)
+        raise last_error
+
+    def add_file(self, file_obj, filename: str) -> Optional[str]:
+        """
+        Adds a file to the IPFS Cluster. Not retried: the upload stream is consumed.
+
+        :return: CID if successful, else None
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.post(self.cluster_api_url + "add",
+                                         files={'file': (filename, file_obj)},
+                                         timeout=ADD_TIMEOUT)
+            if response.status_code != 200:
+                logger.error(f"IPFS add failed for {filename}: {response.status_code} {response.text}")
+                return None
+            cid = response.json()['cid']
+            ok = True
+            return cid['/'] if isinstance(cid, dict) else cid
+        except requests.exceptions.RequestException as e:
+            logger.error(f"IPFS add failed for {filename}: {e}")
+            return None
+        finally:
+            self.stats['add'].record((time.perf_counter() - start) * 1000, ok)
+
+    def get_status(self, cid: str) -> Optional[Dict]:
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = self._get_with_retry(f"{self.cluster_api_url}pins/{cid}", STATUS_TIMEOUT)
+            if response.status_code != 200:
+                logger.warning(f"Failed to get file status from IPFS Cluster: {response.status_code} {response.text}")
+                return None
+            ok = True
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to get file status from IPFS Cluster: {e}")
+            return None
+        finally:
+            self.stats['status'].record((time.perf_counter() - start) * 1000, ok)
+
+    def get_statuses(self, cids: List[str]) -> Optional[Dict[str, Dict]]:
+        """
+        Bulk pin status for a batch of CIDs in a single request.
+
+        :return: {cid: GlobalPinInfo} for every CID the cluster knows about, or None on failure
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = self._get_with_retry(f"{self.cluster_api_url}pins", STATUS_TIMEOUT,
+                                            params={'cids': ",".join(cids)})
+            if response.status_code != 200:
+                logger.warning(f"Bulk pin status failed: {response.status_code} {response.text}")
+                return None
+            body = response.text.strip()
+            # Cluster >= 1.0 streams NDJSON; older versions return a JSON array
+            if body.startswith('['):
+                infos = json.loads(body)
+            else:
+                infos = [json.loads(line) for line in body.splitlines() if line.strip()]
+            statuses = {}
+            for info in infos:
+                cid = info.get('cid')
+                cid = cid.get('/') if isinstance(cid, dict) else cid
+                if cid:
+                    statuses[cid] = info
+            ok = True
+            return statuses
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Bulk pin status failed: {e}")
+            return None
+        finally:
+            self.stats['bulk_status'].record((time.perf_counter() - start) * 1000, ok)
+
+    def pin(self, cid: str, recover: bool = False) -> bool:
+        """Pin a CID in the cluster, or ask the cluster to recover a failed pin."""
+        url = f"{self.cluster_api_url}pins/{cid}" + ("/recover" if recover else "")
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = self.session.post(url, timeout=STATUS_TIMEOUT)
+            ok = response.status_code in (200, 202)
+            if not ok:
+                logger.warning(f"Pin request for {cid} failed: {response.status_code} {response.text}")
+            return ok
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Pin request for {cid} failed: {e}")
+            return False
+        finally:
+            self.stats['pin'].record((time.perf_counter() - start) * 1000, ok)
+
+    def _ordered_gateways(self) -> List[_Gateway]:
+        """Healthy gateways first, fastest EWMA first; unmeasured gateways get tried early."""
+        now = time.monotonic()
+        with self._gateway_lock:
+            return sorted(
+                self.gateways,
+                key=lambda g: (now - g.failed_at < GATEWAY_COOLDOWN,
+                               g.ewma_ms if g.ewma_ms is not None else 0.0),
+            )
+
+    def download(self, cid: str) -> Dict:
+        """
+        Downloads a file through the gateways, failing over in latency order.
+
+        :return: dict with success flag and BytesIO stream or error message
+        """
+        start = time.perf_counter()
+        errors = []
+        for gateway in self._ordered_gateways():
+            attempt_start = time.perf_counter()
+            try:
+                response = self._get_with_retry(f"{gateway.url}ipfs/{cid}", DOWNLOAD_TIMEOUT, stream=True)
+                if response.status_code == 200:
+                    buffer = BytesIO()
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        buffer.write(chunk)
+                    buffer.seek(0)
+                    with self._gateway_lock:
+                        gateway.observe((time.perf_counter() - attempt_start) * 1000, True)
+                    self.stats['download'].record((time.perf_counter() - start) * 1000, True)
+                    return {"success": True, "file": buffer}
+                errors.append(f"{gateway.url}: {response.status_code}, {response.text}")
+            except requests.exceptions.RequestException as e:
+                errors.append(f"{gateway.url}: {e}")
+            with self._gateway_lock:
+                gateway.observe((time.perf_counter() - attempt_start) * 1000, False)
+
+        self.stats['download'].record((time.perf_counter() - start) * 1000, False)
+        return {"success": False, "message": "Download failed: " + "; ".join(errors)}
+
+    def get_metrics(self) -> Dict:
+        with self._gateway_lock:
+            gateways = [{
+                'url': g.url,
+                'ewma_ms': round(g.ewma_ms, 2) if g.ewma_ms is not None else None,
+                **g.stats.to_dict(),
+            } for g in self.gateways]
+        return {
+            'operations': {name: stats.to_dict() for name, stats in self.stats.items()},
+            'gateways': gateways,
+        }
+
+
+_ipfs_client = None
+_ipfs_client_lock = threading.Lock()
+
+
+def get_ipfs_client() -> IPFSClient:
+    """Get global IPFS client instance"""
+    global _ipfs_client
+    if _ipfs_client is None:
+        with _ipfs_client_lock:
+            if _ipfs_client is None:
+                _ipfs_client = IPFSClient.from_config()
+    return _ipfs_client
 
 
 def add_file_to_cluster(file_obj, filename):
@@ -23,33 +308,11 @@ def add_file_to_cluster(file_obj, filename):
     :param filename: Name of the file to be uploaded.
     :return: CID if successful, else None
     """
-    if ipfs_cluster_api_url is None or ipfs_gateway_url is None:
-        read_config_file()
-
-    url = ipfs_cluster_api_url + "add"
-    files = {'file': (filename, file_obj)}
-    response = requests.post(url, files=files)
-
-    if response.status_code == 200:
-        cid = response.json()['cid']
-        return cid['/'] if isinstance(cid, dict) else cid
-    else:
-        return None
+    return get_ipfs_client().add_file(file_obj, filename)
 
 
 def get_file_status(cid):
-    if ipfs_cluster_api_url is None or ipfs_gateway_url is None:
-        read_config_file()
-
-    url = f"{ipfs_cluster_api_url}pins/{cid}"
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print("Failed to get file status from IPFS Cluster.")
-        print(response.text)
-        return None
+    return get_ipfs_client().get_status(cid)
 
 
 def download_file_from_ipfs(cid):
@@ -59,22 +322,4 @@ def download_file_from_ipfs(cid):
     :param cid: The CID of the file
     :return: dict with success flag and BytesIO stream or error message
     """
-    if ipfs_cluster_api_url is None or ipfs_gateway_url is None:
-        read_config_file()
-
-    url = f"{ipfs_gateway_url}ipfs/{cid}"
-    print(f"Download URL: {url}")
-
-    try:
-        response = requests.get(url, stream=True, timeout=10)
-        if response.status_code == 200:
-            buffer = BytesIO()
-            for chunk in response.iter_content(chunk_size=8192):
-                buffer.write(chunk)
-            buffer.seek(0)
-            return {"success": True, "file": buffer}
-        else:
-            error = f"Download failed: {response.status_code}, {response.text}"
-            return {"success": False, "message": error}
-    except requests.exceptions.RequestException as e:
-        return {"success": False, "message": str(e)}
\ No newline at end of file
+    return get_ipfs_client().download(cid)
@@ -0,0 +1,21 @@
+import threading
+from typing import Dict, Tuple
+
+_registry_lock = threading.Lock()
+_user_locks: Dict[Tuple[str, str], threading.RLock] = {}
+
+
+def get_user_lock(username: str, namespace: str = "tree") -> threading.RLock:
+    """
+    Per-process lock serializing read-modify-write cycles on one user's data.
+
+    namespace separates independent resources, e.g. "tree" for the ROOT node
+    stored in the KV service.
+    """
+    key = (namespace, username)
+    with _registry_lock:
+        lock = _user_locks.get(key)
+        if lock is None:
+            lock = threading.RLock()
+            _user_locks[key] = lock
+        return lock
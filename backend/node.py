@@ -51,6 +51,40 @@ class Node:
             node = node.children[part]
         return node
 
+    def normalize_path(self, path):
+        """Path below this folder without slashes or this folder's own leading name ('root/a/b' -> 'a/b')."""
+        parts = [part for part in path.strip("/").split("/") if part]
+        if parts and parts[0] == self.name:
+            parts = parts[1:]
+        return "/".join(parts)
+
+    def ensure_folder_path(self, relative_path):
+        """
+        Walk relative_path below this folder, creating missing folders on the way.
+        Returns the deepest folder, or None if a path component is an existing file.
+        """
+        node = self
+        for part in [p for p in relative_path.strip("/").split("/") if p]:
+            if not node.is_folder:
+                return None
+            child = node.children.get(part)
+            if child is None:
+                child = Node(part, is_folder=True)
+                node.add_child(child)
+            node = child
+        return node if node.is_folder else None
+
+    def iter_files(self, current_path=''):
+        """Yield (relative_path, node) for every file node below this folder."""
+        if not self.is_folder:
+            return
+        for child_name, child_node in self.children.items():
+            child_path = f"{current_path}/{child_name}" if current_path else child_name
+            if child_node.is_folder:
+                yield from child_node.iter_files(child_path)
+            elif child_node.file_obj:
+                yield child_path, child_node
+
     def to_dict(self):
         node_dict = {
             "name": self.name,
@@ -65,6 +99,9 @@ class Node:
                 "filename": self.file_obj.filename,
                 "creation_date": self.file_obj.creation_date.isoformat()
             }
+            if self.file_obj.pin_status is not None:
+                node_dict["file_obj"]["pin_status"] = self.file_obj.pin_status
+                node_dict["file_obj"]["replicas"] = self.file_obj.replicas
         return node_dict
 
     def to_json(self):
@@ -82,7 +119,9 @@ class Node:
                 cid=file_data["cid"],
                 size=file_data["size"],
                 filename=file_data["filename"],
-                creation_date=datetime.fromisoformat(file_data["creation_date"])
+                creation_date=datetime.fromisoformat(file_data["creation_date"]),
+                pin_status=file_data.get("pin_status"),
+                replicas=file_data.get("replicas")
             )
             node = cls(data["name"], is_folder=False, file_obj=file_obj)
         return node
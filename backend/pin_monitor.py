@@ -0,0 +1,236 @@
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from backend.RSDB_kv_service import get_kv, set_kv
+from backend.ipfs import get_ipfs_client
+from backend.locks import get_user_lock
+from backend.node import Node
+
+logger = logging.getLogger(__name__)
+
+PIN_STATUS_PINNING = 'pinning'
+PIN_STATUS_PINNED = 'pinned'
+PIN_STATUS_ERROR = 'error'
+PIN_STATUS_UNPINNED = 'unpinned'
+PIN_STATUS_STALLED = 'stalled'  # still pinning when the monitor stopped watching it
+
+POLL_INTERVAL = float(os.environ.get('PIN_MONITOR_INTERVAL', '15'))
+BATCH_SIZE = int(os.environ.get('PIN_MONITOR_BATCH_SIZE', '100'))
+# CIDs being watched, shared by the app's processes; the one holding <path>.lock polls them
+PIN_MONITOR_DB_PATH = os.environ.get('PIN_MONITOR_DB_PATH', 'backend/vector_db/pin_monitor.sqlite')
+MAX_REPIN_ATTEMPTS = 3
+# Stop watching a CID that never settles this many seconds after its upload
+TRACK_TTL = 6 * 3600
+
+_ERROR_STATES = {'pin_error', 'cluster_error', 'error', 'unpin_error'}
+_IN_PROGRESS_STATES = {'pinning', 'pin_queued', 'queued'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracked (
+    cid TEXT NOT NULL,
+    username TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    repin_attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (cid, username)
+);
+"""
+
+
+def summarize_pin_info(info: Optional[Dict]) -> Tuple[str, int]:
+    """Collapse a cluster GlobalPinInfo into (status, replicas)."""
+    if not info:
+        return PIN_STATUS_UNPINNED, 0
+
+    peer_statuses = [peer.get('status', '') for peer in (info.get('peer_map') or {}).values()]
+    replicas = sum(1 for status in peer_statuses if status == 'pinned')
+
+    if any(status in _ERROR_STATES for status in peer_statuses):
+        return PIN_STATUS_ERROR, replicas
+    if any(status in _IN_PROGRESS_STATES for status in peer_statuses):
+        return PIN_STATUS_PINNING, replicas
+    if replicas:
+        return PIN_STATUS_PINNED, replicas
+    return PIN_STATUS_UNPINNED, 0
+
+
+class PinMonitor:
+    """
+    Background worker that watches recently uploaded CIDs until the cluster reports
+    them pinned, querying statuses in batches and re-pinning failures. Settled states
+    are written onto the File metadata in each owner's tree, so listings carry the
+    status without any cluster round trip on the request path.
+
+    Watched CIDs are kept in SQLite, so every process started with the monitor can
+    track its uploads, and they survive restarts. Only the process holding the lock
+    file polls the cluster; another takes over if it exits. A CID still pinning
+    TRACK_TTL after its upload is recorded as 'stalled' and no longer watched.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, batch_size: int = BATCH_SIZE,
+                 db_path: str = PIN_MONITOR_DB_PATH):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.db_path = db_path
+        self._local = threading.local()
+        self._leader_file = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def track(self, username: str, cid: str):
+        self._connection().execute(
+            "INSERT OR IGNORE INTO tracked (cid, username, first_seen) VALUES (?, ?, ?)",
+            (cid, username, time.time()))
+
+    def tracked_count(self) -> int:
+        return self._connection().execute("SELECT COUNT(DISTINCT cid) FROM tracked").fetchone()[0]
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    @property
+    def leader(self) -> bool:
+        """Whether this process is the one polling the cluster."""
+        return self._leader_file is not None
+
+    def upload_status(self) -> Optional[str]:
+        """pin_status for a new upload: 'pinning' if the monitor will settle it, else unknown."""
+        return PIN_STATUS_PINNING if self.running else None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pin-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _lead(self) -> bool:
+        """Take the leader lock if no other process holds it; True while this process holds it."""
+        if self._leader_file is None:
+            lock_file = open(f"{self.db_path}.lock", 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._leader_file = lock_file
+            logger.info("This process now polls pin statuses")
+        return True
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._lead():
+                        self.poll_once()
+                except Exception as e:
+                    logger.error(f"Pin monitor poll failed: {e}")
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+        finally:
+            if self._leader_file is not None:
+                self._leader_file.close()  # releases the lock
+                self._leader_file = None
+
+    def poll_once(self):
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT cid, MIN(first_seen), MAX(repin_attempts) FROM tracked GROUP BY cid").fetchall()
+        if not rows:
+            return
+
+        client = get_ipfs_client()
+        settled: Dict[str, Dict[str, Tuple[str, int]]] = {}
+        done: List[str] = []
+
+        for offset in range(0, len(rows), self.batch_size):
+            batch = rows[offset:offset + self.batch_size]
+            infos = client.get_statuses([cid for cid, _, _ in batch])
+            if infos is None:
+                continue
+
+            for cid, first_seen, repin_attempts in batch:
+                status, replicas = summarize_pin_info(infos.get(cid))
+                final = self._handle_status(client, cid, status, first_seen, repin_attempts)
+                if final is None:
+                    continue
+                done.append(cid)
+                for (username,) in conn.execute("SELECT username FROM tracked WHERE cid = ?", (cid,)):
+                    settled.setdefault(username, {})[cid] = (final, replicas)
+
+        for username, updates in settled.items():
+            self._record(username, updates)
+        conn.executemany("DELETE FROM tracked WHERE cid = ?", [(cid,) for cid in done])
+
+    def _handle_status(self, client, cid: str, status: str, first_seen: float,
+                       repin_attempts: int) -> Optional[str]:
+        """Re-pin when needed; return the status to persist once the CID is settled."""
+        if status == PIN_STATUS_PINNED:
+            return status
+
+        expired = time.time() - first_seen > TRACK_TTL
+        if status == PIN_STATUS_PINNING:
+            if expired:
+                logger.warning(f"CID {cid} is still pinning after {TRACK_TTL}s; no longer watching it")
+                return PIN_STATUS_STALLED
+            return None
+
+        if repin_attempts >= MAX_REPIN_ATTEMPTS or expired:
+            return PIN_STATUS_ERROR
+        attempt = repin_attempts + 1
+        self._connection().execute("UPDATE tracked SET repin_attempts = ? WHERE cid = ?", (attempt, cid))
+
+        logger.warning(f"CID {cid} is {status}; re-pin attempt {attempt}/{MAX_REPIN_ATTEMPTS}")
+        client.pin(cid, recover=(status == PIN_STATUS_ERROR))
+        return None
+
+    def _record(self, username: str, updates: Dict[str, Tuple[str, int]]):
+        with get_user_lock(username):
+            root_json = get_kv(username + " ROOT")
+            if not root_json or not root_json.strip():
+                return
+            root = Node.from_json(root_json)
+
+            changed = False
+            for _, file_node in root.iter_files():
+                update = updates.get(file_node.file_obj.cid)
+                if update is None:
+                    continue
+                file_node.file_obj.pin_status, file_node.file_obj.replicas = update
+                changed = True
+
+            if changed:
+                set_kv(username + " ROOT", root.to_json())
+        logger.info(f"Recorded pin status for {len(updates)} CID(s) of user {username}")
+
+
+pin_monitor = None
+
+
+def get_pin_monitor() -> PinMonitor:
+    """Get global pin monitor instance"""
+    global pin_monitor
+    if pin_monitor is None:
+        pin_monitor = PinMonitor()
+    return pin_monitor
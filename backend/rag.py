@@ -0,0 +1,19 @@
+"""
+Lazy entry points to the RAG stack.
+
+backend.rag_utils pulls in faiss, numpy and the embedding and vector store modules;
+routes import these getters instead so that cost is paid on the first RAG request,
+not at startup by every worker (including deployments that never use chat).
+"""
+
+
+def get_rag_manager():
+    """Get global RAG manager instance, importing the RAG stack on first use"""
+    from backend.rag_utils import get_rag_manager as _get_rag_manager
+    return _get_rag_manager()
+
+
+def get_llm_integration():
+    """Get global LLM integration instance, importing the RAG stack on first use"""
+    from backend.rag_utils import get_llm_integration as _get_llm_integration
+    return _get_llm_integration()
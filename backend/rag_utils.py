@@ -1,23 +1,79 @@
+import heapq
 import os
 import json
-import pickle
-from typing import List, Dict
-from io import BytesIO
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 import logging
 
-import PyPDF2
-from docx import Document
 import requests
-import faiss
 import numpy as np
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document as LangchainDocument
+from backend.embedding_cache import EmbeddingCache, embedding_key
+from backend.embeddings import (
+    EMBEDDING_PROVIDER,
+    estimate_tokens,
+    PROVIDER_GEMINI,
+    EmbeddingError,
+    EmbeddingProvider,
+    create_embedding_provider,
+)
+from backend.locks import get_user_lock
+from backend.context_packing import pack_context
+from backend.hybrid_search import is_exact_term_query, reciprocal_rank_fusion
+from backend.query_cache import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL,
+    RETRIEVAL_CACHE_SIZE,
+    RETRIEVAL_CACHE_TTL,
+    SHARE_FILTER_CACHE_SIZE,
+    SHARE_FILTER_CACHE_TTL,
+    TTLCache,
+    normalize_query,
+)
+from backend.share_manager import ShareManager
+from backend.shared_vector_store import (
+    SHARED_DIR_NAME,
+    VECTOR_STORE_SHARED,
+    SharedVectorStore,
+    ShardVectorStore,
+    TenantVectorStore,
+)
+from backend.ingest_pipeline import RAG_STREAM_BATCH_CHUNKS, batched, iter_chunks, prefetch
+from backend.text_extraction import get_text_extractor
+from backend.text_splitter import RecursiveTextSplitter
+from backend.vector_cache import VectorIndexCache
+from backend.chunk_store import ChunkMetadataStore
+from backend.vector_store import CHUNKS_NAME, UserVectorStore, migrate_legacy_store
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBED_CACHE_ENABLED = os.environ.get('EMBED_CACHE_ENABLED', 'true').lower() == 'true'
+# Changing these makes existing vector stores stale: rebuild them with python -m backend.reindex
+EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '768'))
+RAG_CHUNK_SIZE = int(os.environ.get('RAG_CHUNK_SIZE', '800'))
+RAG_CHUNK_OVERLAP = int(os.environ.get('RAG_CHUNK_OVERLAP', '100'))
+DOCUMENT_TASK_TYPE = "RETRIEVAL_DOCUMENT"
+# Answer generation model; the read timeout bounds the wait for the reply (or, streamed, for each piece)
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.5-flash')
+LLM_TIMEOUT = (5, float(os.environ.get('LLM_TIMEOUT_SECONDS', '120')))
+# Estimated tokens of document context per prompt, and the cap on answer tokens
+LLM_CONTEXT_TOKENS = int(os.environ.get('LLM_CONTEXT_TOKENS', '1500'))
+LLM_MAX_OUTPUT_TOKENS = int(os.environ.get('LLM_MAX_OUTPUT_TOKENS', '2048'))
+# Threads searching the indices of the user and of the users sharing files with them
+FEDERATED_SEARCH_WORKERS = int(os.environ.get('RAG_FEDERATED_SEARCH_WORKERS', '8'))
+# Chat retrieval fuses the keyword (BM25) ranking with the vector ranking
+HYBRID_SEARCH = os.environ.get('RAG_HYBRID_SEARCH', 'true').lower() == 'true'
+# How long chat retrieval waits for the query embedding before answering from keywords alone
+QUERY_EMBED_TIMEOUT = float(os.environ.get('RAG_QUERY_EMBED_TIMEOUT_SECONDS', '3'))
+
+
 class RAGManager:
     """
     Manages RAG (Retrieval-Augmented Generation) functionality for the file sharing app.
@@ -26,30 +82,68 @@ class RAGManager:
     
     def __init__(self, vector_db_path: str = "backend/vector_db", 
                  embedding_model: str = "gemini-embedding-001", 
-                 embedding_dimension: int = 768):
+                 embedding_dimension: int = EMBEDDING_DIMENSION,
+                 embedder: Optional[EmbeddingProvider] = None,
+                 chunk_size: int = RAG_CHUNK_SIZE, chunk_overlap: int = RAG_CHUNK_OVERLAP,
+                 embedding_cache_path: Optional[str] = None, shared_store: bool = VECTOR_STORE_SHARED):
         """
         Initialize RAG Manager
         
         Args:
             vector_db_path: Path to store vector databases
             embedding_model: Gemini embedding model name
-            embedding_dimension: Output embedding dimension (768, 1536, or 3072)
+            embedding_dimension: Output embedding dimension (768, 1536, or 3072 for Gemini)
+            embedder: Embedding provider; by default the one selected by EMBEDDING_PROVIDER
+            chunk_size: Target characters per chunk
+            chunk_overlap: Characters repeated between consecutive chunks
+            embedding_cache_path: Embedding cache database; by default in vector_db_path
+            shared_store: Keep all users' vectors in the sharded shared store instead of one
+                store per user; per-user stores are moved into it on first use
         """
         self.vector_db_path = vector_db_path
         self.embedding_model_name = embedding_model
         self.embedding_dimension = embedding_dimension
         self.api_key = os.getenv('GOOGLE_API_KEY')
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=100,
-            length_function=len,
+        self.text_splitter = RecursiveTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
+        # Identifies the chunking settings in the per-CID chunk cache
+        self.splitter_id = f"recursive:{chunk_size}:{chunk_overlap}"
         
         os.makedirs(self.vector_db_path, exist_ok=True)
+        self.shared_store = SharedVectorStore(os.path.join(vector_db_path, SHARED_DIR_NAME)) if shared_store else None
         
-        self._setup_gemini_api()
+        # Loaded stores by username, or shards of the shared store by ('shard', path)
+        self.index_cache = VectorIndexCache()
+        # Index rebuilds (type upgrades such as flat -> HNSW, dropping deleted vectors) run
+        # one at a time off the request path
+        self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-rebuild")
+        self._pending_rebuilds = set()
+        self._rebuild_lock = threading.Lock()
+        self.embedder = embedder or create_embedding_provider(EMBEDDING_PROVIDER, embedding_model,
+                                                              embedding_dimension, self.api_key)
+        # Identifies the embedding space in cache keys
+        self.embedding_model_name = self.embedder.model
+        self.embedding_dimension = self.embedder.dimension
+        self.query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
+        self.retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        # Vector ids of the chunks a share list exposes, per sender store version
+        self.share_filter_cache = TTLCache(SHARE_FILTER_CACHE_SIZE, SHARE_FILTER_CACHE_TTL)
+        self._search_executor = ThreadPoolExecutor(max_workers=FEDERATED_SEARCH_WORKERS,
+                                                   thread_name_prefix="federated-search")
+        # Query embeddings for chat retrieval; one that outlives QUERY_EMBED_TIMEOUT still
+        # finishes here and fills the query embedding cache
+        self._query_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+        self.embedding_cache = None
+        if EMBED_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_path or os.path.join(self.vector_db_path, "embedding_cache.sqlite"))
+        
+        if embedder is None and EMBEDDING_PROVIDER == PROVIDER_GEMINI:
+            self._setup_gemini_api()
     
     def _setup_gemini_api(self):
         """Setup Gemini API configuration (no client needed for REST API)"""
@@ -69,52 +163,12 @@ class RAGManager:
         Returns:
             Extracted text content
         """
-        file_extension = filename.lower().split('.')[-1]
-        
         try:
-            if file_extension == 'pdf':
-                return self._extract_from_pdf(file_content)
-            elif file_extension == 'docx':
-                return self._extract_from_docx(file_content)
-            elif file_extension == 'txt':
-                return self._extract_from_txt(file_content)
-            else:
-                logger.warning(f"Unsupported file type: {file_extension}")
-                return ""
+            return get_text_extractor().extract(file_content, filename)
         except Exception as e:
             logger.error(f"Failed to extract text from {filename}: {e}")
             return ""
     
-    def _extract_from_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF file"""
-        text = ""
-        try:
-            pdf_reader = PyPDF2.PdfReader(BytesIO(file_content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        except Exception as e:
-            logger.error(f"PDF extraction error: {e}")
-        return text.strip()
-    
-    def _extract_from_docx(self, file_content: bytes) -> str:
-        """Extract text from DOCX file"""
-        text = ""
-        try:
-            doc = Document(BytesIO(file_content))
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-        except Exception as e:
-            logger.error(f"DOCX extraction error: {e}")
-        return text.strip()
-    
-    def _extract_from_txt(self, file_content: bytes) -> str:
-        """Extract text from TXT file"""
-        try:
-            return file_content.decode('utf-8', errors='ignore')
-        except Exception as e:
-            logger.error(f"TXT extraction error: {e}")
-            return ""
-    
     def chunk_text(self, text: str, metadata: Dict) -> List[Dict]:
         """
         Split text into chunks with metadata
@@ -129,16 +183,21 @@ class RAGManager:
         if not text.strip():
             return []
         
-        doc = LangchainDocument(page_content=text, metadata=metadata)
-        
-        chunks = self.text_splitter.split_documents([doc])
-        
+        return self._build_chunks(self.text_splitter.split_text(text), metadata)
+    
+    def iter_chunk_texts(self, file_content: bytes, filename: str) -> Iterator[str]:
+        """Chunk texts of a file, extracted and split incrementally so memory does not grow with its size"""
+        segments = get_text_extractor().iter_text(file_content, filename)
+        return iter_chunks(segments, self.text_splitter)
+    
+    def _build_chunks(self, texts: List[str], metadata: Dict, start_index: int = 0) -> List[Dict]:
+        """Attach file metadata and chunk numbering (from start_index) to chunk texts"""
         chunk_dicts = []
-        for i, chunk in enumerate(chunks):
+        for i, chunk_text in enumerate(texts, start=start_index):
             chunk_dict = {
-                'text': chunk.page_content,
+                'text': chunk_text,
                 'metadata': {
-                    **chunk.metadata,
+                    **metadata,
                     'chunk_index': i,
                     'chunk_id': f"{metadata.get('filename', 'unknown')}_{i}"
                 }
@@ -149,101 +208,201 @@ class RAGManager:
     
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
-        Generate embeddings for a list of texts using Gemini API batch processing
+        Generate embeddings for a list of texts with the configured embedding provider
         
         Args:
             texts: List of text chunks
             
         Returns:
-            Numpy array of embeddings
+            Numpy array of embeddings (empty on failure)
         """
         if not texts:
             return np.array([])
         
         logger.info(f"Generating embeddings for {len(texts)} texts")
         
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            logger.error("GOOGLE_API_KEY not found in environment variables")
-            return np.array([])
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        keys = [embedding_key(self.embedding_model_name, self.embedding_dimension, DOCUMENT_TASK_TYPE, text)
+                for text in texts]
+        if self.embedding_cache is not None:
+            try:
+                cached = self.embedding_cache.get_many(keys, self.embedding_dimension)
+                vectors = [cached.get(key) for key in keys]
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed: {e}")
         
-        logger.info(f"Using Gemini API with model: {self.embedding_model_name}, dimension: {self.embedding_dimension}")
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            try:
+                fresh = self.embedder.embed([texts[i] for i in missing], DOCUMENT_TASK_TYPE)
+            except EmbeddingError as e:
+                logger.error(f"Failed to generate embeddings with {self.embedding_model_name}: {e}")
+                return np.array([])
+            for position, i in enumerate(missing):
+                vectors[i] = fresh[position]
+            if self.embedding_cache is not None:
+                try:
+                    self.embedding_cache.put_many([keys[i] for i in missing], fresh)
+                except Exception as e:
+                    logger.warning(f"Embedding cache write failed: {e}")
         
+        logger.info(f"Embeddings for {len(texts)} texts: {len(texts) - len(missing)} from cache")
+        return np.array(vectors, dtype=np.float32)
+    
+    def get_embedding_stats(self) -> Dict:
+        """Throughput and retry counters of the embedding provider, and embedding cache hit rate"""
+        stats = self.embedder.metrics.to_dict()
+        stats['model'] = self.embedding_model_name
+        if self.embedding_cache is not None:
+            stats['cache'] = self.embedding_cache.stats()
+        return stats
+    
+    def get_user_vector_db_path(self, username: str) -> str:
+        """Get the path for a user's vector store directory"""
+        return os.path.join(self.vector_db_path, username)
+    
+    def _migrate_legacy_files(self, username: str):
+        """Move a pre-WAL '<user>.faiss' / '<user>_metadata.pkl' pair into the store layout"""
+        legacy_index_path = os.path.join(self.vector_db_path, f"{username}.faiss")
+        legacy_metadata_path = os.path.join(self.vector_db_path, f"{username}_metadata.pkl")
         try:
-            url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-embedding-001:batchEmbedContents"
-            
-            headers = {
-                "x-goog-api-key": api_key,
-                "Content-Type": "application/json"
-            }
-            
-            requests_data = []
-            for text in texts:
-                requests_data.append({
-                    "model": "models/gemini-embedding-001",
-                    "content": {
-                        "parts": [{"text": text}]
-                    },
-                    "task_type": "RETRIEVAL_DOCUMENT",
-                    "output_dimensionality": self.embedding_dimension
-                })
-            
-            data = {"requests": requests_data}
-            
-            logger.info(f"Embedding request payload count: {len(requests_data)}")
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"Embedding API responded with keys: {list(result.keys())}")
-            
-            embeddings = []
-            api_embeddings = result.get("embeddings", [])
-            logger.info(f"Embedding objects returned: {len(api_embeddings)}")
-            for embedding_response in api_embeddings:
-                embedding_values = np.array(embedding_response["values"])
-                if self.embedding_dimension < 3072:  # Normalize for truncated dimensions
-                    embedding_values = embedding_values / np.linalg.norm(embedding_values)
-                embeddings.append(embedding_values)
-            
-            if len(embeddings) != len(texts):
-                logger.info(f"Mismatch: expected {len(texts)} embeddings, got {len(embeddings)}")
-                return np.array([])
-            
-            embeddings_np = np.array(embeddings)
-            logger.info(f"Built embeddings array with shape {embeddings_np.shape}")
-            return embeddings_np
-            
-        except requests.exceptions.Timeout:
-            logger.error("Gemini API timeout during batch embedding generation")
-            return np.array([])
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Gemini API request failed: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"Response status: {e.response.status_code}")
-                logger.error(f"Response body: {e.response.text}")
-            return np.array([])
+            migrate_legacy_store(legacy_index_path, legacy_metadata_path,
+                                 self.get_user_vector_db_path(username), self.embedding_dimension)
         except Exception as e:
-            logger.error(f"Failed to generate embeddings with Gemini API: {e}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return np.array([])
+            logger.error(f"Failed to migrate legacy vector DB for '{username}': {e}")
     
-    def get_user_vector_db_path(self, username: str) -> str:
-        """Get the path for a user's vector database"""
-        return os.path.join(self.vector_db_path, f"{username}.faiss")
+    def get_user_store(self, username: str, create: bool = False) -> Optional[UserVectorStore]:
+        """
+        Get a user's vector store through the in-memory cache, picking up writes from other
+        processes; None if they have none yet, unless create
+        """
+        if self.shared_store is not None:
+            return self._get_tenant_store(username, create)
+        store_path = self.get_user_vector_db_path(username)
+        if not UserVectorStore.exists(store_path):
+            self.index_cache.invalidate(username)  # dropped, e.g. by a user deletion in another process
+            self._migrate_legacy_files(username)
+            if not create and not UserVectorStore.exists(store_path):
+                return None
+        
+        def loader():
+            store = UserVectorStore.open(store_path, self.embedding_dimension)
+            logger.info(f"Loaded vector store for '{username}' from disk: ntotal={store.ntotal}")
+            if store.dimension != self.embedding_dimension:
+                logger.error(f"Vector store of '{username}' holds {store.dimension}-dimensional vectors, "
+                             f"not {self.embedding_dimension}; rebuild it with python -m backend.reindex")
+            return store, store.memory_bytes()
+        
+        store = self.index_cache.get(username, loader)
+        store.refresh()
+        return store
+    
+    def _cache_key(self, username: str):
+        if self.shared_store is None:
+            return username
+        return ('shard', self.shared_store.shard_path(username))
+    
+    def _cache_store(self, username: str, store):
+        """Keep a user's store (their shard, with the shared store) in the index cache at its current size"""
+        cached = store.shard if isinstance(store, TenantVectorStore) else store
+        self.index_cache.put(self._cache_key(username), cached, store.memory_bytes())
+    
+    def _get_shard(self, username: str, create: bool = False) -> Optional[ShardVectorStore]:
+        """The shard of the shared store holding a user's vectors, through the in-memory cache"""
+        shard_path = self.shared_store.shard_path(username)
+        if not UserVectorStore.exists(shard_path):
+            self.index_cache.invalidate(self._cache_key(username))
+            if not create:
+                return None
+        
+        def loader():
+            shard = ShardVectorStore.open(shard_path, self.embedding_dimension)
+            logger.info(f"Loaded shared vector store shard {shard_path} from disk: ntotal={shard.ntotal}")
+            return shard, shard.memory_bytes()
+        
+        shard = self.index_cache.get(self._cache_key(username), loader)
+        shard.refresh()
+        return shard
+    
+    def _get_tenant_store(self, username: str, create: bool = False) -> Optional[TenantVectorStore]:
+        """A user's part of the shared store, after moving their own store (if any is left) into it"""
+        self._migrate_legacy_files(username)
+        if UserVectorStore.exists(self.get_user_vector_db_path(username)):
+            self._move_into_shared(username)
+        shard = self._get_shard(username, create)
+        if shard is None:
+            return None
+        store = TenantVectorStore(shard, username)
+        if not create and not store.exists():
+            return None
+        return store
+    
+    def _move_into_shared(self, username: str):
+        """Copy a user's own store into their shard of the shared store, without re-embedding, and delete it"""
+        with get_user_lock(username, "vector_db"):
+            shard = self._get_shard(username, create=True)
+            try:
+                store = UserVectorStore.open(self.get_user_vector_db_path(username), self.embedding_dimension)
+                moved = store.move_out(lambda vectors, chunks: shard.append(vectors, chunks, username))
+            except Exception as e:
+                logger.error(f"Failed to move the vector store of '{username}' into the shared store: {e}")
+                return
+            self.index_cache.invalidate(username)
+            self._cache_store(username, TenantVectorStore(shard, username))
+        logger.info(f"Moved {moved} vectors of '{username}' into shared vector store shard {shard.path}")
+    
+    def get_cache_stats(self) -> Dict:
+        """Hit rate, load time and memory use of the index cache"""
+        return self.index_cache.stats()
     
-    def get_user_metadata_path(self, username: str) -> str:
-        """Get the path for a user's metadata file"""
-        return os.path.join(self.vector_db_path, f"{username}_metadata.pkl")
+    def get_query_cache_stats(self) -> Dict:
+        """Hit rates of the query embedding and retrieval result caches"""
+        return {
+            'query_embeddings': self.query_embedding_cache.stats(),
+            'retrieval': self.retrieval_cache.stats(),
+            'share_filters': self.share_filter_cache.stats(),
+        }
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Normalized (1, dimension) embedding of a search query, cached by normalized text"""
+        key = (self.embedding_model_name, self.embedding_dimension, normalize_query(query))
+        query_embedding = self.query_embedding_cache.get(key)
+        if query_embedding is not None:
+            return query_embedding
+        
+        query_embedding = self.generate_embeddings([" ".join(query.split())])
+        logger.info(f"Query embedding shape: {query_embedding.shape} (size={query_embedding.size})")
+        if query_embedding.size == 0:
+            return query_embedding
+        
+        qe_norms = np.linalg.norm(query_embedding, axis=1)
+        query_embedding = query_embedding / np.maximum(qe_norms, 1e-12)[:, None]
+        self.query_embedding_cache.put(key, query_embedding)
+        return query_embedding
+    
+    def _embed_query_within(self, query: str, timeout: float) -> Optional[np.ndarray]:
+        """Query embedding, or None if it fails or takes longer than timeout seconds"""
+        future = self._query_embed_executor.submit(self.embed_query, query)
+        try:
+            query_embedding = future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            logger.warning(f"Query embedding took over {timeout}s, searching by keywords only")
+            return None
+        except Exception as e:
+            logger.warning(f"Query embedding failed, searching by keywords only: {e}")
+            return None
+        return query_embedding if query_embedding.size else None
     
-    def add_chunks_to_vector_db(self, username: str, chunks: List[Dict]) -> bool:
+    def add_chunks_to_vector_db(self, username: str, chunks: List[Dict],
+                                guard: Optional[Callable[[], bool]] = None) -> bool:
         """
         Add text chunks to user's vector database
         
         Args:
             username: User identifier
             chunks: List of chunk dictionaries
+            guard: Checked under the user's store lock right before appending; nothing is
+                added if it returns False (e.g. the file was deleted meanwhile)
             
         Returns:
             Success boolean
@@ -260,41 +419,107 @@ class RAGManager:
             if embeddings.size == 0:
                 return False
             
-            faiss_index_path = self.get_user_vector_db_path(username)
-            metadata_path = self.get_user_metadata_path(username)
-            
-            if os.path.exists(faiss_index_path):
-                index = faiss.read_index(faiss_index_path)
-                with open(metadata_path, 'rb') as f:
-                    existing_metadata = pickle.load(f)
-                logger.info(f"Loaded existing FAISS index for '{username}' with ntotal={index.ntotal}")
-            else:
-                index = faiss.IndexFlatIP(self.embedding_dimension)  # Inner product (cosine similarity)
-                existing_metadata = []
-                logger.info(f"Created new FAISS index with dimension d={self.embedding_dimension}")
-            
             # Normalize embeddings for cosine similarity
             norms = np.linalg.norm(embeddings, axis=1)
             logger.info(f"Embedding norms before normalization: min={norms.min():.6f}, max={norms.max():.6f}")
             safe_denominator = np.maximum(norms, 1e-12)[:, None]
             embeddings = embeddings / safe_denominator
-            logger.info(f"Adding {embeddings.shape[0]} vectors to FAISS index")
-            index.add(embeddings)
-            
-            existing_metadata.extend(chunks)
             
-            faiss.write_index(index, faiss_index_path)
-            with open(metadata_path, 'wb') as f:
-                pickle.dump(existing_metadata, f)
+            with get_user_lock(username, "vector_db"):
+                if guard is not None and not guard():
+                    logger.info(f"Not adding {len(chunks)} chunks for '{username}': cancelled")
+                    return False
+                store = self.get_user_store(username, create=True)
+                try:
+                    logger.info(f"Appending {embeddings.shape[0]} vectors to vector store")
+                    store.append(embeddings, chunks)
+                except Exception:
+                    self.index_cache.invalidate(self._cache_key(username))
+                    raise
+                self._cache_store(username, store)
             
-            logger.info(f"Indexed chunks for '{username}': ntotal now {index.ntotal}; metadata entries {len(existing_metadata)}")
+            logger.info(f"Indexed chunks for '{username}': ntotal now {store.ntotal}")
+            if store.needs_migration():
+                self._schedule_rebuild(username, store)
             return True
             
         except Exception as e:
             logger.error(f"Failed to add chunks to vector DB: {e}")
             return False
     
-    def search_user_vector_db(self, username: str, query: str, top_k: int = 5) -> List[Dict]:
+    def wait_for_rebuilds(self):
+        """Block until the index rebuilds scheduled so far have finished"""
+        self._rebuild_executor.submit(lambda: None).result()
+    
+    def _schedule_rebuild(self, username: str, store: UserVectorStore):
+        """Rebuild a user's index (or shard) in the background: as the type suited to its size, without deleted vectors"""
+        key = self._cache_key(username)
+        with self._rebuild_lock:
+            if key in self._pending_rebuilds:
+                return
+            self._pending_rebuilds.add(key)
+        
+        def rebuild():
+            try:
+                store.rebuild()
+                if UserVectorStore.exists(store.path):
+                    self._cache_store(username, store)
+            except Exception as e:
+                logger.error(f"Index rebuild failed for '{username}': {e}")
+            finally:
+                with self._rebuild_lock:
+                    self._pending_rebuilds.discard(key)
+        
+        self._rebuild_executor.submit(rebuild)
+    
+    def delete_file_vectors(self, username: str, paths: List[str], cids: List[str] = ()) -> int:
+        """
+        Remove deleted files from a user's index
+        
+        Args:
+            username: User identifier
+            paths: Tree paths of the deleted files
+            cids: CIDs no longer referenced anywhere in the user's tree, for chunks indexed without a path
+            
+        Returns:
+            Number of chunks removed
+        """
+        with get_user_lock(username, "vector_db"):
+            store = self.get_user_store(username)
+            if store is None:
+                return 0
+            removed = store.delete(paths, cids)
+        if removed:
+            logger.info(f"Removed {removed} chunks of {len(paths)} deleted files for '{username}'")
+            if store.needs_compaction():
+                self._schedule_rebuild(username, store)
+        return removed
+    
+    def delete_user_store(self, username: str):
+        """Drop a user's whole vector store, e.g. when the account is deleted"""
+        if self.shared_store is not None:
+            with get_user_lock(username, "vector_db"):
+                store = self.get_user_store(username)
+                removed = store.delete_all() if store is not None else 0
+            if removed and store.needs_compaction():
+                self._schedule_rebuild(username, store)
+            logger.info(f"Deleted {removed} chunks of '{username}' from the shared vector store")
+            return
+        with get_user_lock(username, "vector_db"):
+            self.index_cache.invalidate(username)
+            # Waits for a background rebuild holding the store's file lock, which then skips it
+            UserVectorStore.remove(self.get_user_vector_db_path(username))
+            for legacy_name in (f"{username}.faiss", f"{username}_metadata.pkl"):
+                legacy_path = os.path.join(self.vector_db_path, legacy_name)
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+        # A new store under the same name starts at version 0 again
+        self.retrieval_cache.clear()
+        self.share_filter_cache.clear()
+        logger.info(f"Deleted vector store of '{username}'")
+    
+    def search_user_vector_db(self, username: str, query: str, top_k: int = 5,
+                              ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> List[Dict]:
         """
         Search user's vector database for relevant chunks
         
@@ -302,43 +527,35 @@ class RAGManager:
             username: User identifier
             query: Search query
             top_k: Number of results to return
+            ef_search: HNSW search breadth override (higher is more accurate and slower)
+            nprobe: IVF lists to probe override (higher is more accurate and slower)
             
         Returns:
             List of relevant chunks with scores
         """
-        faiss_index_path = self.get_user_vector_db_path(username)
-        metadata_path = self.get_user_metadata_path(username)
-        
-        if not os.path.exists(faiss_index_path) or not os.path.exists(metadata_path):
-            logger.info(f"No vector DB for '{username}' yet (missing index or metadata)")
-            return []
-        
         try:
-            index = faiss.read_index(faiss_index_path)
-            with open(metadata_path, 'rb') as f:
-                metadata = pickle.load(f)
-            logger.info(f"Searching FAISS for '{username}': ntotal={index.ntotal}, top_k={top_k}, metadata={len(metadata)}")
+            store = self.get_user_store(username)
+            if store is None:
+                logger.info(f"No vector DB for '{username}' yet")
+                return []
+            logger.info(f"Searching FAISS for '{username}': ntotal={store.ntotal}, top_k={top_k}")
             
-            query_embedding = self.generate_embeddings([query])
-            logger.info(f"Query embedding shape: {query_embedding.shape} (size={query_embedding.size})")
+            # The store version is part of the key, so any write to the index retires old results
+            cache_key = (username, store.version, normalize_query(query), top_k, ef_search, nprobe)
+            cached_results = self.retrieval_cache.get(cache_key)
+            if cached_results is not None:
+                logger.info(f"Retrieval cache hit for '{username}'")
+                return list(cached_results)
+            
+            query_embedding = self.embed_query(query)
             if query_embedding.size == 0:
                 return []
             
-            qe_norms = np.linalg.norm(query_embedding, axis=1)
-            logger.info(f"Query embedding norm before normalization: {qe_norms[0]:.6f}")
-            query_embedding = query_embedding / np.maximum(qe_norms, 1e-12)[:, None]
-            
-            scores, indices = index.search(query_embedding, min(top_k, index.ntotal))
-            logger.info(f"Search returned {len(indices[0]) if len(indices)>0 else 0} results")
+            hits = store.search(query_embedding, top_k, ef_search=ef_search, nprobe=nprobe)
+            logger.info(f"Search returned {len(hits)} results")
             
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx >= 0 and idx < len(metadata):
-                    result = {
-                        'chunk': metadata[idx],
-                        'score': float(score)
-                    }
-                    results.append(result)
+            results = [{'chunk': chunk, 'score': score} for score, chunk in hits]
+            self.retrieval_cache.put(cache_key, results)
             if results:
                 logger.info(f"Top result score={results[0]['score']:.6f} from file={results[0]['chunk']['metadata'].get('filename','unknown')}")
             
@@ -348,7 +565,125 @@ class RAGManager:
             logger.error(f"Failed to search vector DB: {e}")
             return []
     
-    def process_file_for_rag(self, file_content: bytes, filename: str, username: str, cid: str) -> bool:
+    def _share_filter(self, owner: str, store: UserVectorStore, share_version: str,
+                      scopes: List[Tuple[str, bool]]) -> np.ndarray:
+        """Vector ids of the owner's chunks in the shared files and folders, cached per share list and store version"""
+        key = (owner, share_version, store.version)
+        allowed = self.share_filter_cache.get(key)
+        if allowed is None:
+            allowed = np.array(store.chunks.live_ids_under(scopes), dtype=np.int64)
+            self.share_filter_cache.put(key, allowed)
+        return allowed
+    
+    def search_accessible_vector_dbs(self, username: str, query: str, top_k: int = 5,
+                                     share_manager: Optional[ShareManager] = None,
+                                     ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> List[Dict]:
+        """
+        Search the user's own vector database and those of the users who shared files with
+        them, restricted to the shared files and folders, concurrently
+        
+        With hybrid search, the vector and keyword (BM25) rankings are fused by reciprocal
+        rank and scores are fused ranks in (0, 1]. Identifier-like queries are answered from
+        the keyword index alone when it matches; if the query embedding fails or is slow,
+        the results come from the keyword index and are not cached.
+        
+        Args:
+            username: User identifier
+            query: Search query
+            top_k: Number of results to return, across all searched databases
+            share_manager: The user's share list; None searches only their own files
+            ef_search: HNSW search breadth override
+            nprobe: IVF lists to probe override
+            
+        Returns:
+            List of relevant chunks with scores and the username owning each ('owner'), best first
+        """
+        try:
+            scopes = share_manager.shared_scopes() if share_manager is not None else {}
+            scopes.pop(username, None)  # own files are searched in full anyway
+            owners = [username] + sorted(scopes)
+            if len(owners) == 1:
+                found = [self.get_user_store(username)]
+            else:
+                found = list(self._search_executor.map(self.get_user_store, owners))
+            stores = {owner: store for owner, store in zip(owners, found) if store is not None}
+            if not stores:
+                logger.info(f"No vector DB for '{username}' or users sharing with them yet")
+                return []
+            
+            share_version = share_manager.version() if scopes else ""
+            cache_key = (username, share_version, tuple((owner, store.version) for owner, store in stores.items()),
+                         normalize_query(query), top_k, ef_search, nprobe)
+            cached_results = self.retrieval_cache.get(cache_key)
+            if cached_results is not None:
+                logger.info(f"Retrieval cache hit for '{username}' across {len(stores)} stores")
+                return list(cached_results)
+            
+            def search_store(owner: str, query_embedding: Optional[np.ndarray], lexical: bool):
+                store = stores[owner]
+                scope = scopes.get(owner) if owner != username else None
+                vector_hits, lexical_hits = [], []
+                if query_embedding is not None:
+                    allowed = None
+                    if scope is not None:
+                        allowed = self._share_filter(owner, store, share_version, scope)
+                        if not len(allowed):
+                            return [], []
+                    vector_hits = store.search(query_embedding, candidates, ef_search=ef_search, nprobe=nprobe,
+                                               allowed_ids=allowed)
+                if lexical:
+                    lexical_hits = store.lexical_search(query, candidates, scope)
+                return ([(score, owner, chunk) for score, chunk in vector_hits],
+                        [(score, owner, chunk) for score, chunk in lexical_hits])
+            
+            def search_stores(query_embedding: Optional[np.ndarray], lexical: bool):
+                vector_hits, lexical_hits = [], []
+                if len(stores) == 1:
+                    found = [search_store(next(iter(stores)), query_embedding, lexical)]
+                else:
+                    futures = {owner: self._search_executor.submit(search_store, owner, query_embedding, lexical)
+                               for owner in stores}
+                    found = []
+                    for owner, future in futures.items():
+                        try:
+                            found.append(future.result())
+                        except Exception as e:
+                            logger.error(f"Search of the vector DB of '{owner}' failed: {e}")
+                for vector, lexical_found in found:
+                    vector_hits.extend(vector)
+                    lexical_hits.extend(lexical_found)
+                return (heapq.nlargest(candidates, vector_hits, key=lambda hit: hit[0]),
+                        heapq.nlargest(candidates, lexical_hits, key=lambda hit: hit[0]))
+            
+            # Fusion reranks a longer list of each kind than is returned
+            candidates = max(2 * top_k, 10) if HYBRID_SEARCH else top_k
+            degraded = False
+            best = []
+            if HYBRID_SEARCH and is_exact_term_query(query):
+                # File names and identifiers resolve from the keyword index, without an embedding
+                best = reciprocal_rank_fusion([search_stores(None, True)[1]], top_k)
+            if not best:
+                query_embedding = self._embed_query_within(query, QUERY_EMBED_TIMEOUT)
+                degraded = query_embedding is None
+                vector_ranking, lexical_ranking = search_stores(query_embedding, HYBRID_SEARCH or degraded)
+                if HYBRID_SEARCH or degraded:
+                    best = reciprocal_rank_fusion([vector_ranking, lexical_ranking], top_k)
+                else:
+                    best = vector_ranking[:top_k]
+            
+            results = [{'chunk': chunk, 'score': score, 'owner': owner} for score, owner, chunk in best]
+            logger.info(f"Federated search for '{username}' over {len(stores)} stores returned {len(results)} results"
+                        + (" (keywords only)" if degraded else ""))
+            if not degraded:
+                self.retrieval_cache.put(cache_key, results)
+            return results
+            
+        except Exception as e:
+            logger.error(f"Failed to search accessible vector DBs: {e}")
+            return []
+    
+    def process_file_for_rag(self, file_content: bytes, filename: str, username: str, cid: str,
+                             path: Optional[str] = None, checkpoint: Optional[Callable[[], bool]] = None) -> bool:
         """
         Complete pipeline to process a file for RAG
         
@@ -357,69 +692,165 @@ class RAGManager:
             filename: Name of the file
             username: User who uploaded the file
             cid: IPFS CID of the file
+            path: Path of the file in the user's tree, used to remove its chunks on delete
+            checkpoint: Called before and after each indexed batch (e.g. to renew an ingest
+                job's lease); processing stops without indexing more if it returns False
             
         Returns:
             Success boolean
         """
         try:
-            text = self.extract_text_from_file(file_content, filename)
-            if not text.strip():
-                logger.info(f"No text extracted from {filename}")
-                return True
-            
             metadata = {
                 'username': username,
                 'filename': filename,
                 'cid': cid,
                 'file_type': filename.lower().split('.')[-1]
             }
+            if path:
+                metadata['path'] = path
             
-            chunks = self.chunk_text(text, metadata)
-            if not chunks:
-                logger.info(f"No chunks created from {filename}")
-                return True
-            
-            success = self.add_chunks_to_vector_db(username, chunks)
+            # Same CID seen before (by anyone): reuse its chunks; their vectors are in the embedding cache
+            cached_texts = None
+            if self.embedding_cache is not None and cid:
+                cached_texts = self.embedding_cache.get_document_chunks(cid, self.splitter_id)
             
-            if success:
-                logger.info(f"Successfully processed {filename} for RAG: {len(chunks)} chunks")
+            if cached_texts is not None:
+                logger.info(f"Reusing {len(cached_texts)} cached chunks of CID {cid} for {filename}")
+                chunk_texts = iter(cached_texts)
+            else:
+                chunk_texts = self.iter_chunk_texts(file_content, filename)
             
-            return success
+            total = self._ingest_chunk_stream(username, chunk_texts, metadata,
+                                              cache_chunks=cached_texts is None and self.embedding_cache is not None,
+                                              checkpoint=checkpoint)
+            if total is None:
+                return False
+            if total == 0:
+                logger.info(f"No chunks created from {filename}")
+            else:
+                logger.info(f"Successfully processed {filename} for RAG: {total} chunks")
+            return True
             
         except Exception as e:
             logger.error(f"Failed to process file for RAG: {e}")
             return False
     
+    def _ingest_chunk_stream(self, username: str, chunk_texts: Iterable[str], metadata: Dict,
+                             cache_chunks: bool, checkpoint: Optional[Callable[[], bool]] = None) -> Optional[int]:
+        """
+        Embed and index a document's chunks batch by batch, so each batch is searchable as
+        soon as it is appended and memory stays bounded; extraction and chunking of the next
+        batches run ahead in a background thread.
+        
+        Chunks already indexed for this file by an earlier, interrupted attempt (a retried
+        ingest job) are skipped: each appended batch is a durable checkpoint.
+        
+        Returns:
+            Number of chunks in the document, or None if a batch failed to index or
+            checkpoint asked to stop
+        """
+        cid = metadata.get('cid')
+        store = self.get_user_store(username)
+        done = store.chunks.document_chunk_count(metadata.get('path'), cid) if store is not None else 0
+        if done:
+            logger.info(f"Resuming {metadata.get('filename')} after {done} already indexed chunks")
+        
+        total = 0
+        for batch in prefetch(batched(chunk_texts, RAG_STREAM_BATCH_CHUNKS)):
+            start = total
+            total += len(batch)
+            skip = min(max(done - start, 0), len(batch))
+            if skip < len(batch):
+                if not self.add_chunks_to_vector_db(username, self._build_chunks(batch[skip:], metadata, start + skip),
+                                                    guard=checkpoint):
+                    return None
+            if cache_chunks and cid:
+                self.embedding_cache.put_document_chunks(cid, self.splitter_id, batch, start=start, complete=False)
+            if checkpoint is not None and not checkpoint():
+                logger.warning(f"Stopped indexing {metadata.get('filename')} after {total} chunks")
+                return None
+        
+        if cache_chunks and cid and total:
+            self.embedding_cache.put_document_chunks(cid, self.splitter_id, [], start=total)
+        return total
+    
     def get_user_stats(self, username: str) -> Dict:
         """Get statistics about user's vector database"""
-        metadata_path = self.get_user_metadata_path(username)
-        
         stats = {
             'total_chunks': 0,
             'total_files': 0,
             'files': []
         }
         
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'rb') as f:
-                    metadata = pickle.load(f)
-                
-                stats['total_chunks'] = len(metadata)
-                
-                files = set()
-                for chunk in metadata:
-                    files.add(chunk['metadata']['filename'])
-                
-                stats['total_files'] = len(files)
-                stats['files'] = list(files)
+        try:
+            chunks_path = os.path.join(self.get_user_vector_db_path(username), CHUNKS_NAME)
+            if self.shared_store is None and os.path.exists(chunks_path):
+                # Stats only need the per-file aggregates, not the vectors
+                chunk_store = ChunkMetadataStore(chunks_path)
+                file_counts = chunk_store.file_counts()
+                chunk_store.close()
+            else:
+                store = self.get_user_store(username)  # migrates older layouts if present
+                file_counts = store.chunks.file_counts() if store is not None else {}
+            
+            if file_counts:
+                stats['total_chunks'] = sum(file_counts.values())
+                stats['total_files'] = len(file_counts)
+                stats['files'] = list(file_counts)
                 
-            except Exception as e:
-                logger.error(f"Failed to get user stats: {e}")
+        except Exception as e:
+            logger.error(f"Failed to get user stats: {e}")
         
         return stats
 
 
+class LLMMetrics:
+    """Answer generation counters: total time, estimated prompt tokens and time to first token of streamed answers."""
+    
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.streams = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.prompt_tokens = 0
+        # Most recent times to first token, for percentiles
+        self._first_token_ms = deque(maxlen=window)
+    
+    def record(self, elapsed_ms: float, ok: bool, prompt_tokens: int = 0, first_token_ms: Optional[float] = None,
+               streamed: bool = False, cancelled: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            if streamed:
+                self.streams += 1
+            if cancelled:
+                self.cancelled += 1
+            elif not ok:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if first_token_ms is not None:
+                self._first_token_ms.append(first_token_ms)
+    
+    def to_dict(self) -> Dict:
+        with self._lock:
+            first_token = sorted(self._first_token_ms)
+            return {
+                'calls': self.calls,
+                'streams': self.streams,
+                'errors': self.errors,
+                'cancelled': self.cancelled,
+                'avg_ms': round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+                'max_ms': round(self.max_ms, 2),
+                'avg_prompt_tokens': round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+                'first_token_p50_ms': round(first_token[len(first_token) // 2], 2) if first_token else None,
+                'first_token_p95_ms': round(first_token[int(len(first_token) * 0.95)], 2) if first_token else None,
+            }
+
+
 class LLMIntegration:
     """
     Handles integration with Language Models for generating responses
@@ -434,17 +865,50 @@ class LLMIntegration:
             api_key: API key for external services
         """
         self.model_type = model_type
+        self.model_name = LLM_MODEL if model_type == "gemini" else "extractive"
+        self.metrics = LLMMetrics()
+        # Answers by (model, query, chunks in the prompt, answer length cap)
+        self.answer_cache = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
         
         if model_type == "gemini" and api_key:
             self.api_key = api_key
     
-    def generate_answer(self, query: str, context_chunks: List[Dict], max_tokens: int = 5000) -> str:
+    def _build_prompt(self, query: str, passages: List[Dict]) -> str:
+        context_text = "\n\n".join([
+            f"From {passage['filename']}:\n{passage['text']}"
+            for passage in passages
+        ])
+        
+        return f"""Based on the following context from the user's uploaded files, please answer their question. If the context doesn't contain enough information to answer the question, please say so.
+
+Context:
+{context_text}
+
+Question: {query}
+
+Answer:"""
+    
+    def _prepare(self, query: str, context_chunks: List[Dict], max_tokens: int):
+        """Prompt packed from the chunks within the context budget, and the answer cache key for it"""
+        passages = pack_context(context_chunks, LLM_CONTEXT_TOKENS)
+        chunk_ids = tuple(key for passage in passages for key in passage['chunks'])
+        cache_key = (self.model_name, normalize_query(query), chunk_ids, max_tokens)
+        return self._build_prompt(query, passages), cache_key
+    
+    def get_stats(self) -> Dict:
+        """Answer latency and prompt size counters, and answer cache hit rate"""
+        stats = self.metrics.to_dict()
+        stats['model'] = self.model_name
+        stats['answer_cache'] = self.answer_cache.stats()
+        return stats
+    
+    def generate_answer(self, query: str, context_chunks: List[Dict], max_tokens: int = LLM_MAX_OUTPUT_TOKENS) -> str:
         """
         Generate an answer using retrieved context
         
         Args:
             query: User's question
-            context_chunks: Retrieved relevant chunks
+            context_chunks: Retrieved relevant chunks, best first
             max_tokens: Maximum tokens for response
             
         Returns:
@@ -453,63 +917,113 @@ class LLMIntegration:
         if not context_chunks:
             return "I couldn't find any relevant information in your uploaded files to answer this question."
         
-        context_text = "\n\n".join([
-            f"From {chunk['chunk']['metadata']['filename']}:\n{chunk['chunk']['text']}"
-            for chunk in context_chunks[:3]
-        ])
-        
-        prompt = f"""Based on the following context from the user's uploaded files, please answer their question. If the context doesn't contain enough information to answer the question, please say so.
-
-Context:
-{context_text}
-
-Question: {query}
-
-Answer:"""
+        prompt, cache_key = self._prepare(query, context_chunks, max_tokens)
+        answer = self.answer_cache.get(cache_key)
+        if answer is not None:
+            return answer
         
+        start = time.perf_counter()
         try:
             if self.model_type == "gemini":
-                return self._generate_gemini_response(prompt, max_tokens)
+                answer = self._generate_gemini_response(prompt, max_tokens)
             else:
-                return self._generate_simple_response(query, context_chunks)
+                answer = self._generate_simple_response(query, context_chunks)
+            self.metrics.record((time.perf_counter() - start) * 1000, True, estimate_tokens(prompt))
+            self.answer_cache.put(cache_key, answer)
+            return answer
         except Exception as e:
+            self.metrics.record((time.perf_counter() - start) * 1000, False, estimate_tokens(prompt))
             logger.error(f"Failed to generate LLM response: {e}")
             return "I encountered an error while generating the response. Please try again."
     
+    def stream_answer(self, query: str, context_chunks: List[Dict],
+                      max_tokens: int = LLM_MAX_OUTPUT_TOKENS) -> Iterator[str]:
+        """
+        Generate an answer using retrieved context, yielding pieces of it as the model produces them
+        
+        Closing the generator early (the client went away) closes the connection to the model,
+        which stops the generation. Errors are raised to the caller. A cached answer is
+        yielded whole.
+        
+        Args:
+            query: User's question
+            context_chunks: Retrieved relevant chunks, best first
+            max_tokens: Maximum tokens for response
+            
+        Yields:
+            Consecutive pieces of the answer text
+        """
+        if not context_chunks:
+            yield "I couldn't find any relevant information in your uploaded files to answer this question."
+            return
+        
+        prompt, cache_key = self._prepare(query, context_chunks, max_tokens)
+        answer = self.answer_cache.get(cache_key)
+        if answer is not None:
+            yield answer
+            return
+        
+        if self.model_type == "gemini":
+            pieces = self._stream_gemini_response(prompt, max_tokens)
+        else:
+            pieces = iter([self._generate_simple_response(query, context_chunks)])
+        
+        start = time.perf_counter()
+        first_token_ms = None
+        ok = cancelled = False
+        answer_pieces = []
+        try:
+            for piece in pieces:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                answer_pieces.append(piece)
+                yield piece
+            ok = True
+            self.answer_cache.put(cache_key, "".join(answer_pieces))
+        except GeneratorExit:
+            cancelled = True
+            raise
+        finally:
+            if hasattr(pieces, 'close'):
+                pieces.close()  # drops the connection to the model
+            self.metrics.record((time.perf_counter() - start) * 1000, ok, estimate_tokens(prompt), first_token_ms,
+                                streamed=True, cancelled=cancelled)
+    
+    def _gemini_request(self, prompt: str, max_tokens: int) -> Dict:
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompt
+                        }
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "maxOutputTokens": max_tokens
+            },
+            "systemInstruction": {
+                "parts": [
+                    {
+                        "text": "You are a helpful assistant that answers questions based on the provided context from user's documents."
+                    }
+                ]
+            }
+        }
+    
     def _generate_gemini_response(self, prompt: str, max_tokens: int) -> str:
         """Generate response using Gemini API"""
         try:
-            model_name = "gemini-2.5-flash"
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:generateContent"
 
             headers = {
                 "x-goog-api-key": self.api_key,
                 "Content-Type": "application/json"
             }
 
-            data = {
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ],
-                "generationConfig": {
-                    "maxOutputTokens": max_tokens
-                },
-                "systemInstruction": {
-                    "parts": [
-                        {
-                            "text": "You are a helpful assistant that answers questions based on the provided context from user's documents."
-                        }
-                    ]
-                }
-            }
-
-            response = requests.post(url, headers=headers, json=data)
+            response = requests.post(url, headers=headers, json=self._gemini_request(prompt, max_tokens),
+                                     timeout=LLM_TIMEOUT)
             response.raise_for_status()
 
             result = response.json()
@@ -519,6 +1033,27 @@ Answer:"""
             logger.error(f"Gemini API error: {e}")
             raise
     
+    def _stream_gemini_response(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        """Stream a response from the Gemini API as server-sent events, yielding the text of each"""
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model_name}:streamGenerateContent"
+        headers = {
+            "x-goog-api-key": self.api_key,
+            "Content-Type": "application/json"
+        }
+        
+        with requests.post(url, headers=headers, params={"alt": "sse"}, json=self._gemini_request(prompt, max_tokens),
+                           stream=True, timeout=LLM_TIMEOUT) as response:
+            response.raise_for_status()
+            # chunk_size=None hands over each chunk as it arrives instead of filling 512-byte reads
+            for line in response.iter_lines(chunk_size=None):
+                if not line.startswith(b"data:"):
+                    continue
+                event = json.loads(line[5:])
+                for candidate in event.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text') and not part.get('thought'):
+                            yield part['text']
+    
     def _generate_simple_response(self, query: str, context_chunks: List[Dict]) -> str:
         """Generate a simple extractive response when no LLM is available"""
         if not context_chunks:
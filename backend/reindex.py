@@ -0,0 +1,392 @@
+"""
+Rebuild users' vector stores under the current embedding, chunking and index settings.
+
+Stores written under other settings (EMBEDDING_PROVIDER, EMBEDDING_DIMENSION,
+RAG_CHUNK_SIZE / RAG_CHUNK_OVERLAP, VECTOR_INDEX_TYPE) do not match what the app embeds
+queries with. This re-embeds every supported file of a user's file tree, fetched by CID
+(or served from the embedding and chunk caches when the settings that matter to them are
+unchanged), into a new store built beside the live one under <vector db>/.reindex, and
+swaps it in with one rename. Files added or deleted meanwhile are caught up before the
+swap; search keeps using the old store until then. Stores of the original
+'<user>.faiss' + '<user>_metadata.pkl' format are converted first.
+
+A user keeps the old store if any file cannot be fetched or indexed (unless
+--drop-failed), and the next run retries just those files.
+
+Users are rebuilt in parallel, one per worker process. Progress is logged per user, so
+an interrupted run (Ctrl-C stops after the users in progress) picks up where it
+stopped; finished users are skipped until the settings change again or --restart. For a
+new provider or dimension, run this with the new settings, then restart the app with them.
+
+Users are the registered accounts (see user_authentication_service.list_users) and
+the owners of stores under the vector db directory; users without a file tree are
+skipped. Only per-user stores are rebuilt, not the shared store (VECTOR_STORE_SHARED);
+an app using it moves rebuilt per-user stores into it on first use.
+
+Run from the repository root:
+    python -m backend.reindex [--users alice bob] [--workers 4] [--embed-rate 50]
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from backend import ann_index, text_extraction
+from backend.embeddings import (
+    EMBED_REQUESTS_PER_MINUTE,
+    EMBEDDING_PROVIDER,
+    EmbeddingProvider,
+    GeminiEmbeddingClient,
+    TokenBucket,
+)
+from backend.rag_utils import EMBEDDING_DIMENSION, RAG_CHUNK_OVERLAP, RAG_CHUNK_SIZE, RAGManager
+from backend.vector_store import UserVectorStore, migrate_legacy_store
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = '.reindex'
+# Catch-up rounds for files added or deleted while a store is rebuilt before giving up on it
+SWAP_ATTEMPTS = 5
+# File types indexed on upload (see RAG_SUPPORTED_EXTENSIONS in the file controller)
+SUPPORTED_EXTENSIONS = {'pdf', 'docx', 'txt'}
+
+STATUS_SWAPPED = 'swapped'
+STATUS_SKIPPED = 'skipped'  # done by an earlier run under the same settings
+STATUS_DELETED = 'deleted'  # the user has no file tree (the account was deleted)
+STATUS_EMPTY = 'empty'  # no files to index and no store to replace
+STATUS_BUSY = 'busy'  # the live store kept changing; run again
+STATUS_FAILED = 'failed'  # some files could not be indexed; the old store is kept, run again
+
+Document = Tuple[Optional[str], str]  # (path, cid)
+
+
+class ThrottledEmbeddingProvider(EmbeddingProvider):
+    """Embeds through another provider at no more than rate texts per second."""
+
+    def __init__(self, provider: EmbeddingProvider, rate: float):
+        super().__init__()
+        self.provider = provider
+        self.model = provider.model
+        self.dimension = provider.dimension
+        self.metrics = provider.metrics
+        self.bucket = TokenBucket(rate, capacity=max(1.0, rate))
+
+    def embed(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> np.ndarray:
+        for start in range(0, len(texts), int(self.bucket.capacity)):
+            self.bucket.acquire(min(self.bucket.capacity, len(texts) - start))
+        return self.provider.embed(texts, task_type)
+
+
+_settings: Dict = {}
+_manager: Optional[RAGManager] = None
+
+
+def _init_worker(settings: Dict):
+    """Set up this process to rebuild stores: a RAGManager building them in the staging directory."""
+    global _settings, _manager
+    logging.getLogger().setLevel(settings['log_level'])
+    # Users are already spread over processes; extract in the worker itself
+    text_extraction.text_extractor = text_extraction.TextExtractor(workers=0)
+    _manager = RAGManager(vector_db_path=settings['staging_path'], embedding_dimension=settings['dimension'],
+                          chunk_size=settings['chunk_size'], chunk_overlap=settings['chunk_overlap'],
+                          embedding_cache_path=os.path.join(settings['vector_db_path'], "embedding_cache.sqlite"),
+                          shared_store=False)
+    if isinstance(_manager.embedder, GeminiEmbeddingClient):
+        # The API quota is per key, not per process
+        rate = EMBED_REQUESTS_PER_MINUTE / 60.0 / settings['workers']
+        _manager.embedder.rate_limiter = TokenBucket(rate, capacity=_manager.embedder.rate_limiter.capacity)
+    if settings['embed_rate'] > 0:
+        _manager.embedder = ThrottledEmbeddingProvider(_manager.embedder, settings['embed_rate'] / settings['workers'])
+    _settings = dict(settings, config={
+        'provider': EMBEDDING_PROVIDER,
+        'model': _manager.embedding_model_name,
+        'dimension': _manager.embedding_dimension,
+        'splitter': _manager.splitter_id,
+        'index_type': settings['index_type'],
+    })
+
+
+def _init_pool_worker(settings: Dict):
+    # Ctrl-C stops the run between users (see main), not in the middle of one
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(settings)
+
+
+def _read_progress(path: str, config: Dict) -> Optional[Tuple[Set[Document], bool]]:
+    """Files indexed by an earlier run under config and whether it swapped its store in, or None."""
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # torn tail of an interrupted run
+    except FileNotFoundError:
+        return None
+    if not records or records[0].get('config') != config:
+        return None
+    done = {(record['path'], record['cid']) for record in records[1:] if 'cid' in record}
+    return done, any(record.get('swapped') for record in records)
+
+
+def _log_progress(path: str, record: Dict):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _migrate_legacy(username: str):
+    """Convert the user's store from the original '<user>.faiss' + '<user>_metadata.pkl' files, if any."""
+    vector_db_path = _settings['vector_db_path']
+    migrate_legacy_store(os.path.join(vector_db_path, f"{username}.faiss"),
+                         os.path.join(vector_db_path, f"{username}_metadata.pkl"),
+                         os.path.join(vector_db_path, username), _settings['dimension'])
+
+
+def _tree_documents(username: str) -> Optional[Dict[Document, str]]:
+    """{(path, cid): filename} of the supported files in the user's file tree (None if they have none)."""
+    from backend.RSDB_kv_service import get_kv
+    from backend.node import Node
+
+    root_json = get_kv(username + " ROOT")
+    if not root_json or not root_json.strip():
+        return None
+    documents = {}
+    for path, node in Node.from_json(root_json).iter_files():
+        filename = node.file_obj.filename
+        if filename.lower().rsplit('.', 1)[-1] in SUPPORTED_EXTENSIONS:
+            documents[(path, node.file_obj.cid)] = filename
+    return documents
+
+
+def _index_document(username: str, path: Optional[str], cid: str, filename: str) -> Optional[str]:
+    """Index one file into the staging store, returning an error message on failure."""
+    from backend.ipfs import download_file_from_ipfs
+
+    content = b""
+    cache = _manager.embedding_cache
+    if cache is None or not cid or cache.get_document_chunks(cid, _manager.splitter_id) is None:
+        download = download_file_from_ipfs(cid)
+        if not download.get('success'):
+            return download.get('message', "download failed")
+        content = download['file'].read()
+    if not _manager.process_file_for_rag(content, filename, username, cid, path):
+        return "indexing failed"
+    return None
+
+
+def _finish(store: UserVectorStore):
+    """Write the staging store as one snapshot of the configured index type."""
+    _manager.wait_for_rebuilds()
+    live = store.ntotal - store.chunks.deleted_count()
+    store.rebuild(ann_index.choose_index_type(live, _settings['index_type']))
+
+
+def reindex_user(username: str) -> Dict:
+    """Rebuild one user's store beside the live one and swap it in."""
+    start = time.perf_counter()
+    live_path = os.path.join(_settings['vector_db_path'], username)
+    staging_path = _manager.get_user_vector_db_path(username)
+    progress_path = f"{staging_path}.progress"
+    result = {'username': username, 'status': STATUS_SWAPPED, 'documents': 0, 'chunks': 0, 'failed': {}}
+    _migrate_legacy(username)
+
+    progress = _read_progress(progress_path, _settings['config'])
+    if progress is None:
+        _discard(username)
+        _log_progress(progress_path, {'config': _settings['config']})
+        done: Set[Document] = set()
+    else:
+        done, swapped = progress
+        if swapped:
+            result['status'] = STATUS_SKIPPED
+            return result
+
+    failed: Dict[Document, str] = {}
+    for _ in range(SWAP_ATTEMPTS):
+        wanted = _tree_documents(username)
+        if wanted is None:
+            _discard(username)
+            result['status'] = STATUS_DELETED
+            return result
+        if not wanted and not UserVectorStore.exists(live_path):
+            _discard(username)
+            result['status'] = STATUS_EMPTY
+            return result
+
+        store = _manager.get_user_store(username, create=True)
+        indexed = {(path, cid) for path, cid, _ in store.chunks.documents()}
+        done &= indexed
+        stale = indexed - set(wanted)
+        if stale:
+            # Deleted meanwhile; chunks with a path are matched by path, older ones by CID
+            store.delete([path for path, _ in stale if path], [cid for path, cid in stale if not path])
+            done -= stale
+        for (path, cid), filename in wanted.items():
+            if (path, cid) in done or (path, cid) in failed:
+                continue
+            error = _index_document(username, path, cid, filename)
+            if error is None:
+                done.add((path, cid))
+                _log_progress(progress_path, {'path': path, 'cid': cid})
+            else:
+                logger.warning(f"Could not reindex {path or filename} of '{username}': {error}")
+                failed[(path, cid)] = error
+                store.delete([path] if path else [], [] if path else [cid])  # chunks of a partial attempt
+        if failed and not _settings['drop_failed']:
+            result.update(status=STATUS_FAILED, documents=len(done),
+                          failed={path or cid: error for (path, cid), error in failed.items()})
+            return result
+        _finish(store)
+
+        def unchanged() -> bool:
+            tree = _tree_documents(username)
+            indexed = {(path, cid) for path, cid, _ in store.chunks.documents()}
+            return tree is not None and indexed == set(tree) - set(failed)
+
+        result['documents'] = len(done)
+        result['chunks'] = store.ntotal - store.chunks.deleted_count()
+        if UserVectorStore.install(live_path, staging_path, unchanged):
+            break
+    else:
+        result['status'] = STATUS_BUSY
+        return result
+
+    _manager.index_cache.invalidate(username)
+    store.chunks.close()
+    UserVectorStore.remove(staging_path)  # now the old store
+    _log_progress(progress_path, {'swapped': True})
+    result['failed'] = {path or cid: error for (path, cid), error in failed.items()}
+    result['seconds'] = round(time.perf_counter() - start, 2)
+    return result
+
+
+def _discard(username: str):
+    """Drop the staging store of an earlier run."""
+    staging_path = _manager.get_user_vector_db_path(username)
+    _manager.index_cache.invalidate(username)
+    UserVectorStore.remove(staging_path)
+    shutil.rmtree(staging_path, ignore_errors=True)
+    if os.path.exists(f"{staging_path}.progress"):
+        os.remove(f"{staging_path}.progress")
+
+
+def list_users(vector_db_path: str) -> List[str]:
+    """Registered users and users with a vector store (of any format) under vector_db_path."""
+    from backend.user_authentication_service import list_users as registered_users
+
+    users = set(registered_users())
+    for name in os.listdir(vector_db_path):
+        if name.startswith('.'):
+            continue
+        if name.endswith('.faiss'):
+            users.add(name[:-len('.faiss')])
+        elif UserVectorStore.exists(os.path.join(vector_db_path, name)):
+            users.add(name)
+    return sorted(users)
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.reindex", description=__doc__.split("\n\n")[0])
+    parser.add_argument('--vector-db', default="backend/vector_db", help="directory of the user stores")
+    parser.add_argument('--users', nargs='+', help="only these users (default: every registered user or with a store)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="users rebuilt in parallel")
+    parser.add_argument('--embed-rate', type=float, default=0.0,
+                        help="chunks embedded per second across all workers (default: no limit beyond the provider's)")
+    parser.add_argument('--dimension', type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument('--chunk-size', type=int, default=RAG_CHUNK_SIZE)
+    parser.add_argument('--chunk-overlap', type=int, default=RAG_CHUNK_OVERLAP)
+    parser.add_argument('--index-type', default=ann_index.VECTOR_INDEX_TYPE,
+                        choices=('auto',) + ann_index.INDEX_TYPES)
+    parser.add_argument('--drop-failed', action='store_true',
+                        help="swap in stores without the files that could not be fetched or indexed")
+    parser.add_argument('--restart', action='store_true', help="discard the progress of earlier runs")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    staging_path = os.path.join(args.vector_db, STAGING_DIR)
+    if args.restart and os.path.isdir(staging_path):
+        shutil.rmtree(staging_path)
+    os.makedirs(staging_path, exist_ok=True)
+    users = args.users or list_users(args.vector_db)
+    if not users:
+        print(f"No users registered or with vector stores under {args.vector_db}")
+        return 0
+
+    workers = max(1, min(args.workers, len(users)))
+    settings = {
+        'vector_db_path': args.vector_db,
+        'staging_path': staging_path,
+        'workers': workers,
+        'embed_rate': args.embed_rate,
+        'dimension': args.dimension,
+        'chunk_size': args.chunk_size,
+        'chunk_overlap': args.chunk_overlap,
+        'index_type': args.index_type,
+        'drop_failed': args.drop_failed,
+        'log_level': logging.INFO if args.verbose else logging.WARNING,
+    }
+    print(f"Reindexing {len(users)} users with {workers} workers (dimension {args.dimension}, "
+          f"chunks {args.chunk_size}/{args.chunk_overlap}, index {args.index_type})", flush=True)
+
+    start = time.perf_counter()
+    problems = 0
+    pool = None
+    futures = {}
+    if workers == 1:
+        _init_worker(settings)
+        results = (_result_of(lambda: reindex_user(username), username) for username in users)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker, initargs=(settings,))
+        futures = {pool.submit(reindex_user, username): username for username in users}
+        results = (_result_of(future.result, futures[future]) for future in as_completed(futures))
+    try:
+        for number, result in enumerate(results, start=1):
+            elapsed = time.perf_counter() - start
+            eta = elapsed / number * (len(users) - number)
+            line = f"[{number}/{len(users)}] {result['username']}: {result['status']}"
+            if result['status'] == STATUS_SWAPPED:
+                line += f", {result['documents']} files, {result['chunks']} chunks in {result['seconds']}s"
+            if result.get('failed') or result.get('error'):
+                problems += 1
+                line += f", failed: {result.get('error') or result['failed']}"
+            elif result['status'] in (STATUS_BUSY, STATUS_FAILED):
+                problems += 1
+            print(f"{line} (elapsed {_format_seconds(elapsed)}, eta {_format_seconds(eta)})", flush=True)
+    except KeyboardInterrupt:
+        print("Interrupted: finishing the users in progress; run again to resume", flush=True)
+        return 130
+    finally:
+        for future in futures:
+            future.cancel()
+        if pool is not None:
+            pool.shutdown()
+    print(f"Done in {_format_seconds(time.perf_counter() - start)}; {problems} users with failed files "
+          f"or not swapped, see above")
+    return 1 if problems else 0
+
+
+def _result_of(run, username: str) -> Dict:
+    try:
+        return run()
+    except Exception as e:
+        return {'username': username, 'status': 'error', 'error': str(e)}
+
+
+if __name__ == '__main__':
+    sys.exit(main())
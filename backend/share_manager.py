@@ -1,3 +1,4 @@
+import hashlib
 import json
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
@@ -38,6 +39,26 @@ class ShareManager:
         )
         return ErrorCode.SUCCESS
 
+    def version(self) -> str:
+        """Digest of the share list; changes whenever an entry is added or removed."""
+        return hashlib.sha1(json.dumps(self.share_list, sort_keys=True).encode()).hexdigest()
+
+    def shared_scopes(self) -> Dict[str, List[Tuple[str, bool]]]:
+        """
+        {from_user: [(path, is_folder)]} of the shared entries, with paths relative to the
+        sender's root ('root/docs' -> 'docs') as their files are indexed for RAG.
+        """
+        scopes: Dict[str, List[Tuple[str, bool]]] = {}
+        for from_user, entries in self.share_list.items():
+            for entry in entries:
+                parts = self._normalize_path(entry.get("path", "")).split("/")
+                if parts[0] == "root":
+                    parts = parts[1:]
+                path = "/".join(part for part in parts if part)
+                if path:
+                    scopes.setdefault(from_user, []).append((path, bool(entry.get("is_folder", True))))
+        return scopes
+
     def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
         return self.share_list
 
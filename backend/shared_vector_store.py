@@ -0,0 +1,174 @@
+import logging
+import os
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend import ann_index
+from backend.chunk_store import ChunkMetadataStore
+from backend.vector_store import UserVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Keep all users' vectors in shards under <vector_db>/.shared instead of one store per user
+VECTOR_STORE_SHARED = os.environ.get('VECTOR_STORE_SHARED', 'false').lower() == 'true'
+# Shards of a new shared store; an existing store keeps the count it was created with
+VECTOR_STORE_SHARDS = int(os.environ.get('VECTOR_STORE_SHARDS', '16'))
+# A shard's WAL takes many users' small appends, so it is merged into a snapshot less often
+SHARD_WAL_MERGE_RECORDS = int(os.environ.get('VECTOR_SHARD_WAL_MERGE_RECORDS', '2048'))
+
+SHARED_DIR_NAME = '.shared'
+SHARDS_NAME = 'SHARDS'
+
+
+def shard_of(tenant: str, shards: int) -> int:
+    return zlib.crc32(tenant.encode('utf-8')) % shards
+
+
+class ShardVectorStore(UserVectorStore):
+    """
+    A shard of the shared store: a vector store whose chunk rows carry their tenant.
+
+    Every search of a shard is filtered to one user's vectors, which are scored exactly
+    (see ann_index.search_subset), so the shard stays a flat index: an ANN structure over
+    all its users would cost memory and build time without being used.
+    """
+
+    wal_merge_records = SHARD_WAL_MERGE_RECORDS
+    index_type = ann_index.INDEX_FLAT
+
+
+class SharedVectorStore:
+    """
+    Layout of the shared multi-tenant store: users (tenants) hashed onto a fixed number
+    of shards, each a ShardVectorStore directory under root. A few large indices replace
+    one small index and database per user, so the process keeps a bounded set of files
+    open, and a shard's files, index overhead and trained encoding (VECTOR_STORAGE) are
+    shared by its users. A loaded shard holds all its users' vectors in memory.
+
+    The shard count is recorded in root/SHARDS when the store is created and read from
+    there afterwards, as changing it would move users to other shards.
+    """
+
+    def __init__(self, root: str, shards: int = VECTOR_STORE_SHARDS):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.shards = self._shard_count(shards)
+
+    def _shard_count(self, shards: int) -> int:
+        shards_path = os.path.join(self.root, SHARDS_NAME)
+        if not os.path.exists(shards_path):
+            tmp_path = f"{shards_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(str(shards))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(tmp_path, shards_path)  # fails if another process created it first
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(shards_path) as f:
+            existing = int(f.read())
+        if existing != shards:
+            logger.warning(f"Shared vector store {self.root} has {existing} shards, not {shards}; keeping {existing}")
+        return existing
+
+    def shard_path(self, tenant: str) -> str:
+        return os.path.join(self.root, f"shard-{shard_of(tenant, self.shards):04d}")
+
+    def shard_paths(self) -> List[str]:
+        return [os.path.join(self.root, f"shard-{shard:04d}") for shard in range(self.shards)]
+
+
+class TenantChunks:
+    """The ChunkMetadataStore calls made on a user's store, answered from their rows in a shard."""
+
+    def __init__(self, chunks: ChunkMetadataStore, tenant: str):
+        self._chunks = chunks
+        self.tenant = tenant
+
+    def document_chunk_count(self, path: Optional[str], cid: str) -> int:
+        return self._chunks.document_chunk_count(path, cid, self.tenant)
+
+    def documents(self) -> List[Tuple[Optional[str], str, str]]:
+        return self._chunks.documents(self.tenant)
+
+    def live_ids(self) -> List[int]:
+        return self._chunks.live_ids(self.tenant)
+
+    def live_ids_under(self, scopes: Iterable[Tuple[str, bool]]) -> List[int]:
+        return self._chunks.live_ids_under(scopes, self.tenant)
+
+    def count(self) -> int:
+        return self._chunks.count(self.tenant)
+
+    def file_counts(self) -> Dict[str, int]:
+        return self._chunks.file_counts(self.tenant)
+
+
+class TenantVectorStore:
+    """
+    One user's part of a shard, used where their UserVectorStore would be. Searches are
+    filtered to the user's vectors; writes tag chunk rows with the user. Maintenance
+    (rebuild, compaction, memory) is the shard's.
+    """
+
+    def __init__(self, shard: ShardVectorStore, tenant: str):
+        self.shard = shard
+        self.tenant = tenant
+        self.chunks = TenantChunks(shard.chunks, tenant)
+
+    @property
+    def path(self) -> str:
+        return self.shard.path
+
+    @property
+    def ntotal(self) -> int:
+        return self.chunks.count()
+
+    @property
+    def version(self) -> Tuple[Optional[str], int]:
+        """Changes whenever this user's chunks change; writes of other users in the shard leave it alone."""
+        return self.shard.store_id, self.shard.chunks.tenant_version(self.tenant)
+
+    def exists(self) -> bool:
+        return self.shard.chunks.has_tenant(self.tenant)
+
+    def refresh(self):
+        self.shard.refresh()
+
+    def append(self, embeddings: np.ndarray, chunks: List[Dict]):
+        self.shard.append(embeddings, chunks, self.tenant)
+
+    def delete(self, paths: List[str] = (), cids: List[str] = ()) -> int:
+        return self.shard.delete(paths, cids, self.tenant)
+
+    def delete_all(self) -> int:
+        return self.shard.chunks.mark_tenant_deleted(self.tenant)
+
+    def search(self, query_embedding: np.ndarray, top_k: int,
+               ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+               allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[float, Dict]]:
+        """As UserVectorStore.search; allowed_ids must be ids of this user's chunks (e.g. from live_ids_under)."""
+        if allowed_ids is None:
+            allowed_ids = np.array(self.chunks.live_ids(), dtype=np.int64)
+        return self.shard.search(query_embedding, top_k, ef_search=ef_search, nprobe=nprobe, allowed_ids=allowed_ids)
+
+    def lexical_search(self, query: str, top_k: int,
+                       scopes: Optional[List[Tuple[str, bool]]] = None) -> List[Tuple[float, Dict]]:
+        return self.shard.lexical_search(query, top_k, scopes, self.tenant)
+
+    def needs_migration(self) -> bool:
+        return self.shard.needs_migration()
+
+    def needs_compaction(self) -> bool:
+        return self.shard.needs_compaction()
+
+    def rebuild(self, kind: Optional[str] = None):
+        self.shard.rebuild(kind)
+
+    def memory_bytes(self) -> int:
+        return self.shard.memory_bytes()
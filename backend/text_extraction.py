@@ -0,0 +1,269 @@
+import logging
+import math
+import multiprocessing
+import os
+import resource
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 0 extracts in the calling thread without limits
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+# CPU time per task (a whole DOCX, or a range of PDF pages) and memory per worker
+EXTRACT_CPU_SECONDS = int(os.environ.get('EXTRACT_CPU_SECONDS', '60'))
+EXTRACT_MEMORY_MB = int(os.environ.get('EXTRACT_MEMORY_MB', '1024'))
+# Wall-clock backstop for a worker stuck in native code, where the CPU signal cannot be handled
+EXTRACT_TIMEOUT_SECONDS = float(os.environ.get('EXTRACT_TIMEOUT_SECONDS', '120'))
+# PDFs with more pages are split into ranges of this many pages, extracted in parallel and
+# streamed in order; each range parses the document again
+EXTRACT_PDF_PAGES_PER_TASK = int(os.environ.get('EXTRACT_PDF_PAGES_PER_TASK', '64'))
+
+
+class ExtractionLimitExceeded(Exception):
+    pass
+
+
+class ExtractionFailed(Exception):
+    """Raised by iter_text when a document, or part of one, could not be extracted."""
+
+
+def _on_cpu_limit(signum, frame):
+    raise ExtractionLimitExceeded("CPU time limit exceeded")
+
+
+def _address_space_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+def _init_worker(memory_bytes: int):
+    """
+    Runs once in each worker process: allow memory_bytes of address space on top of what
+    it inherited from the app at fork, and turn SIGXCPU into an exception.
+    """
+    if memory_bytes > 0:
+        limit = _address_space_bytes() + memory_bytes
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+
+
+def _run_limited(cpu_seconds: int, fn: Callable, *args):
+    """
+    Run fn with a soft CPU limit of cpu_seconds beyond what this worker has used so far.
+    Only the soft limit is moved: an unprivileged process cannot raise its hard limit
+    again for the next task.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds > 0:
+        resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(usage.ru_utime + usage.ru_stime) + cpu_seconds, hard))
+    try:
+        return fn(*args)
+    finally:
+        if cpu_seconds > 0:
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def extract_pdf_pages(content: bytes, start: int, end: int) -> Tuple[int, List[str]]:
+    """(page count, texts of pages start..end) of a PDF."""
+    import PyPDF2
+
+    pages = PyPDF2.PdfReader(BytesIO(content)).pages
+    return len(pages), [pages[i].extract_text() or "" for i in range(start, min(end, len(pages)))]
+
+
+def iter_pdf_pages(content: bytes) -> Iterator[str]:
+    import PyPDF2
+
+    for page in PyPDF2.PdfReader(BytesIO(content)).pages:
+        yield page.extract_text() or ""
+
+
+def extract_docx(content: bytes) -> str:
+    from docx import Document
+
+    return "\n".join(paragraph.text for paragraph in Document(BytesIO(content)).paragraphs).strip()
+
+
+def extract_txt(content: bytes) -> str:
+    return content.decode('utf-8', errors='ignore')
+
+
+class TextExtractor:
+    """
+    Text extraction from PDF, DOCX and TXT in a pool of worker processes.
+
+    Parsing runs outside the web process, so a pathological document cannot hold its GIL
+    or memory. Each task gets a CPU-time limit (raised as ExtractionLimitExceeded in the
+    worker) and each worker an address-space limit; a worker that still hangs past
+    timeout, or dies, is replaced along with the pool. PDFs longer than pages_per_task
+    are extracted in page ranges in parallel and joined in page order.
+    """
+
+    def __init__(self, workers: int = EXTRACT_WORKERS, cpu_seconds: int = EXTRACT_CPU_SECONDS,
+                 memory_mb: int = EXTRACT_MEMORY_MB, timeout: float = EXTRACT_TIMEOUT_SECONDS,
+                 pages_per_task: int = EXTRACT_PDF_PAGES_PER_TASK):
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.timeout = timeout
+        self.pages_per_task = max(1, pages_per_task)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.documents = 0
+        self.failures = 0
+        self.limit_exceeded = 0
+        self.pool_restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # fork: spawn would re-import app.py, which builds the app at import time
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('fork'),
+                                                 initializer=_init_worker, initargs=(self.memory_bytes,))
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        with self._pool_lock:
+            if self._pool is not pool:
+                return  # another thread already replaced it
+            self._pool = None
+            self.pool_restarts += 1
+        # Executor has no public way to stop a running task
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False)
+
+    def start(self):
+        """Fork the workers now, before the app starts its background threads."""
+        if self.workers > 0:
+            pool = self._get_pool()
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _call_all(self, calls: List[Tuple[Callable, tuple]]) -> List:
+        """Run the calls (in parallel when pooled); each result is the return value or the exception raised."""
+        if self.workers <= 0:
+            results = []
+            for fn, args in calls:
+                try:
+                    results.append(fn(*args))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        pool = self._get_pool()
+        try:
+            futures = [pool.submit(_run_limited, self.cpu_seconds, fn, *args) for fn, args in calls]
+        except BrokenProcessPool as e:
+            self._reset_pool(pool)
+            return [e] * len(calls)
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=self.timeout))
+            except FutureTimeoutError:
+                logger.warning(f"Text extraction task exceeded {self.timeout}s; restarting extraction workers")
+                self._reset_pool(pool)
+                results.append(ExtractionLimitExceeded(f"Timed out after {self.timeout}s"))
+            except BrokenProcessPool as e:
+                self._reset_pool(pool)
+                results.append(e)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _check(self, result, filename: str):
+        """Raise ExtractionFailed (counted and logged) if result is the exception a task raised."""
+        if isinstance(result, Exception):
+            with self._stats_lock:
+                self.failures += 1
+                if isinstance(result, (ExtractionLimitExceeded, MemoryError)):
+                    self.limit_exceeded += 1
+            logger.error(f"Text extraction from {filename} failed: {type(result).__name__}: {result}")
+            raise ExtractionFailed(f"{filename}: {type(result).__name__}: {result}") from result
+
+    def _iter_pdf(self, content: bytes, filename: str) -> Iterator[str]:
+        if self.workers <= 0:
+            try:
+                yield from iter_pdf_pages(content)
+            except Exception as e:
+                self._check(e, filename)
+            return
+
+        size = self.pages_per_task
+        first = self._call_all([(extract_pdf_pages, (content, 0, size))])[0]
+        self._check(first, filename)
+        page_count, texts = first
+        yield from texts
+        # One range per worker in flight, so memory stays bounded however long the PDF is
+        starts = list(range(size, page_count, size))
+        for offset in range(0, len(starts), self.workers):
+            for result in self._call_all([(extract_pdf_pages, (content, start, start + size))
+                                          for start in starts[offset:offset + self.workers]]):
+                self._check(result, filename)
+                yield from result[1]
+
+    def iter_text(self, content: bytes, filename: str) -> Iterator[str]:
+        """
+        Text of a PDF, DOCX or TXT file as a stream of segments (pages of a PDF); nothing for
+        other types. Raises ExtractionFailed if any part fails, after the segments before it.
+        """
+        extension = filename.lower().split('.')[-1]
+        with self._stats_lock:
+            self.documents += 1
+        if extension == 'pdf':
+            yield from self._iter_pdf(content, filename)
+        elif extension == 'docx':
+            result = self._call_all([(extract_docx, (content,))])[0]
+            self._check(result, filename)
+            yield result
+        elif extension == 'txt':
+            yield extract_txt(content)
+        else:
+            logger.warning(f"Unsupported file type: {extension}")
+
+    def extract(self, content: bytes, filename: str) -> str:
+        """Text of a PDF, DOCX or TXT file; "" for other types or if extraction fails."""
+        try:
+            return "\n".join(self.iter_text(content, filename)).strip()
+        except ExtractionFailed:
+            return ""
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'documents': self.documents,
+                'failures': self.failures,
+                'limit_exceeded': self.limit_exceeded,
+                'pool_restarts': self.pool_restarts,
+            }
+
+
+text_extractor = None
+
+
+def get_text_extractor() -> TextExtractor:
+    """Get global text extractor instance"""
+    global text_extractor
+    if text_extractor is None:
+        text_extractor = TextExtractor()
+    return text_extractor
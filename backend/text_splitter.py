@@ -0,0 +1,252 @@
+import copy
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", ". ", " ", "")
+
+
+class RecursiveTextSplitter:
+    """
+    Recursive character splitter producing the same chunks as langchain's
+    RecursiveCharacterTextSplitter with keep_separator=True, strip_whitespace=True and
+    length measured by len().
+
+    The text is split at the first separator it contains, each separator staying at the
+    start of the piece after it; pieces shorter than chunk_size are merged greedily into
+    chunks of at most chunk_size, each repeating up to chunk_overlap characters of the
+    previous one, and longer pieces are split again with the remaining separators.
+    Separators are plain strings, so this uses str.split and str.find instead of regexes.
+    """
+
+    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100,
+                 separators: Optional[Sequence[str]] = None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) is larger than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators if separators is not None else DEFAULT_SEPARATORS)
+
+    def split_text(self, text: str) -> List[str]:
+        chunks: List[str] = []
+        self._split(text, 0, chunks)
+        return chunks
+
+    def split_stream(self, parts: Iterable[str]) -> Iterator[str]:
+        """
+        The chunks split_text gives for the concatenation of parts, produced as the parts
+        arrive while holding about a chunk of text per separator level.
+        """
+        chunks: List[str] = []
+        stream = _StreamSplit(self, 0, chunks)
+        for part in parts:
+            stream.feed(part)
+            yield from chunks
+            chunks.clear()
+        stream.finish()
+        yield from chunks
+
+    def _split(self, text: str, level: int, chunks: List[str]):
+        separator = self.separators[-1]
+        remaining = len(self.separators)
+        for i in range(level, len(self.separators)):
+            if self.separators[i] == "":
+                separator = ""
+                break
+            if self.separators[i] in text:
+                separator = self.separators[i]
+                remaining = i + 1
+                break
+
+        if separator:
+            parts = text.split(separator)
+            pieces = [parts[0]] if parts[0] else []
+            pieces.extend(separator + part for part in parts[1:])
+        else:
+            pieces = list(text)
+
+        good: List[str] = []
+        for piece in pieces:
+            if len(piece) < self.chunk_size:
+                good.append(piece)
+                continue
+            if good:
+                self._merge(good, chunks)
+                good = []
+            if remaining >= len(self.separators):
+                chunks.append(piece)
+            else:
+                self._split(piece, remaining, chunks)
+        if good:
+            self._merge(good, chunks)
+
+    def _merge(self, pieces: List[str], chunks: List[str]):
+        """Greedily join pieces (separators already attached) into overlapping chunks."""
+        current: "deque[str]" = deque()
+        total = 0
+        for piece in pieces:
+            length = len(piece)
+            if total + length > self.chunk_size and current:
+                chunk = "".join(current).strip()
+                if chunk:
+                    chunks.append(chunk)
+                # Drop leading pieces until what is left fits the overlap and leaves room for this piece
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= len(current.popleft())
+            current.append(piece)
+            total += length
+        chunk = "".join(current).strip()
+        if chunk:
+            chunks.append(chunk)
+
+
+class _StreamSplit:
+    """
+    RecursiveTextSplitter._split(text, level) for text fed in parts: appends the same
+    chunks to out, holding only the piece being read (handed to a nested _StreamSplit
+    once it is too long to merge) and the merge in progress.
+
+    The separator is the first of separators[level:] seen so far. When an earlier one
+    first appears, the text before it becomes the first piece at that separator: a
+    piece shorter than a chunk has produced no chunks yet and is merged with what
+    follows, and a longer one is split with the separators after the new one, which is
+    how the text so far was being split.
+    """
+
+    def __init__(self, splitter: RecursiveTextSplitter, level: int, out: List[str]):
+        self.splitter = splitter
+        self.level = level
+        self.out = out
+        self.pending = ""  # input not read yet: may be the start of a separator
+        self.seen = 0  # characters read
+        self.head = ""  # the text read, while it is shorter than a chunk
+        self.longest_separator = max([1] + [len(separator) for separator in splitter.separators])
+        separators = splitter.separators
+        self._use(next((i for i in range(level, len(separators)) if separators[i] == ""), None))
+
+    def _use(self, index: Optional[int]):
+        """Split at separators[index] (None: no separator seen and none to fall back to) from here on."""
+        separators = self.splitter.separators
+        self.separator = separators[index] if index is not None else None
+        self.remaining = index + 1 if self.separator else len(separators)
+        self.earlier = range(self.level, index if index is not None else len(separators))
+        self.piece = ""
+        self.long = False
+        self.child: Optional[_StreamSplit] = None
+        self.current: "deque[str]" = deque()
+        self.total = 0
+
+    def feed(self, text: str):
+        self.pending += text
+        self._read(final=False)
+
+    def finish(self):
+        self._read(final=True)
+        self._close_piece()
+        self._flush()
+
+    def _read(self, final: bool):
+        """Read pending input, leaving any part that may be the start of a separator unless final."""
+        data = self.pending
+        limit = len(data) if final else len(data) - self.longest_separator + 1
+        if limit <= 0:
+            return
+        separators = self.splitter.separators
+        start = 0
+        for i in self.earlier:
+            end = min(len(data), limit - 1 + len(separators[i]))
+            found = data.find(separators[i], 0, end)
+            if found >= 0:
+                self._switch(i, data[:found])
+                start = found
+                break
+
+        pos = start
+        if self.separator:
+            while True:
+                found = data.find(self.separator, pos)
+                if found < 0 or found + len(self.separator) > limit:
+                    end = limit if found < 0 else max(pos, min(limit, found))
+                    break
+                self._extend(data[pos:found])
+                self._close_piece()
+                self._extend(self.separator)
+                pos = found + len(self.separator)
+            self._extend(data[pos:end])
+        elif self.separator == "":
+            end = limit
+            for char in data[pos:end]:
+                self._extend(char)
+                self._close_piece()
+        else:
+            end = limit
+            self._extend(data[pos:end])
+        self._account(data[start:end])
+        self.pending = data[end:]
+
+    def _switch(self, index: int, before: str):
+        """separators[index] first appears after before (the rest of the text so far): make that the first piece."""
+        length = self.seen + len(before)
+        head = self.head + before if self.head is not None and length < self.splitter.chunk_size else None
+        if head is None:
+            first = copy.copy(self)
+            first.pending = before
+            first.finish()
+        self._use(index)
+        self.seen, self.head = length, head
+        if head:
+            self._extend(head)
+            self._close_piece()
+
+    def _account(self, text: str):
+        self.seen += len(text)
+        if self.head is not None:
+            self.head += text
+            if len(self.head) >= self.splitter.chunk_size:
+                self.head = None
+
+    def _extend(self, text: str):
+        """Add text to the piece being read."""
+        if not text:
+            return
+        if self.child is not None:
+            self.child.feed(text)
+            return
+        self.piece += text
+        if not self.long and len(self.piece) >= self.splitter.chunk_size:
+            self._flush()
+            self.long = True
+            if self.remaining < len(self.splitter.separators):
+                self.child = _StreamSplit(self.splitter, self.remaining, self.out)
+                self.child.feed(self.piece)
+                self.piece = ""
+
+    def _close_piece(self):
+        if self.child is not None:
+            self.child.finish()
+        elif self.long:
+            self.out.append(self.piece)
+        elif self.piece:
+            self._merge(self.piece)
+        self.piece = ""
+        self.long = False
+        self.child = None
+
+    def _merge(self, piece: str):
+        """RecursiveTextSplitter._merge, one piece at a time."""
+        splitter = self.splitter
+        length = len(piece)
+        if self.total + length > splitter.chunk_size and self.current:
+            chunk = "".join(self.current).strip()
+            if chunk:
+                self.out.append(chunk)
+            while self.total > splitter.chunk_overlap or (self.total + length > splitter.chunk_size and self.total > 0):
+                self.total -= len(self.current.popleft())
+        self.current.append(piece)
+        self.total += length
+
+    def _flush(self):
+        chunk = "".join(self.current).strip()
+        if chunk:
+            self.out.append(chunk)
+        self.current = deque()
+        self.total = 0
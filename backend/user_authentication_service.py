@@ -1,4 +1,7 @@
 import hashlib
+import os
+import sqlite3
+from contextlib import closing
 
 from backend.share_manager import ShareManager
 from backend.util import is_valid_password, is_valid_username
@@ -7,6 +10,37 @@ from backend.error import ErrorCode
 from backend.RSDB_kv_service import get_kv, set_kv
 from backend.node import Node
 
+# Usernames for background jobs that visit every user's tree, as the KV service cannot
+# list its keys. One row per user in SQLite, so the app's worker processes register
+# users concurrently without overwriting each other.
+USER_REGISTRY_PATH = os.environ.get('USER_REGISTRY_PATH', 'backend/vector_db/users.sqlite')
+
+
+def _registry() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(USER_REGISTRY_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(USER_REGISTRY_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY)")
+    return conn
+
+
+def list_users():
+    """
+    Usernames of the registered accounts: every account created since the registry
+    was added, and older accounts once they log in.
+    """
+    with closing(_registry()) as conn:
+        return [row[0] for row in conn.execute("SELECT username FROM users ORDER BY username")]
+
+
+def set_user_registered(username, registered=True):
+    with closing(_registry()) as conn:
+        if registered:
+            conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+        else:
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
+
+
 def sign_up(username, password):
     if get_kv(username).strip():
         return ErrorCode.USER_EXISTS
@@ -18,6 +52,7 @@ def sign_up(username, password):
     set_kv(username, hashed)
     set_kv(username + " ROOT", Node("root", True).to_json())
     set_kv(username + " SHARE_MANAGER", ShareManager().to_json())
+    set_user_registered(username)
     return ErrorCode.SUCCESS
 
 def login(username, password):
@@ -27,4 +62,5 @@ def login(username, password):
     hashed = hashlib.sha256(password.encode()).hexdigest()
     if stored != hashed:
         return ErrorCode.INCORRECT_PASSWORD
+    set_user_registered(username)
     return ErrorCode.SUCCESS
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+VECTOR_CACHE_MAX_BYTES = int(float(os.environ.get('VECTOR_CACHE_MAX_MB', '512')) * 1024 * 1024)
+VECTOR_CACHE_IDLE_SECONDS = float(os.environ.get('VECTOR_CACHE_IDLE_SECONDS', '1800'))
+# Loads of keys hashing to the same stripe are serialized; a fixed pool keeps memory flat
+LOAD_LOCK_STRIPES = 64
+
+
+class _CacheEntry:
+    __slots__ = ('value', 'size_bytes', 'signature', 'last_access')
+
+    def __init__(self, value, size_bytes: int, signature: Hashable):
+        self.value = value
+        self.size_bytes = size_bytes
+        self.signature = signature
+        self.last_access = time.monotonic()
+
+
+class VectorIndexCache:
+    """
+    Thread-safe LRU cache of loaded per-user vector indices, bounded by an estimated
+    memory budget and evicting entries idle for longer than idle_ttl seconds.
+
+    Each entry carries a signature (e.g. file mtimes); a lookup with a different
+    signature reloads, so writes from other processes are picked up. Concurrent misses
+    for the same key share one load, guarded by one of LOAD_LOCK_STRIPES fixed locks.
+    """
+
+    def __init__(self, max_bytes: int = VECTOR_CACHE_MAX_BYTES, idle_ttl: float = VECTOR_CACHE_IDLE_SECONDS):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+        self._load_locks = [threading.Lock() for _ in range(LOAD_LOCK_STRIPES)]
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable, signature: Hashable) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.signature != signature:
+            return None
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, loader: Callable[[], Tuple[Any, int]], signature: Hashable = None):
+        """
+        Return the cached value for key, calling loader() -> (value, size_bytes) on a miss.
+        """
+        with self._lock:
+            self._evict_idle()
+            entry = self._lookup(key, signature)
+            if entry is not None:
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+        key_lock = self._load_locks[hash(key) % LOAD_LOCK_STRIPES]
+
+        with key_lock:
+            with self._lock:
+                entry = self._lookup(key, signature)
+                if entry is not None:
+                    return entry.value
+
+            start = time.perf_counter()
+            value, size_bytes = loader()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.loads += 1
+                self.load_seconds += elapsed
+                self._store(key, value, size_bytes, signature)
+            return value
+
+    def put(self, key: Hashable, value, size_bytes: int, signature: Hashable = None):
+        """Insert or replace an entry, e.g. after a write made through this process."""
+        with self._lock:
+            self._store(key, value, size_bytes, signature)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size_bytes
+
+    def _store(self, key: Hashable, value, size_bytes: int, signature: Hashable):
+        self._remove(key)
+        if size_bytes > self.max_bytes:
+            return  # larger than the whole budget: serve uncached
+        self._entries[key] = _CacheEntry(value, size_bytes, signature)
+        self._total_bytes += size_bytes
+        while self._total_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if oldest.last_access >= cutoff:
+                break
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loads': self.loads,
+                'avg_load_ms': round(self.load_seconds * 1000 / self.loads, 2) if self.loads else 0.0,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,623 @@
+import ctypes
+import errno
+import fcntl
+import heapq
+import json
+import logging
+import os
+import pickle
+import shutil
+import struct
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from backend import ann_index
+from backend.chunk_store import ChunkMetadataStore
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'MANIFEST'
+LOCK_NAME = 'LOCK'
+CHUNKS_NAME = 'chunks.sqlite'
+
+# Recorded in the MANIFEST; stores of the original '<user>.faiss' files are converted by migrate_legacy_store
+FORMAT_VERSION = 1
+
+# WAL record: header followed by float32 vectors, which take consecutive ids from the first one
+WAL_MAGIC = b'RSW1'
+WAL_HEADER = struct.Struct('<4sIIqI')  # magic, vector count, dimension, first id, crc32 of id + payload
+
+# Rebuild an index without deleted vectors once they make up this fraction of it
+VECTOR_COMPACT_TOMBSTONE_RATIO = float(os.environ.get('VECTOR_COMPACT_TOMBSTONE_RATIO', '0.2'))
+
+# Fold the WAL into a new base snapshot once it holds this many records or bytes
+WAL_MERGE_RECORDS = int(os.environ.get('VECTOR_WAL_MERGE_RECORDS', '64'))
+WAL_MERGE_BYTES = int(float(os.environ.get('VECTOR_WAL_MERGE_MB', '64')) * 1024 * 1024)
+
+# Open IVF snapshots with memory-mapped inverted lists instead of reading them into RAM
+VECTOR_INDEX_MMAP = os.environ.get('VECTOR_INDEX_MMAP', 'true').lower() == 'true'
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_RENAME_EXCHANGE = 2  # renameat2() flag (Linux 3.15+)
+_AT_FDCWD = -100
+
+
+def _exchange_paths(first: str, second: str):
+    """Swap two directories with one atomic rename where the OS supports it, else with three renames."""
+    renameat2 = getattr(ctypes.CDLL(None, use_errno=True), 'renameat2', None)
+    if renameat2 is not None:
+        if renameat2(_AT_FDCWD, os.fsencode(first), _AT_FDCWD, os.fsencode(second), _RENAME_EXCHANGE) == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(error, os.strerror(error), first)
+    parked = f"{second}.swap"
+    os.rename(first, parked)
+    os.rename(second, first)
+    os.rename(parked, second)
+
+
+def _atomic_write(path: str, write):
+    """Write via a temp file, fsync it and rename it over path."""
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class UserVectorStore:
+    """
+    One user's vectors and chunk metadata on disk, append-oriented and crash safe.
+
+    Layout of the store directory:
+        MANIFEST              current generation and format, replaced atomically
+        index-<gen>.faiss     base snapshot of the FAISS index
+        wal-<gen>.log         vectors appended since the snapshot
+        chunks.sqlite         chunk text and metadata keyed by vector id
+
+    Adding a document writes its chunk rows, then appends one checksummed WAL record,
+    so its cost is proportional to the document. When the WAL grows past
+    WAL_MERGE_RECORDS / WAL_MERGE_BYTES it is merged into generation + 1 and the
+    MANIFEST is swapped with a rename; a crash at any point leaves either the old or
+    the new generation intact. A torn WAL tail is ignored on load and truncated by the
+    next writer, and chunk rows without a vector are dropped.
+
+    Vector ids are stable: deleting chunks only marks their rows deleted (tombstones,
+    hidden from search at once), and rebuild() later writes an index without them.
+
+    A store built elsewhere can be swapped in for this one (replace()); the MANIFEST
+    carries a random store id, so processes holding the old store open reload on their
+    next refresh.
+
+    Only the vectors are held in memory; chunk rows are read on demand. The index starts
+    flat and can be migrated to an ANN type (see backend/ann_index.py) as it grows.
+
+    IVF snapshots are opened memory-mapped (VECTOR_INDEX_MMAP), so their inverted lists
+    are paged in by the OS as searches touch them rather than read into each process.
+    A mapped index is read-only: vectors appended since the snapshot go to a small
+    in-memory delta index that is searched alongside it and folded in on checkpoint.
+    """
+
+    # WAL records that trigger a merge into a new generation (see WAL_MERGE_RECORDS)
+    wal_merge_records = WAL_MERGE_RECORDS
+    # Index type to grow into ('auto' picks by size, see backend/ann_index.py)
+    index_type = ann_index.VECTOR_INDEX_TYPE
+
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self.index = ann_index.empty_index(dimension)  # Inner product (cosine similarity)
+        self.delta: Optional[faiss.Index] = None  # set while self.index is memory-mapped
+        self.next_id = 0
+        self.generation = 0
+        self.wal_offset = 0
+        self.wal_records = 0
+        self.store_id: Optional[str] = None
+        self.lock = threading.RLock()
+        self._chunks: Optional[ChunkMetadataStore] = None
+
+    @property
+    def chunks(self) -> ChunkMetadataStore:
+        if self._chunks is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._chunks = ChunkMetadataStore(os.path.join(self.path, CHUNKS_NAME))
+        return self._chunks
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + (self.delta.ntotal if self.delta is not None else 0)
+
+    @property
+    def mmapped(self) -> bool:
+        return self.delta is not None
+
+    @property
+    def version(self) -> Tuple[Optional[str], int, int, int]:
+        """Changes whenever the searchable content changes; keys cached search results."""
+        return self.store_id, self.generation, self.wal_offset, self.chunks.deletion_version()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+    @classmethod
+    def open(cls, path: str, dimension: int) -> 'UserVectorStore':
+        store = cls(path, dimension)
+        if not cls.exists(path):
+            return store
+
+        with store.lock, store._file_lock():
+            store._load()
+            store.chunks.truncate(store.next_id)
+        return store
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    def _index_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"index-{generation}.faiss")
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"wal-{generation}.log")
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, generation: int):
+        if self.store_id is None:
+            self.store_id = uuid.uuid4().hex
+
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump({'generation': generation, 'dimension': self.dimension, 'format': FORMAT_VERSION,
+                           'next_id': self.next_id, 'store_id': self.store_id}, f)
+        _atomic_write(self._manifest_path(), write)
+        _fsync_dir(self.path)
+
+    def _read_index(self, generation: int, mmap: bool) -> faiss.Index:
+        """Read a snapshot, memory-mapped if asked and it is an IVF index (the only type faiss can map)."""
+        if not mmap:
+            return faiss.read_index(self._index_path(generation))
+        index = faiss.read_index(self._index_path(generation), faiss.IO_FLAG_MMAP)
+        if not isinstance(ann_index.base_index(index), faiss.IndexIVF):
+            return index  # flat and HNSW codes were read into memory despite the flag
+        self.delta = ann_index.empty_index(index.d, ann_index.STORAGE_FLOAT32)
+        return index
+
+    def _load(self, attempts: int = 3, mmap: bool = VECTOR_INDEX_MMAP):
+        """Load the base snapshot of the current generation and replay its WAL."""
+        for attempt in range(attempts):
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            generation = manifest['generation']
+            self.delta = None
+            try:
+                if os.path.exists(self._index_path(generation)):
+                    index = self._read_index(generation, mmap)
+                else:
+                    index = ann_index.empty_index(manifest['dimension'])
+            except (FileNotFoundError, RuntimeError):
+                # Another process merged into a new generation while we were reading
+                if attempt == attempts - 1:
+                    raise
+                continue
+
+            self.index = index
+            self.dimension = index.d
+            self.store_id = manifest.get('store_id')
+            self.generation = generation
+            self.next_id = manifest['next_id']
+            self.wal_offset = 0
+            self.wal_records = 0
+            self._replay_wal()
+            return
+
+    def _replay_wal(self):
+        """Apply complete WAL records past wal_offset; stop at the first torn or corrupt one."""
+        try:
+            f = open(self._wal_path(self.generation), 'rb')
+        except FileNotFoundError:
+            return
+
+        with f:
+            f.seek(self.wal_offset)
+            while True:
+                header = f.read(WAL_HEADER.size)
+                if len(header) < WAL_HEADER.size or header[:4] != WAL_MAGIC:
+                    if header:
+                        logger.info(f"Stopping WAL replay at incomplete record at offset {self.wal_offset} in {self.path}")
+                    break
+                _, count, dimension, start_id, crc = WAL_HEADER.unpack(header)
+
+                payload = f.read(count * dimension * 4)
+                if len(payload) < count * dimension * 4 or zlib.crc32(header[12:20] + payload) != crc:
+                    logger.info(f"Stopping WAL replay at incomplete record at offset {self.wal_offset} in {self.path}")
+                    break
+
+                vectors = np.frombuffer(payload, dtype=np.float32).reshape(count, dimension)
+                self._add_vectors(vectors, start_id)
+                self.wal_offset += len(header) + len(payload)
+                self.wal_records += 1
+
+    def _add_vectors(self, vectors: np.ndarray, start_id: int):
+        target = self.delta if self.delta is not None else self.index
+        target.add_with_ids(vectors, np.arange(start_id, start_id + len(vectors), dtype=np.int64))
+        self.next_id = max(self.next_id, start_id + len(vectors))
+
+    def refresh(self):
+        """Pick up writes made by other processes: new WAL records or a new generation."""
+        with self.lock:
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            if manifest.get('store_id') != self.store_id:
+                self._reopen()
+                return
+            if manifest['generation'] != self.generation:
+                self._load()
+                return
+            try:
+                wal_size = os.path.getsize(self._wal_path(self.generation))
+            except FileNotFoundError:
+                return
+            if wal_size > self.wal_offset:
+                self._replay_wal()
+
+    def _reopen(self):
+        """Switch to the store that replaced the one loaded (see replace)."""
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+        self.delta = None
+        self._load()
+        logger.info(f"Vector store {self.path} was replaced; reloaded it (ntotal={self.ntotal})")
+
+    @staticmethod
+    def replace(path: str, new_path: str, ready: Callable[[], bool] = lambda: True) -> bool:
+        """
+        Swap the store built at new_path in for the one at path with a single rename, once
+        no writer holds it; the old store is left at new_path. ready is checked under the
+        writer lock, just before the swap. Returns False, swapping nothing, if path holds
+        no store or ready() is false.
+        """
+        try:
+            lock_file = open(os.path.join(path, LOCK_NAME), 'r')
+        except FileNotFoundError:
+            return False
+        with lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            if not UserVectorStore.exists(path) or not ready():
+                return False
+            _exchange_paths(path, new_path)
+            _fsync_dir(os.path.dirname(os.path.abspath(path)))
+        logger.info(f"Replaced vector store {path} with the one built at {new_path}")
+        return True
+
+    @staticmethod
+    def install(path: str, new_path: str, ready: Callable[[], bool] = lambda: True) -> bool:
+        """
+        As replace(), but a store at new_path is moved to path if path holds none yet.
+        Returns False, moving nothing, if ready() is false or a store appeared at path
+        meanwhile (call again to swap it in).
+        """
+        if UserVectorStore.exists(path):
+            return UserVectorStore.replace(path, new_path, ready)
+        if not ready():
+            return False
+        try:
+            os.rename(new_path, path)
+        except OSError:
+            return False  # created meanwhile, and not empty
+        _fsync_dir(os.path.dirname(os.path.abspath(path)))
+        logger.info(f"Installed vector store built at {new_path} as {path}")
+        return True
+
+    @staticmethod
+    def remove(path: str):
+        """Delete the store at path once no thread or process is writing to it."""
+        try:
+            lock_file = open(os.path.join(path, LOCK_NAME), 'r')
+        except FileNotFoundError:
+            return
+        with lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def _file_lock(self, create: bool = True):
+        """
+        Cross-process writer lock for this store, yielding whether it is held. With
+        create=False a deleted store directory is not recreated and the lock not taken.
+        """
+        lock_path = os.path.join(self.path, LOCK_NAME)
+        while True:
+            if create:
+                os.makedirs(self.path, exist_ok=True)
+            try:
+                # Opened without O_CREAT unless asked, so a store being removed is not given a new LOCK
+                lock_file = open(lock_path, 'a' if create else 'r')
+            except FileNotFoundError:
+                if create:
+                    raise
+                yield False
+                return
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            # The store was removed or replaced while we waited: lock whatever is at self.path now
+            lock_file.close()
+        with lock_file:
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, embeddings: np.ndarray, chunks: List[Dict], tenant: Optional[str] = None):
+        """Durably append normalized embeddings and their chunk metadata (tagged with tenant, if given)."""
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        payload = vectors.tobytes()
+
+        with self.lock, self._file_lock():
+            if self.exists(self.path):
+                self.refresh()
+            if vectors.shape[1] != self.dimension:
+                # e.g. an app still configured for the dimension a reindex replaced
+                raise ValueError(f"{vectors.shape[1]}-dimensional vectors do not fit the "
+                                 f"{self.dimension}-dimensional store {self.path}")
+            if not self.exists(self.path):
+                self._write_manifest(self.generation)
+
+            start_id = self.next_id
+            id_bytes = struct.pack('<q', start_id)
+            record = WAL_HEADER.pack(WAL_MAGIC, vectors.shape[0], vectors.shape[1], start_id,
+                                     zlib.crc32(id_bytes + payload)) + payload
+
+            # Rows first: a crash before the WAL write leaves rows past next_id, which are replaced or dropped
+            self.chunks.add(start_id, chunks, tenant)
+
+            wal_path = self._wal_path(self.generation)
+            with open(wal_path, 'ab') as f:
+                if f.tell() > self.wal_offset:
+                    f.truncate(self.wal_offset)  # drop a torn tail left by a crashed writer
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._add_vectors(vectors, start_id)
+            self.wal_offset += len(record)
+            self.wal_records += 1
+
+            if self.wal_records >= self.wal_merge_records or self.wal_offset >= WAL_MERGE_BYTES:
+                self._checkpoint()
+
+    def _merged_index(self) -> faiss.Index:
+        """A writable index holding the mapped snapshot plus the delta (self.index if not mapped)."""
+        if self.delta is None:
+            return self.index
+        index = self._read_index(self.generation, mmap=False)
+        if self.delta.ntotal:
+            vectors, ids = ann_index.reconstruct_all(self.delta)
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def _checkpoint(self):
+        """Write the in-memory state as a new generation and retire the old files."""
+        old_generation = self.generation
+        new_generation = old_generation + 1
+
+        index = self._merged_index()
+        _atomic_write(self._index_path(new_generation), lambda tmp: faiss.write_index(index, tmp))
+        self._write_manifest(new_generation)
+        self.generation = new_generation
+        self.wal_offset = 0
+        self.wal_records = 0
+        self.delta = None
+        if VECTOR_INDEX_MMAP and isinstance(ann_index.base_index(index), faiss.IndexIVF):
+            index = self._read_index(new_generation, mmap=True)  # drop the resident copy
+        self.index = index
+
+        for stale_path in (self._index_path(old_generation), self._wal_path(old_generation)):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        logger.info(f"Merged vector store {self.path} into generation {new_generation} (ntotal={self.ntotal})")
+
+    def compact(self):
+        """Force the WAL to be merged into a new base snapshot."""
+        with self.lock, self._file_lock():
+            self.refresh()
+            if self.wal_records:
+                self._checkpoint()
+
+    def needs_migration(self) -> bool:
+        with self.lock:
+            # Judged by live vectors, as rebuild() chooses the type and encoding by them
+            return ann_index.needs_migration(self.index, self.ntotal - self.chunks.deleted_count(),
+                                             configured=self.index_type)
+
+    def delete(self, paths: List[str] = (), cids: List[str] = (), tenant: Optional[str] = None) -> int:
+        """
+        Hide the chunks of deleted files from search. Chunks indexed with a path are
+        matched by path; older chunks without one by CID. Returns the number removed.
+        """
+        return self.chunks.mark_deleted(paths, cids, tenant)
+
+    def tombstone_ratio(self) -> float:
+        with self.lock:
+            ntotal = self.ntotal
+        return self.chunks.deleted_count() / ntotal if ntotal else 0.0
+
+    def needs_compaction(self) -> bool:
+        return self.tombstone_ratio() >= VECTOR_COMPACT_TOMBSTONE_RATIO
+
+    def _indices(self) -> List[faiss.Index]:
+        return [self.index] if self.delta is None else [self.index, self.delta]
+
+    def _all_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        parts = [ann_index.reconstruct_all(index) for index in self._indices()]
+        return np.vstack([vectors for vectors, _ in parts]), np.concatenate([ids for _, ids in parts])
+
+    def rebuild(self, kind: Optional[str] = None):
+        """
+        Rewrite the index without deleted vectors, as another type if given (by default
+        the one suited to the number of live vectors).
+
+        Training and building run on a snapshot without holding the locks; vectors
+        appended meanwhile are copied over before the new index is swapped in and written
+        as a new generation. Rows of the dropped vectors are purged afterwards. A store
+        deleted meanwhile (see remove) is left deleted.
+        """
+        with self.lock, self._file_lock(create=False) as locked:
+            if not locked or not self.exists(self.path):
+                logger.info(f"Vector store {self.path} was deleted; skipping rebuild")
+                return
+            self.refresh()
+            vectors, ids = self._all_vectors()
+            deleted = np.array(sorted(self.chunks.deleted_ids()), dtype=np.int64)
+        live = ~np.isin(ids, deleted)
+        kind = kind or ann_index.choose_index_type(int(live.sum()), self.index_type)
+        new_index = ann_index.build_index(kind, vectors[live], self.dimension, ids[live])
+        del vectors
+
+        with self.lock, self._file_lock(create=False) as locked:
+            if not locked or not self.exists(self.path):
+                logger.info(f"Vector store {self.path} was deleted; skipping rebuild")
+                return
+            self.refresh()
+            current_ids = np.concatenate([ann_index.vector_ids(index) for index in self._indices()])
+            if not np.isin(ids[live], current_ids).all():
+                logger.info(f"Vector store {self.path} was rebuilt elsewhere; skipping rebuild")
+                return
+            for index in self._indices():
+                appended = np.nonzero(~np.isin(ann_index.vector_ids(index), ids))[0]
+                if len(appended):
+                    extra_vectors, extra_ids = ann_index.reconstruct_all(index, int(appended[0]))
+                    keep = ~np.isin(extra_ids, ids)
+                    new_index.add_with_ids(extra_vectors[keep], extra_ids[keep])
+            self.index = new_index
+            self.delta = None
+            self._checkpoint()
+            self.chunks.purge(deleted.tolist())
+        logger.info(f"Rebuilt vector store {self.path} as {kind} index "
+                    f"(ntotal={new_index.ntotal}, dropped {len(deleted)} deleted vectors)")
+
+    def search(self, query_embedding: np.ndarray, top_k: int,
+               ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+               allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[float, Dict]]:
+        """
+        Return [(score, chunk)] for the query, best first. ef_search / nprobe tune ANN indices;
+        allowed_ids (sorted vector ids of live chunks) restricts the search to those vectors.
+        """
+        with self.lock:
+            if allowed_ids is not None:
+                k = min(top_k, len(allowed_ids))
+            else:
+                # Ask for extra neighbours so deleted chunks filtered out below do not shrink the result
+                k = min(top_k + min(self.chunks.deleted_count(), max(4 * top_k, 64)), self.ntotal)
+            if k == 0:
+                return []
+            query = np.ascontiguousarray(query_embedding, dtype=np.float32)
+            ann_index.apply_search_parameters(self.index, ef_search, nprobe)
+            hits = []
+            for index in self._indices():
+                if not index.ntotal:
+                    continue
+                if allowed_ids is not None:
+                    ids = ann_index.vector_ids(index)
+                    positions = np.nonzero(np.isin(ids, allowed_ids, assume_unique=True))[0]
+                    scores, found = ann_index.search_subset(index, query, k, positions, ids)
+                    hits.extend((float(score), int(idx)) for score, idx in zip(scores, found))
+                else:
+                    scores, indices = index.search(query, min(k, index.ntotal))
+                    hits.extend((float(score), int(idx)) for score, idx in zip(scores[0], indices[0]) if idx >= 0)
+
+        if self.delta is not None:
+            hits = heapq.nlargest(k, hits, key=lambda hit: hit[0])
+        rows = self.chunks.get(idx for _, idx in hits)
+        return [(score, rows[idx]) for score, idx in hits if idx in rows][:top_k]
+
+    def lexical_search(self, query: str, top_k: int, scopes: Optional[List[Tuple[str, bool]]] = None,
+                       tenant: Optional[str] = None) -> List[Tuple[float, Dict]]:
+        """Return [(bm25 score, chunk)] for the terms of query, best first, optionally within (path, is_folder) scopes."""
+        hits = self.chunks.lexical_search(query, top_k, scopes, tenant)
+        rows = self.chunks.get(idx for _, idx in hits)
+        return [(score, rows[idx]) for score, idx in hits if idx in rows]
+
+    def move_out(self, consume: Callable[[np.ndarray, List[Dict]], None]) -> int:
+        """
+        Hand the live vectors and their chunks, in id order, to consume(vectors, chunks)
+        and delete the store, all under its writer lock: a concurrent caller then finds
+        nothing to move. Returns the number of vectors moved.
+        """
+        with self.lock, self._file_lock(create=False) as locked:
+            if not locked or not self.exists(self.path):
+                return 0
+            self.refresh()
+            vectors, ids = self._all_vectors()
+            order = np.argsort(ids, kind='stable')
+            rows = self.chunks.get(ids.tolist())
+            live = [position for position in order if int(ids[position]) in rows]
+            if live:
+                consume(vectors[live], [rows[int(ids[position])] for position in live])
+            self.chunks.close()
+            self._chunks = None
+            shutil.rmtree(self.path, ignore_errors=True)
+        logger.info(f"Moved {len(live)} vectors out of vector store {self.path} and deleted it")
+        return len(live)
+
+    def memory_bytes(self) -> int:
+        """Rough resident size of the index; the lists of a mapped index count only as the OS pages them in."""
+        with self.lock:
+            if self.delta is None:
+                return ann_index.memory_bytes(self.index)
+            return ann_index.memory_bytes(self.index, mapped=True) + ann_index.memory_bytes(self.delta)
+
+
+def migrate_legacy_store(index_path: str, metadata_path: str, store_path: str, dimension: int) -> bool:
+    """
+    Convert a pre-WAL '<user>.faiss' + '<user>_metadata.pkl' pair into a store directory.
+    Returns True if legacy files were found and migrated.
+    """
+    if not os.path.exists(index_path) or not os.path.exists(metadata_path):
+        return False
+
+    store = UserVectorStore(store_path, dimension)
+    with store.lock, store._file_lock():
+        if UserVectorStore.exists(store_path):
+            return False
+        legacy_index = faiss.read_index(index_path)
+        store.dimension = legacy_index.d
+        vectors, ids = ann_index.reconstruct_all(legacy_index)
+        store.index = ann_index.build_index(ann_index.INDEX_FLAT, vectors, store.dimension, ids)
+        store.next_id = store.index.ntotal
+        with open(metadata_path, 'rb') as f:
+            store.chunks.add(0, pickle.load(f))
+        store._checkpoint()
+
+    os.remove(index_path)
+    os.remove(metadata_path)
+    logger.info(f"Migrated legacy vector DB {index_path} to {store_path}")
+    return True
@@ -156,6 +156,7 @@ const ChatInterface = () => {
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const abortControllerRef = useRef(null);
   const [stats, setStats] = useState(null);
   const [showStats, setShowStats] = useState(false);
   const [error, setError] = useState('');
@@ -191,6 +192,13 @@ const ChatInterface = () => {
     scrollToBottom();
   }, [messages, scrollToBottom]);
 
+  // Stop a streaming answer when leaving the chat
+  useEffect(() => () => {
+    if (abortControllerRef.current) {
+      abortControllerRef.current.abort();
+    }
+  }, []);
+
   const handleSendMessage = useCallback(async () => {
     if (!inputMessage.trim() || isLoading) return;
 
@@ -206,24 +214,39 @@ const ChatInterface = () => {
     setIsLoading(true);
     setError('');
 
-    try {
-      const response = await chatAPI.sendMessage(userMessage.content);
+    const botId = Date.now() + 1;
+    const controller = new AbortController();
+    abortControllerRef.current = controller;
 
-      const botMessage = {
-        id: Date.now() + 1,
-        type: 'bot',
-        content: response.answer,
-        sources: response.sources || [],
-        chunksFound: response.chunks_found || 0,
-        timestamp: new Date(),
-      };
-
-      setMessages(prev => [...prev, botMessage]);
+    try {
+      // The answer is shown as it is generated, below the sources found for it
+      await chatAPI.streamMessage(userMessage.content, {
+        signal: controller.signal,
+        onSources: ({ sources, chunks_found: chunksFound }) => {
+          const botMessage = {
+            id: botId,
+            type: 'bot',
+            content: '',
+            sources: sources || [],
+            chunksFound: chunksFound || 0,
+            timestamp: new Date(),
+          };
+          setMessages(prev => [...prev, botMessage]);
+        },
+        onToken: (text) => {
+          setMessages(prev => prev.map(message => (
+            message.id === botId ? { ...message, content: message.content + text } : message
+          )));
+        },
+      });
     } catch (error) {
+      if (error.name === 'AbortError') {
+        return;
+      }
       logger.error('Chat error:', error);
       const errorMsg = getErrorMessage(error, 'Failed to send message');
       const errorMessage = {
-        id: Date.now() + 1,
+        id: Date.now() + 2,
         type: 'bot',
         content: 'Sorry, I encountered an error while processing your question. Please try again.',
         isError: true,
@@ -325,7 +348,7 @@ const ChatInterface = () => {
             <MessageBubble key={message.id} message={message} theme={theme} />
           ))}
 
-          {isLoading && (
+          {isLoading && messages.length > 0 && messages[messages.length - 1].type === 'user' && (
             <Box sx={{ display: 'flex', justifyContent: 'flex-start', mb: 2 }}>
               <Card sx={{ backgroundColor: 'grey.100' }}>
                 <CardContent sx={{ p: 2, display: 'flex', alignItems: 'center' }}>
@@ -232,6 +232,64 @@ export const chatAPI = {
     return handleResponse(response);
   },
 
+  // Streams the answer as server-sent events: onSources({ sources, chunks_found }) first,
+  // then onToken(text) for each piece. Aborting signal stops the generation on the server.
+  streamMessage: async (query, { onSources, onToken, signal } = {}) => {
+    const response = await fetch(`${API_BASE_URL}/chat`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      credentials: 'include',
+      body: JSON.stringify({ query, stream: true }),
+      signal,
+    });
+
+    if (!response.ok) {
+      return handleResponse(response);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        return;
+      }
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach((line) => {
+          if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+          } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+          }
+        });
+        const payload = data ? JSON.parse(data) : {};
+
+        if (event === 'sources' && onSources) {
+          onSources(payload);
+        } else if (event === 'token' && onToken) {
+          onToken(payload.text);
+        } else if (event === 'error') {
+          throw new Error(payload.error || 'Failed to generate an answer');
+        } else if (event === 'done') {
+          return;
+        }
+      }
+    }
+  },
+
   getStats: async () => {
     const response = await fetch(`${API_BASE_URL}/chat/stats`, {
       method: 'GET',
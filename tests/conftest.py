@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings read at import time: an in-memory KV service, an offline embedder and a throwaway user registry
+os.environ.setdefault('STORAGE_TYPE', 'memory')
+os.environ.setdefault('EMBEDDING_PROVIDER', 'hashing')
+os.environ.setdefault('PIN_MONITOR_ENABLED', 'false')
+os.environ.setdefault('USER_REGISTRY_PATH', os.path.join(tempfile.mkdtemp(), 'users.sqlite'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rag_manager(tmp_path):
+    """A RAGManager with per-user stores under tmp_path, embedding with the hashing provider."""
+    from backend.embeddings import HashingEmbeddingProvider
+    from backend.rag_utils import RAGManager
+
+    return RAGManager(vector_db_path=str(tmp_path / "vector_db"), embedder=HashingEmbeddingProvider(64),
+                      chunk_size=200, chunk_overlap=20, shared_store=False)
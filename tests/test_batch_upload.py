@@ -0,0 +1,44 @@
+from io import BytesIO
+
+from werkzeug.datastructures import FileStorage
+
+from backend import batch_upload
+from backend.batch_upload import add_to_cluster_concurrently, iter_uploaded_files
+from backend.error import ErrorCode
+
+
+class TrackedStream(BytesIO):
+    def __init__(self, content, reads):
+        super().__init__(content)
+        self.reads = reads
+
+    def read(self, *args):
+        self.reads.append(self)
+        return super().read(*args)
+
+
+def test_batch_files_are_read_as_they_are_uploaded(monkeypatch):
+    reads, added = [], []
+
+    def add_file_to_cluster(stream, filename):
+        # Files are pulled at most 2 * max_workers ahead of the adds that finished
+        added.append(filename)
+        assert len(reads) <= len(added) + 2
+        return f"cid-{filename}"
+
+    monkeypatch.setattr(batch_upload, 'add_file_to_cluster', add_file_to_cluster)
+    files = [FileStorage(TrackedStream(b"x" * 10, reads), f"{i}.txt") for i in range(20)]
+    files.append(FileStorage(TrackedStream(b"x" * 100, reads), "big.txt"))
+
+    items = add_to_cluster_concurrently(iter_uploaded_files(files, [], max_file_size=50), max_workers=1)
+    assert [item.cid for item in items[:20]] == [f"cid-{i}.txt" for i in range(20)]
+    assert all(item.content == b"" for item in items)
+    assert items[20].status == ErrorCode.EXCEED_MAX_FILE_SIZE
+    assert len(reads) == 20
+
+
+def test_relative_paths_are_normalized():
+    files = [FileStorage(BytesIO(b"a"), "a.txt"), FileStorage(BytesIO(b"b"), "b.txt")]
+    items = list(iter_uploaded_files(files, ["src//lib/a.txt", "../b.txt"], max_file_size=50))
+    assert items[0].relative_path == "src/lib/a.txt" and items[0].content == b"a"
+    assert items[1].status == ErrorCode.INVALID_PATH
@@ -0,0 +1,18 @@
+import numpy as np
+
+from backend.embedding_cache import EmbeddingCache
+
+
+def test_embeddings_stay_bounded_without_counting_every_insert(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=1000)
+    counts = []
+    cache._connection().set_trace_callback(lambda sql: counts.append(sql) if "COUNT(*)" in sql else None)
+
+    for batch in range(200):
+        keys = [f"key-{batch}-{i}" for i in range(10)]
+        cache.put_many(keys, np.ones((10, 4), dtype=np.float32))
+
+    total = cache._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert 900 <= total <= 1000
+    assert len(counts) < 20
+    assert len(cache.get_many(["key-199-9", "key-0-0"], 4)) == 1
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from backend import rag_utils
+from backend.ingest_queue import JOB_CANCELLED, IngestQueue
+
+DOCUMENT = b"".join(f"Sentence {i} about apples, pears and plums. ".encode() for i in range(400))
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(rag_utils, 'RAG_STREAM_BATCH_CHUNKS', 4)
+
+
+def test_cancel_drops_queued_jobs(tmp_path):
+    queue = IngestQueue(lambda *args: True, str(tmp_path / "queue.sqlite"), workers=1)
+    queue.enqueue("alice", "cid-a", "a.txt", b"a", path="a.txt")
+    queue.enqueue("alice", "cid-b", "b.txt", b"b", path="b.txt")
+    queue.enqueue("bob", "cid-c", "c.txt", b"c", path="c.txt")
+
+    queue.cancel("alice", ["a.txt"])
+    assert queue.get_status("alice", "cid-a") is None
+    assert queue.get_status("alice", "cid-b")['status'] == 'queued'
+    queue.cancel("alice")
+    assert queue.get_status("alice", "cid-b") is None
+    assert queue.get_status("bob", "cid-c")['status'] == 'queued'
+
+
+def test_cancel_stops_job_in_flight(tmp_path):
+    started, cancelled = threading.Event(), threading.Event()
+    checkpoints, undone = [], []
+
+    def handler(username, cid, filename, content, path, checkpoint):
+        checkpoints.append(checkpoint())
+        started.set()
+        cancelled.wait(5)
+        checkpoints.append(checkpoint())
+        return True
+
+    queue = IngestQueue(handler, str(tmp_path / "queue.sqlite"), workers=1,
+                        on_cancelled=lambda *args: undone.append(args))
+    queue.enqueue("alice", "cid-a", "a.txt", b"a", path="a.txt")
+    worker = threading.Thread(target=queue.run_once)
+    worker.start()
+    assert started.wait(5)
+    queue.cancel("alice", ["a.txt"])
+    assert queue.get_status("alice", "cid-a")['status'] == JOB_CANCELLED
+    cancelled.set()
+    worker.join(5)
+
+    assert checkpoints == [True, False]
+    assert undone == [("alice", "cid-a", "a.txt")]
+    assert queue.get_status("alice", "cid-a") is None
+    assert not queue.run_once()
+
+
+def test_checkpoint_false_stops_indexing(rag_manager, small_batches):
+    calls = []
+
+    def checkpoint():
+        calls.append(True)
+        return len(calls) < 3
+
+    assert not rag_manager.process_file_for_rag(DOCUMENT, "a.txt", "alice", "cid-a", "a.txt", checkpoint=checkpoint)
+    indexed = rag_manager.get_user_stats("alice")['total_chunks']
+    assert 0 < indexed < len(rag_manager.text_splitter.split_text(DOCUMENT.decode()))
+
+
+def test_deleted_file_is_not_indexed_by_a_running_job(rag_manager, small_batches):
+    """A file deleted while a batch of it is being embedded gets no chunks from that batch."""
+    deleted = threading.Event()
+    embed = rag_manager.generate_embeddings
+    batches = []
+
+    def embed_and_delete(texts):
+        batches.append(texts)
+        if len(batches) == 2:
+            # The user deletes the file (and cancels its job) while the second batch is embedded
+            deleted.set()
+            rag_manager.delete_file_vectors("alice", ["a.txt"])
+        return embed(texts)
+
+    rag_manager.generate_embeddings = embed_and_delete
+    assert not rag_manager.process_file_for_rag(DOCUMENT, "a.txt", "alice", "cid-a", "a.txt",
+                                                checkpoint=lambda: not deleted.is_set())
+    assert len(batches) == 2
+    assert rag_manager.get_user_stats("alice")['total_chunks'] == 0
+
+
+def test_delete_user_store_removes_everything(rag_manager):
+    assert rag_manager.process_file_for_rag(DOCUMENT, "a.txt", "alice", "cid-a", "a.txt")
+    assert rag_manager.search_user_vector_db("alice", "apples")
+    rag_manager.delete_user_store("alice")
+    assert rag_manager.get_user_stats("alice")['total_chunks'] == 0
+    assert rag_manager.search_user_vector_db("alice", "apples") == []
@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+
+from backend import pin_monitor
+from backend.RSDB_kv_service import get_kv, set_kv
+from backend.file import File
+from backend.node import Node
+from backend.pin_monitor import PIN_STATUS_PINNED, PIN_STATUS_STALLED, PinMonitor
+
+
+class FakeCluster:
+    def __init__(self, status):
+        self.status = status
+        self.pins = []
+
+    def get_statuses(self, cids):
+        return {cid: {'peer_map': {'peer1': {'status': self.status}}} for cid in cids}
+
+    def pin(self, cid, recover=False):
+        self.pins.append(cid)
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    cluster = FakeCluster('pinning')
+    monkeypatch.setattr(pin_monitor, 'get_ipfs_client', lambda: cluster)
+    return cluster
+
+
+def upload(username, cid):
+    root = Node("root", True)
+    root.add_child(Node(f"{cid}.bin", False, File(cid, 5, f"{cid}.bin", pin_status='pinning')))
+    set_kv(username + " ROOT", root.to_json())
+
+
+def pin_status(username, cid):
+    children = json.loads(get_kv(username + " ROOT"))['children']
+    return children[f"{cid}.bin"]['file_obj']['pin_status']
+
+
+def test_tracked_pins_outlive_the_process(tmp_path, cluster):
+    db_path = str(tmp_path / "pins.sqlite")
+    upload("pinalice", "cid-a")
+    PinMonitor(db_path=db_path).track("pinalice", "cid-a")
+
+    restarted = PinMonitor(db_path=db_path)
+    restarted.poll_once()
+    assert restarted.tracked_count() == 1
+    cluster.status = 'pinned'
+    restarted.poll_once()
+    assert restarted.tracked_count() == 0
+    assert pin_status("pinalice", "cid-a") == PIN_STATUS_PINNED
+
+
+def test_pin_still_pinning_after_ttl_is_recorded_stalled(tmp_path, cluster, monkeypatch):
+    monitor = PinMonitor(db_path=str(tmp_path / "pins.sqlite"))
+    upload("pinbob", "cid-b")
+    monitor.track("pinbob", "cid-b")
+    monitor.poll_once()
+    assert monitor.tracked_count() == 1
+
+    monkeypatch.setattr(pin_monitor, 'TRACK_TTL', -1)
+    monitor.poll_once()
+    assert monitor.tracked_count() == 0
+    assert pin_status("pinbob", "cid-b") == PIN_STATUS_STALLED
+
+
+def test_only_one_monitor_polls(tmp_path, cluster):
+    db_path = str(tmp_path / "pins.sqlite")
+    first, second = PinMonitor(db_path=db_path, poll_interval=0.05), PinMonitor(db_path=db_path, poll_interval=0.05)
+    first.start()
+    deadline = time.monotonic() + 5
+    while not first.leader and time.monotonic() < deadline:
+        time.sleep(0.01)
+    second.start()
+    time.sleep(0.2)
+    assert first.leader and not second.leader
+
+    first.stop()
+    first._thread.join(5)
+    deadline = time.monotonic() + 5
+    while not second.leader and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert second.leader
+    second.stop()
@@ -0,0 +1,77 @@
+import pytest
+
+from backend.embeddings import HashingEmbeddingProvider
+from backend.rag_utils import RAGManager
+from backend.share_manager import ShareManager
+
+FILES = {
+    "alice": {
+        "docs/report.txt": "Quarterly report: revenue from apples grew in the north orchard.",
+        "docs/plan/roadmap.txt": "Roadmap: plant more apple trees and hire pickers.",
+        "docs2/leak.txt": "Secret merger plans with the pear cooperative, apples included.",
+        "private/diary.txt": "Dear diary, the apple harvest was secretly sold to a rival.",
+        "notes.txt": "Meeting notes about apple pricing and orchard budgets.",
+    },
+    "carol": {
+        "recipes/pie.txt": "Apple pie recipe: apples, butter, flour and sugar.",
+    },
+    "bob": {
+        "own.txt": "Bob's own notes on apple storage temperatures.",
+    },
+}
+QUERIES = ["apples", "apple harvest secretly sold", "merger plans pear cooperative", "diary",
+           "leak.txt", "orchard budgets", "apple pie recipe"]
+
+
+@pytest.fixture(params=[False, True], ids=["per-user", "shared"])
+def manager(request, tmp_path):
+    manager = RAGManager(vector_db_path=str(tmp_path / "vector_db"), embedder=HashingEmbeddingProvider(64),
+                         chunk_size=200, chunk_overlap=20, shared_store=request.param)
+    for username, files in FILES.items():
+        for number, (path, text) in enumerate(files.items()):
+            filename = path.rsplit("/", 1)[-1]
+            assert manager.process_file_for_rag(text.encode(), filename, username, f"cid-{username}-{number}", path)
+    return manager
+
+
+def sources(results):
+    return {(result['owner'], result['chunk']['metadata']['path']) for result in results}
+
+
+def test_search_sees_only_shared_paths(manager):
+    shares = ShareManager()
+    shares.receive("alice", "root/docs", True)
+    shares.receive("alice", "root/notes.txt", False)
+    allowed = {("alice", "docs/report.txt"), ("alice", "docs/plan/roadmap.txt"), ("alice", "notes.txt"),
+               ("bob", "own.txt")}
+
+    seen = set()
+    for query in QUERIES:
+        found = sources(manager.search_accessible_vector_dbs("bob", query, top_k=10, share_manager=shares))
+        assert found <= allowed, query
+        seen |= found
+    assert seen == allowed
+
+
+def test_search_without_shares_sees_only_own_files(manager):
+    for query in QUERIES:
+        found = sources(manager.search_accessible_vector_dbs("bob", query, top_k=10, share_manager=ShareManager()))
+        assert found <= {("bob", "own.txt")}, query
+
+
+def test_revoked_share_is_not_served_from_cache(manager):
+    shares = ShareManager()
+    shares.receive("carol", "root/recipes", True)
+    assert ("carol", "recipes/pie.txt") in sources(
+        manager.search_accessible_vector_dbs("bob", "apple pie recipe", top_k=10, share_manager=shares))
+
+    revoked = ShareManager()
+    assert ("carol", "recipes/pie.txt") not in sources(
+        manager.search_accessible_vector_dbs("bob", "apple pie recipe", top_k=10, share_manager=revoked))
+
+
+def test_owner_sees_all_their_files(manager):
+    seen = set()
+    for query in QUERIES:
+        seen |= sources(manager.search_accessible_vector_dbs("alice", query, top_k=10))
+    assert seen == {("alice", path) for path in FILES["alice"]}
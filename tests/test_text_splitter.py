@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from backend.ingest_pipeline import iter_chunks
+from backend.text_splitter import RecursiveTextSplitter
+
+WORDS = ["storage", "network", "a", "IPFS", "replica", "x", "pinning", "folder", "share", "supercalifragilistic"]
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+def random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randrange(0, 120)):
+        kind = rng.random()
+        if kind < 0.05:
+            parts.append("\n\n")
+        elif kind < 0.12:
+            parts.append("\n")
+        elif kind < 0.2:
+            parts.append(". ")
+        elif kind < 0.25:
+            parts.append("y" * rng.randrange(20, 90))  # longer than a chunk, split by character
+        elif kind < 0.3:
+            parts.append(rng.choice(["  ", " \n", "\n \n", "\t"]))
+        else:
+            parts.append(rng.choice(WORDS) + " ")
+    return "".join(parts)
+
+
+def cases(count: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        chunk_size = rng.randrange(5, 80)
+        yield random_text(rng), chunk_size, rng.randrange(0, chunk_size // 2 + 1)
+
+
+def test_matches_langchain():
+    text_splitters = pytest.importorskip("langchain_text_splitters")
+    for text, chunk_size, chunk_overlap in cases(3000, seed=43):
+        reference = text_splitters.RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=SEPARATORS)
+        ours = RecursiveTextSplitter(chunk_size, chunk_overlap, SEPARATORS)
+        assert ours.split_text(text) == reference.split_text(text), (text, chunk_size, chunk_overlap)
+
+
+def test_stream_matches_whole_text():
+    rng = random.Random(42)
+    for text, chunk_size, chunk_overlap in cases(3000, seed=42):
+        splitter = RecursiveTextSplitter(chunk_size, chunk_overlap, SEPARATORS)
+        cuts = sorted(rng.randrange(len(text) + 1) for _ in range(rng.randrange(0, 8)))
+        pieces = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+        assert list(splitter.split_stream(pieces)) == splitter.split_text(text), (pieces, chunk_size, chunk_overlap)
+
+
+def test_iter_chunks_joins_segments_with_newlines():
+    splitter = RecursiveTextSplitter(40, 10, SEPARATORS)
+    segments = ["Page one talks about storage.", "Page two talks about the network.", "", "Page four."]
+    assert list(iter_chunks(segments, splitter)) == splitter.split_text("\n".join(segments))
+
+
+def test_overlap_larger_than_chunk_is_rejected():
+    with pytest.raises(ValueError):
+        RecursiveTextSplitter(chunk_size=10, chunk_overlap=20)
@@ -0,0 +1,33 @@
+import multiprocessing
+
+from backend import user_authentication_service
+from backend.user_authentication_service import list_users, set_user_registered
+
+
+def register_all(usernames):
+    for username in usernames:
+        set_user_registered(username)
+
+
+def test_concurrent_registrations_are_all_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_authentication_service, 'USER_REGISTRY_PATH', str(tmp_path / "users.sqlite"))
+    batches = [[f"user{worker}x{i}" for i in range(25)] for worker in range(4)]
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=register_all, args=(batch,)) for batch in batches]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    assert list_users() == sorted(username for batch in batches for username in batch)
+
+
+def test_registration_is_idempotent_and_revocable(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_authentication_service, 'USER_REGISTRY_PATH', str(tmp_path / "users.sqlite"))
+    set_user_registered("alice")
+    set_user_registered("alice")
+    set_user_registered("bob")
+    assert list_users() == ["alice", "bob"]
+    set_user_registered("alice", registered=False)
+    assert list_users() == ["bob"]
@@ -0,0 +1,32 @@
+import threading
+import time
+
+from backend.vector_cache import VectorIndexCache
+
+
+def test_concurrent_misses_share_one_load():
+    cache = VectorIndexCache(max_bytes=1000)
+    loads = []
+
+    def loader():
+        loads.append(True)
+        time.sleep(0.1)
+        return "index", 10
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("alice", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["index"] * 8
+    assert len(loads) == 1
+
+
+def test_many_keys_do_not_grow_the_lock_pool():
+    cache = VectorIndexCache(max_bytes=100)
+    locks = list(cache._load_locks)
+    for number in range(1000):
+        assert cache.get(f"user{number}", lambda: (number, 10)) == number
+    assert cache._load_locks == locks
+    assert cache.stats()['entries'] == 10
@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from backend.vector_store import WAL_HEADER, UserVectorStore, migrate_legacy_store
+
+DIMENSION = 8
+
+
+def vectors(count, seed):
+    rng = np.random.default_rng(seed)
+    found = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    return found / np.linalg.norm(found, axis=1, keepdims=True)
+
+
+def chunks(name, count):
+    return [{'text': f"{name} chunk {i}", 'metadata': {'filename': name, 'cid': f"cid-{name}", 'path': name,
+                                                      'chunk_index': i}} for i in range(count)]
+
+
+def wal_path(store):
+    return os.path.join(store.path, f"wal-{store.generation}.log")
+
+
+def test_reopen_replays_wal(tmp_path):
+    path = str(tmp_path / "alice")
+    store = UserVectorStore(path, DIMENSION)
+    first, second = vectors(3, 1), vectors(2, 2)
+    store.append(first, chunks("a.txt", 3))
+    store.append(second, chunks("b.txt", 2))
+    assert store.wal_records == 2 and store.generation == 0
+
+    reopened = UserVectorStore.open(path, DIMENSION)
+    assert reopened.ntotal == 5
+    score, chunk = reopened.search(second[1:2], 1)[0]
+    assert chunk['text'] == "b.txt chunk 1" and score > 0.99
+
+
+def test_torn_wal_tail_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / "alice")
+    store = UserVectorStore(path, DIMENSION)
+    store.append(vectors(3, 1), chunks("a.txt", 3))
+    intact = os.path.getsize(wal_path(store))
+    store.append(vectors(2, 2), chunks("b.txt", 2))
+    # A crash in the middle of writing the second record
+    with open(wal_path(store), 'r+b') as f:
+        f.truncate(intact + WAL_HEADER.size + 10)
+
+    reopened = UserVectorStore.open(path, DIMENSION)
+    assert reopened.ntotal == 3
+    assert reopened.wal_offset == intact
+    # Rows of the torn record have no vector and are dropped
+    assert reopened.chunks.file_counts() == {'a.txt': 3}
+
+    third = vectors(1, 3)
+    reopened.append(third, chunks("c.txt", 1))
+    assert os.path.getsize(wal_path(reopened)) == reopened.wal_offset
+    again = UserVectorStore.open(path, DIMENSION)
+    assert again.ntotal == 4
+    assert again.search(third, 1)[0][1]['text'] == "c.txt chunk 0"
+
+
+def test_corrupt_wal_record_stops_replay(tmp_path):
+    path = str(tmp_path / "alice")
+    store = UserVectorStore(path, DIMENSION)
+    store.append(vectors(3, 1), chunks("a.txt", 3))
+    intact = os.path.getsize(wal_path(store))
+    store.append(vectors(2, 2), chunks("b.txt", 2))
+    with open(wal_path(store), 'r+b') as f:
+        f.seek(intact + WAL_HEADER.size)
+        f.write(b'\xff' * 4)
+
+    reopened = UserVectorStore.open(path, DIMENSION)
+    assert reopened.ntotal == 3
+    assert reopened.chunks.file_counts() == {'a.txt': 3}
+
+
+def test_checkpoint_survives_reopen(tmp_path):
+    path = str(tmp_path / "alice")
+    store = UserVectorStore(path, DIMENSION)
+    store.append(vectors(3, 1), chunks("a.txt", 3))
+    store.compact()
+    store.append(vectors(2, 2), chunks("b.txt", 2))
+    assert store.generation == 1 and store.wal_records == 1
+
+    reopened = UserVectorStore.open(path, DIMENSION)
+    assert reopened.ntotal == 5
+    assert not os.path.exists(os.path.join(path, "index-0.faiss"))
+    assert not os.path.exists(os.path.join(path, "wal-0.log"))
+
+
+def test_deleted_chunks_are_hidden_and_dropped_by_rebuild(tmp_path):
+    path = str(tmp_path / "alice")
+    store = UserVectorStore(path, DIMENSION)
+    first = vectors(3, 1)
+    store.append(first, chunks("a.txt", 3))
+    store.append(vectors(2, 2), chunks("b.txt", 2))
+
+    assert store.delete(paths=["a.txt"]) == 3
+    assert all(chunk['metadata']['filename'] == "b.txt" for _, chunk in store.search(first[:1], 5))
+    store.rebuild()
+    assert store.ntotal == 2
+    assert UserVectorStore.open(path, DIMENSION).ntotal == 2
+
+
+def test_migrates_baseline_files(tmp_path):
+    import pickle
+
+    import faiss
+
+    index = faiss.IndexFlatIP(DIMENSION)
+    legacy = vectors(2, 1)
+    index.add(legacy)
+    index_path, metadata_path = str(tmp_path / "alice.faiss"), str(tmp_path / "alice_metadata.pkl")
+    faiss.write_index(index, index_path)
+    with open(metadata_path, 'wb') as f:
+        pickle.dump([{'text': f"old {i}", 'metadata': {'filename': "a.txt", 'cid': "cid-a"}} for i in range(2)], f)
+
+    path = str(tmp_path / "alice")
+    assert migrate_legacy_store(index_path, metadata_path, path, DIMENSION)
+    assert not os.path.exists(index_path) and not os.path.exists(metadata_path)
+    store = UserVectorStore.open(path, DIMENSION)
+    assert store.search(legacy[1:2], 1)[0][1]['text'] == "old 1"
+    assert store.delete(cids=["cid-a"]) == 2
+
+
+def test_chunk_store_close_closes_every_thread_connection(tmp_path):
+    store = UserVectorStore(str(tmp_path / "alice"), DIMENSION)
+    store.append(vectors(4, 7), chunks("a.txt", 4))
+    opened = []
+
+    def read():
+        assert store.chunks.count() == 4
+        opened.append(store.chunks._connection())
+
+    workers = [threading.Thread(target=read) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(5)
+    opened.append(store.chunks._connection())
+
+    store.chunks.close()
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    assert store.chunks.count() == 4